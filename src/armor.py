@@ -1,14 +1,59 @@
 # functions to parse the profile data and create the Dict of Armor the user has on all characters and in the vault
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
+import heapq
+import json
+import os
 import random
+import zlib
 
-from itertools import product
+from itertools import count, product
 from collections import defaultdict
 
+import numpy as np
 import polars as pl
 from polars import col
 from itertools import combinations
 
+from src.outfit_engine import (
+    ARTIFICE_STAT_BONUS,
+    COMPACT_MAX_ARMOR_ROWS,
+    COMPACT_OUTFIT_SCHEMA,
+    COMPACT_WEIGHTED_DTYPE,
+    DEFAULT_OUTFIT_BATCH_SIZE,
+    LIST_OUTFIT_ROW_BYTES,
+    MAX_ARTIFICE,
+    PINNACLE_BASE_BYTES,
+    ArtificeTierTable,
+    OUTFIT_COLUMNS,
+    OUTFIT_SCHEMA,
+    SLOT_COLUMNS,
+    STAT_NAMES,
+    SlotMatrix,
+    artifice_combination_counts,
+    combine_slot_matrices,
+    empty_outfits_df,
+    enumerate_outfit_column_chunks,
+    enumerate_outfit_columns,
+    enumerate_outfit_columns_parallel,
+    estimate_outfit_rows,
+    estimate_pinnacle_bytes,
+    expand_equivalent_outfits,
+    format_bytes,
+    is_compact_outfits_df,
+    outfit_column_batches,
+    outfit_row_bytes,
+    outfit_columns_to_df,
+    pinnacle_row_bytes,
+    restore_instance_ids,
+    round_to_useful_tiers,
+    rows_per_exotic,
+    sampled_pinnacle_rows,
+    scheme_pinnacle_rows,
+    weighting_schemes,
+)
+from src.outfit_cache import fingerprint
+from src.instrumentation import NO_INSTRUMENTATION
+
 random.seed(42)
 
 
@@ -16,6 +61,12 @@ def random_64_int():
     return random.randint(0, 9223372036854775807)
 
 
+# exotic class items all share an item hash, outfits tell them apart by their random perks with this hash instead
+# it is negative so it can't be mistaken for an item hash or ProfileOutfits.NO_EXOTIC_HASH, and stable between runs
+def exotic_perk_pair_hash(item_hash, random_exotic_perks):
+    return -2 - zlib.crc32(f"{item_hash}:{'/'.join(random_exotic_perks)}".encode())
+
+
 # the stats on the armor are the base values, they do not include masterworking or other mods
 @dataclass
 class Armor:
@@ -40,6 +91,20 @@ class Armor:
     def is_exotic(self):
         return self.rarity == "Exotic"
 
+    # the hash outfits use for this exotic, armor with random exotic perks is a different exotic for every perk pair
+    @property
+    def exotic_hash(self):
+        if self.random_exotic_perks:
+            return exotic_perk_pair_hash(self.item_hash, self.random_exotic_perks)
+        return self.item_hash
+
+    # the name of the exotic for `exotic_hash`, ex: "Solipsism (Spirit of Inmost Light + Spirit of the Star-Eater)"
+    @property
+    def exotic_name(self):
+        if self.random_exotic_perks:
+            return f"{self.item_name} ({' + '.join(self.random_exotic_perks)})"
+        return self.item_name
+
     @property
     def total_stats(self):
         return (
@@ -59,6 +124,130 @@ class Armor:
         return hash(self.instance_id)
 
 
+# struct-of-arrays version of a collection of Armor, every attribute is a numpy array with one row per armor piece
+# `stats` is an (n, 6) int64 array in STAT_NAMES order, so stats can be sliced and compared for all armor at once
+# instead of looking up attributes on thousands of Armor objects.  `armor(row)` and `to_armor_dict()` give Armor views
+@dataclass(eq=False)
+class ArmorTable:
+    instance_ids: np.ndarray
+    item_hashes: np.ndarray
+    exotic_hashes: np.ndarray
+    item_names: np.ndarray
+    rarities: np.ndarray
+    slots: np.ndarray
+    d2_classes: np.ndarray
+    power: np.ndarray
+    stats: np.ndarray
+    is_artifice: np.ndarray
+    is_masterworked: np.ndarray
+    ignored: np.ndarray
+    random_exotic_perks: np.ndarray
+    _row_by_instance_id: dict = field(default=None, init=False, repr=False)
+
+    @classmethod
+    def from_armor_list(cls, armor_list):
+        random_exotic_perks = np.empty(len(armor_list), dtype=object)
+        random_exotic_perks[:] = [armor.random_exotic_perks for armor in armor_list]
+        return cls(
+            instance_ids=np.array(
+                [armor.instance_id for armor in armor_list], dtype=np.int64
+            ),
+            item_hashes=np.array(
+                [armor.item_hash for armor in armor_list], dtype=np.int64
+            ),
+            exotic_hashes=np.array(
+                [armor.exotic_hash for armor in armor_list], dtype=np.int64
+            ),
+            item_names=np.array(
+                [armor.item_name for armor in armor_list], dtype=object
+            ),
+            rarities=np.array([armor.rarity for armor in armor_list], dtype=str),
+            slots=np.array([armor.slot for armor in armor_list], dtype=str),
+            d2_classes=np.array([armor.d2_class for armor in armor_list], dtype=str),
+            power=np.array([armor.power for armor in armor_list], dtype=np.int64),
+            stats=np.array(
+                [[getattr(armor, stat) for stat in STAT_NAMES] for armor in armor_list],
+                dtype=np.int64,
+            ).reshape(-1, len(STAT_NAMES)),
+            is_artifice=np.array(
+                [armor.is_artifice for armor in armor_list], dtype=bool
+            ),
+            is_masterworked=np.array(
+                [armor.is_masterworked for armor in armor_list], dtype=bool
+            ),
+            # `ignored` isn't an Armor field, it is set on the armor by the notebook
+            ignored=np.array(
+                [getattr(armor, "ignored", False) for armor in armor_list], dtype=bool
+            ),
+            random_exotic_perks=random_exotic_perks,
+        )
+
+    @classmethod
+    def from_armor_dict(cls, armor_dict):
+        return cls.from_armor_list(list(armor_dict.values()))
+
+    def __len__(self):
+        return len(self.instance_ids)
+
+    @property
+    def is_exotic(self):
+        return self.rarities == "Exotic"
+
+    @property
+    def total_stats(self):
+        return self.stats.sum(axis=1)
+
+    # the column of a single stat, ex: `armor_table.stat("mobility")`
+    def stat(self, stat_name):
+        return self.stats[:, STAT_NAMES.index(stat_name)]
+
+    # the row of each instance id, raises KeyError for armor that isn't in the table
+    def rows(self, instance_ids):
+        if self._row_by_instance_id is None:
+            self._row_by_instance_id = {
+                instance_id: row
+                for row, instance_id in enumerate(self.instance_ids.tolist())
+            }
+        return np.array(
+            [self._row_by_instance_id[instance_id] for instance_id in instance_ids],
+            dtype=np.int64,
+        )
+
+    # a new table with only the given rows, `rows` can be row indices or a boolean mask
+    def select(self, rows):
+        return ArmorTable(
+            **{
+                table_field.name: getattr(self, table_field.name)[rows]
+                for table_field in fields(self)
+                if table_field.init
+            }
+        )
+
+    # an Armor view of a row
+    def armor(self, row):
+        armor = Armor(
+            item_name=self.item_names[row],
+            item_hash=int(self.item_hashes[row]),
+            instance_id=int(self.instance_ids[row]),
+            rarity=str(self.rarities[row]),
+            slot=str(self.slots[row]),
+            power=int(self.power[row]),
+            **{stat: int(value) for stat, value in zip(STAT_NAMES, self.stats[row])},
+            is_artifice=bool(self.is_artifice[row]),
+            is_masterworked=bool(self.is_masterworked[row]),
+            d2_class=str(self.d2_classes[row]),
+            random_exotic_perks=self.random_exotic_perks[row],
+        )
+        armor.ignored = bool(self.ignored[row])
+        return armor
+
+    def to_armor_list(self):
+        return [self.armor(row) for row in range(len(self))]
+
+    def to_armor_dict(self):
+        return {armor.instance_id: armor for armor in self.to_armor_list()}
+
+
 class ProfileArmor:
     # hard coding some magic numbers, these are in DestinyStatDefinition.json
     MOBILITY_ID = "2996146975"
@@ -72,10 +261,14 @@ class ProfileArmor:
 
     ARMOR_ITEM_TYPE = 2
 
-    def __init__(self, profile, item_definitions, stat_definitions):
+    # `instrumentation` is an Instrumentation that records the stages below, see src/instrumentation.py
+    def __init__(
+        self, profile, item_definitions, stat_definitions, instrumentation=None
+    ):
         self.profile = profile
         self.item_definitions = item_definitions
         self.stat_definitions = stat_definitions
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
 
     # spin through the profile data and find all inventory items on the character and in character equipment
     # example for item instance: {'itemHash': 2244604734, 'itemInstanceId': '6917529860806551003', 'quantity': 1, 'bindStatus': 0, 'location': 2, 'bucketHash': 138197802, 'transferStatus': 0, 'lockable': True, 'state': 5, 'dismantlePermission': 2, 'isWrapper': False, 'tooltipNotificationIndexes': [], 'versionNumber': 0 }
@@ -130,17 +323,32 @@ class ProfileArmor:
 
     # expects the output of `get_all_inventory_items` and returns a list of all armor items
     def get_armor_dict(self, all_items=None):
-        if all_items is None:
-            all_items = self.get_all_inventory_items()
-
-        armor_items = {}
+        with self.instrumentation.stage("get_armor_dict"):
+            if all_items is None:
+                all_items = self.get_all_inventory_items()
+
+            armor_items = {}
+
+            for item in all_items.values():
+                armor = self.convert_to_armor(item)
+                if armor is not None:
+                    armor_items[armor.instance_id] = armor
+
+            if self.instrumentation.enabled:
+                pieces_per_class_slot = defaultdict(int)
+                for armor in armor_items.values():
+                    pieces_per_class_slot[armor.class_slot] += 1
+                self.instrumentation.count(
+                    items=len(all_items),
+                    armor=len(armor_items),
+                    pieces_per_class_slot=dict(pieces_per_class_slot),
+                )
 
-        for item in all_items.values():
-            armor = self.convert_to_armor(item)
-            if armor is not None:
-                armor_items[armor.instance_id] = armor
+            return armor_items
 
-        return armor_items
+    # array-backed version of `get_armor_dict`
+    def get_armor_table(self, all_items=None):
+        return ArmorTable.from_armor_dict(self.get_armor_dict(all_items))
 
     # given an item from `get_all_inventory_items` turn it into an Armor object joined with information from other manifests
     # yeah... this is a mess.  if there is a better way to do this, I'd love to hear it
@@ -306,17 +514,133 @@ class ProfileArmor:
             return armor
 
 
+# a piece of armor that was removed before outfit enumeration because another piece of the same slot and rarity
+# is never a tier lower than it in any outfit, so it can at best tie an outfit built with `dominated_by`
+# `is_tie` pieces have the same tiers and artifice-ness as `dominated_by` in every outfit, so they tie every outfit
+@dataclass
+class PrunedArmor:
+    armor: Armor
+    dominated_by: Armor
+    reason: str
+    is_tie: bool = False
+
+    def __str__(self):
+        return f"id:{self.armor.instance_id} -- {self.armor.item_name} -- {self.armor.slot} -- {self.reason}"
+
+
+# how `ProfileOutfits.class_pinnacle_outfits` builds the pinnacle outfits of a class, picked before any outfit is
+# enumerated.  `estimate` is from `estimate_class_outfits`, `estimated_bytes` the estimated peak memory of each of
+# ProfileOutfits' strategies and `strategy` the first of them that fits in `memory_budget`
+@dataclass
+class OutfitPlan:
+    d2_class: str
+    strategy: str
+    estimate: dict
+    estimated_bytes: dict
+    memory_budget: int = None
+    batch_size: int = DEFAULT_OUTFIT_BATCH_SIZE
+
+    # the streaming strategies keep the pinnacle outfits, which are only a lower bound unless the estimate sampled every
+    # armor combination, so their estimated bytes are a lower bound as well
+    @property
+    def is_lower_bound(self):
+        return (
+            self.strategy != ProfileOutfits.IN_MEMORY
+            and not self.estimate["pinnacle_outfits_exact"]
+        )
+
+    def __str__(self):
+        budget = (
+            "no memory budget"
+            if self.memory_budget is None
+            else f"a memory budget of {format_bytes(self.memory_budget)}"
+        )
+        needs = "at least about" if self.is_lower_bound else "about"
+        return (
+            f"{self.d2_class}: about {self.estimate['estimated_outfits']:,} outfits, "
+            f"{self.strategy} needs {needs} {format_bytes(self.estimated_bytes[self.strategy])} with {budget}"
+        )
+
+
 class ProfileOutfits:
     # masterworking helmet, gauntlets, chest armor, leg armor, and class item gives a +10 bonus to each stat in an outfit
     FULL_MASTERWORK_STAT_BONUS = 10
 
     NO_EXOTIC_HASH = -1
 
-    def __init__(self, armor_dict):
-        self.armor_dict = armor_dict
+    # each artifice armor piece gives a +3 bonus to one stat, and an outfit can have at most 5 artifice pieces
+    ARTIFICE_STAT_BONUS = ARTIFICE_STAT_BONUS
+    MAX_ARTIFICE = MAX_ARTIFICE
+
+    # T10 is the highest tier, stats above 100 aren't useful
+    MAX_USEFUL_STAT = 100
+
+    # a full tier is 10 points, half tiers can be useful as there are 5 point mods, a value of 5 would round down to
+    # the nearest 5.  Rounding to full tiers and ignoring half tiers is the default, `tier_size` picks either
+    FULL_TIER_SIZE = 10
+    HALF_TIER_SIZE = 5
+    USEFUL_TIER_SIZE = FULL_TIER_SIZE
+
+    # the ways `class_pinnacle_outfits` can build pinnacle outfits, from the fastest to the one needing the least memory
+    # every outfit at once, PinnacleOutfits.from_batches or PinnacleOutfits.from_two_passes
+    IN_MEMORY = "in_memory"
+    BATCHES = "batches"
+    TWO_PASSES = "two_passes"
+    STRATEGIES = (IN_MEMORY, BATCHES, TWO_PASSES)
+
+    # `prune_dominated_armor` removes armor that is never needed for a pinnacle outfit before enumerating outfits
+    # what was pruned and why is kept in `pruned_armor`, keyed by class.  Pruned pieces that tie the piece they were
+    # pruned for in every outfit are added to `equivalent_armor`, so they are still in its pinnacle outfits.  Every
+    # other pruned piece is absent from the pinnacle outfits and the report, even from outfits where it would have tied,
+    # and the report's unique stat combinations don't count it
+    # `collapse_equivalent_armor` enumerates outfits over one representative of each group of interchangeable armor,
+    # `equivalent_armor` maps each representative's instance_id to the instance_ids of its whole group
+    # `compact_outfits` generates outfit tables with COMPACT_OUTFIT_SCHEMA, about a quarter of the memory per row.
+    # Their slot columns are rows of `armor_table`, `restore_instance_ids` turns them back into instance ids.  Raises a
+    # ValueError when there is more armor than those columns can number, COMPACT_MAX_ARMOR_ROWS
+    # `tier_size` is FULL_TIER_SIZE or HALF_TIER_SIZE, half tiers make more outfits, see `estimate_class_outfits`
+    # `instrumentation` is an Instrumentation that records the outfit generation stages, see src/instrumentation.py
+    # `memory_budget` is the most bytes building outfits should take, `generate_class_outfits` and
+    # `generate_class_outfits_df` fail before enumerating anything when they'd need more and `class_pinnacle_outfits`
+    # picks a strategy that fits.  None doesn't check
+    def __init__(
+        self,
+        armor_dict,
+        prune_dominated_armor=False,
+        collapse_equivalent_armor=False,
+        compact_outfits=False,
+        tier_size=USEFUL_TIER_SIZE,
+        instrumentation=None,
+        memory_budget=None,
+    ):
+        # `armor_dict` can also be an ArmorTable, the outfit math runs on the table and the dict holds the Armor views
+        if isinstance(armor_dict, ArmorTable):
+            self.armor_table = armor_dict
+            self.armor_dict = armor_dict.to_armor_dict()
+        else:
+            self.armor_table = ArmorTable.from_armor_dict(armor_dict)
+            self.armor_dict = armor_dict
+        self.prune_dominated_armor = prune_dominated_armor
+        self.pruned_armor = {}
+        self.collapse_equivalent_armor = collapse_equivalent_armor
+        self.equivalent_armor = {}
+        self.outfit_plans = {}
+        if compact_outfits and len(self.armor_table) > COMPACT_MAX_ARMOR_ROWS:
+            raise ValueError(
+                f"compact_outfits can only number {COMPACT_MAX_ARMOR_ROWS} pieces of armor in their UInt16 slot "
+                f"columns, not {len(self.armor_table)}"
+            )
+        self.compact_outfits = compact_outfits
+        self.outfit_schema = COMPACT_OUTFIT_SCHEMA if compact_outfits else OUTFIT_SCHEMA
         self.artifice_permutations = {
             i: self.generate_artifice_permutations(i) for i in range(6)
         }
+        self.tier_size = tier_size
+        self.artifice_tier_table = ArtificeTierTable(
+            self.tier_size, self.MAX_USEFUL_STAT
+        )
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+        self.memory_budget = memory_budget
 
     # we want to generate outfits for a given class
     # The high-level algorithm is:
@@ -332,14 +656,18 @@ class ProfileOutfits:
     ):
         exotic_armor = defaultdict(list)
         non_exotic_armor = defaultdict(list)
-        for armor in self.armor_dict.values():
-            if armor.d2_class == d2_class and armor.slot in slots:
-                if armor.is_exotic:
-                    if include_ignored_armor or not armor.ignored:
-                        exotic_armor[armor.slot].append(armor)
-                else:
-                    if include_ignored_armor or not armor.ignored:
-                        non_exotic_armor[armor.slot].append(armor)
+        armor_table = self.armor_table
+        class_armor = (armor_table.d2_classes == d2_class) & np.isin(
+            armor_table.slots, slots
+        )
+        if not include_ignored_armor:
+            class_armor &= ~armor_table.ignored
+        for row in np.flatnonzero(class_armor):
+            armor = self.armor_dict[int(armor_table.instance_ids[row])]
+            if armor_table.is_exotic[row]:
+                exotic_armor[armor.slot].append(armor)
+            else:
+                non_exotic_armor[armor.slot].append(armor)
 
         if "Class Item" in non_exotic_armor:
             # class items all have the same stats, the only option is if one is artifice.  Pick one and remove the rest
@@ -353,68 +681,1147 @@ class ProfileOutfits:
 
         return exotic_armor, non_exotic_armor
 
+    # filter and group the armor for a class, pruning dominated armor if this ProfileOutfits was asked to
+    def group_class_armor(self, d2_class, include_ignored_armor):
+        with self.instrumentation.stage("group_class_armor", d2_class=d2_class):
+            exotic_armor, non_exotic_armor = self.filter_and_group_armor(
+                d2_class,
+                ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"],
+                include_ignored_armor,
+            )
+
+            equivalent_armor = {}
+            if self.collapse_equivalent_armor:
+                exotic_armor, non_exotic_armor, equivalent_armor = (
+                    self.find_equivalent_armor(exotic_armor, non_exotic_armor)
+                )
+
+            if self.prune_dominated_armor:
+                exotic_armor, non_exotic_armor, pruned_armor = (
+                    self.find_dominated_armor(exotic_armor, non_exotic_armor)
+                )
+                self.pruned_armor[d2_class] = pruned_armor
+                self.instrumentation.count(pruned_armor=len(pruned_armor))
+                self.__add_tied_armor(equivalent_armor, pruned_armor)
+
+            # the class' groups from an earlier call are replaced, its armor or what was pruned may have changed
+            for instance_id in [
+                instance_id
+                for instance_id in self.equivalent_armor
+                if self.armor_dict[instance_id].d2_class == d2_class
+            ]:
+                del self.equivalent_armor[instance_id]
+            self.equivalent_armor.update(equivalent_armor)
+
+            self.instrumentation.count(
+                pieces_per_slot=self.__pieces_per_slot(exotic_armor, non_exotic_armor)
+            )
+
+            return exotic_armor, non_exotic_armor
+
+    # the pieces that go into the outfits, after the legendary class items are narrowed down to one
+    def __pieces_per_slot(self, exotic_armor, non_exotic_armor):
+        return {
+            slot: {
+                "legendary": len(non_exotic_armor.get(slot, [])),
+                "exotic": len(exotic_armor.get(slot, [])),
+            }
+            for slot in [
+                "Helmet",
+                "Gauntlets",
+                "Chest Armor",
+                "Leg Armor",
+                "Class Item",
+            ]
+        }
+
+    # armor in the same slot with the same stats and artifice-ness (and, for exotics, the same exotic and perks) can be
+    # swapped for each other in any outfit without changing it, so only the first piece of each group is enumerated
+    # returns the collapsed exotic and non-exotic armor and a dict of representative instance_id -> group instance_ids,
+    # the number of instance_ids is the multiplicity of the representative
+    def find_equivalent_armor(self, exotic_armor, non_exotic_armor):
+        equivalent_armor = {}
+
+        def collapse(grouped_armor):
+            collapsed_armor = defaultdict(list)
+            for slot, armor_list in grouped_armor.items():
+                representatives = {}
+                for armor in armor_list:
+                    key = (
+                        armor.mobility,
+                        armor.resilience,
+                        armor.recovery,
+                        armor.discipline,
+                        armor.intellect,
+                        armor.strength,
+                        armor.is_artifice,
+                        armor.item_hash if armor.is_exotic else None,
+                        armor.random_exotic_perks if armor.is_exotic else None,
+                    )
+                    if key in representatives:
+                        equivalent_armor[representatives[key].instance_id].append(
+                            armor.instance_id
+                        )
+                    else:
+                        representatives[key] = armor
+                        equivalent_armor[armor.instance_id] = [armor.instance_id]
+                        collapsed_armor[slot].append(armor)
+            return collapsed_armor
+
+        return collapse(exotic_armor), collapse(non_exotic_armor), equivalent_armor
+
+    # every value a stat can have in an outfit before adding `slot`'s armor piece
+    # the masterwork bonus, plus any combination of armor from the other slots, plus any number of artifice mods
+    # this is a superset of what can really happen, which keeps pruning against it safe
+    def __reachable_partner_stats(self, slot, exotic_armor, non_exotic_armor):
+        reachable_stats = {}
+        for stat in STAT_NAMES:
+            values = {self.FULL_MASTERWORK_STAT_BONUS}
+            for other_slot in [
+                "Helmet",
+                "Gauntlets",
+                "Chest Armor",
+                "Leg Armor",
+                "Class Item",
+            ]:
+                other_stats = {
+                    getattr(armor, stat)
+                    for armor in exotic_armor.get(other_slot, [])
+                    + non_exotic_armor.get(other_slot, [])
+                }
+                if len(other_stats) > 0:
+                    values = {
+                        value + other for value in values for other in other_stats
+                    }
+            reachable_stats[stat] = sorted(
+                {
+                    value + self.ARTIFICE_STAT_BONUS * mods
+                    for value in values
+                    for mods in range(self.MAX_ARTIFICE + 1)
+                }
+            )
+        return reachable_stats
+
+    # 3b. optionally prune armor that is never needed for a pinnacle outfit
+    #
+    # a piece is dominated by another piece of the same slot and rarity (and the same exotic) if, for every value the
+    # rest of the outfit can bring to a stat, the other piece never rounds to a lower useful tier.  Swapping the other
+    # piece into any outfit never lowers any weighted stat combo, so the dominated piece can at best tie an outfit that
+    # the other piece is already in and the per-exotic maximums are unchanged.
+    #
+    # if the dominated piece is artifice and the other piece isn't, the other piece has to cover the dominated piece's
+    # +3 artifice bonus in whichever stat it was applied to.  Pieces that dominate each other keep the one with the
+    # highest total stats, the others are ties, see PrunedArmor.
+    #
+    # returns the pruned exotic and non-exotic armor and a list of PrunedArmor explaining what was removed
+    def find_dominated_armor(self, exotic_armor, non_exotic_armor):
+        pruned_armor = []
+        stat_comparisons = {}
+
+        def never_lower_tier(stat, values, lesser, greater):
+            key = (stat, lesser, greater)
+            if key not in stat_comparisons:
+                stat_comparisons[key] = all(
+                    self.round_to_useful_tier(value + greater)
+                    >= self.round_to_useful_tier(value + lesser)
+                    for value in values
+                )
+            return stat_comparisons[key]
+
+        def dominates(armor, other_armor, reachable_stats):
+            if armor.is_exotic and armor.exotic_hash != other_armor.exotic_hash:
+                return False
+            artifice_bonus = (
+                self.ARTIFICE_STAT_BONUS
+                if armor.is_artifice and not other_armor.is_artifice
+                else 0
+            )
+            return all(
+                never_lower_tier(
+                    stat,
+                    reachable_stats[stat],
+                    getattr(armor, stat) + artifice_bonus,
+                    getattr(other_armor, stat),
+                )
+                for stat in STAT_NAMES
+            )
+
+        pruned_groups = []
+        for grouped_armor in [exotic_armor, non_exotic_armor]:
+            pruned_group = defaultdict(list)
+            for slot, armor_list in grouped_armor.items():
+                reachable_stats = self.__reachable_partner_stats(
+                    slot, exotic_armor, non_exotic_armor
+                )
+
+                # pieces that dominate each other are the same in every outfit, keep the first in this order
+                ranked_armor = sorted(
+                    armor_list,
+                    key=lambda armor: (
+                        -armor.total_stats,
+                        -armor.is_artifice,
+                        armor.instance_id,
+                    ),
+                )
+                rank = {armor.instance_id: i for i, armor in enumerate(ranked_armor)}
+
+                for armor in armor_list:
+                    dominated_by = None
+                    for other_armor in ranked_armor:
+                        if other_armor is armor or not dominates(
+                            armor, other_armor, reachable_stats
+                        ):
+                            continue
+                        is_tie = dominates(other_armor, armor, reachable_stats)
+                        if (
+                            not is_tie
+                            or rank[other_armor.instance_id] < rank[armor.instance_id]
+                        ):
+                            dominated_by = other_armor
+                            break
+
+                    if dominated_by is None:
+                        pruned_group[slot].append(armor)
+                    else:
+                        pruned_armor.append(
+                            PrunedArmor(
+                                armor,
+                                dominated_by,
+                                self.__dominated_reason(armor, dominated_by),
+                                is_tie
+                                and armor.is_artifice == dominated_by.is_artifice,
+                            )
+                        )
+            pruned_groups.append(pruned_group)
+
+        return pruned_groups[0], pruned_groups[1], pruned_armor
+
+    # adds the pruned armor that ties a kept piece in every outfit to that piece's group of `equivalent_armor`, pinnacle
+    # outfits are expanded to it like to collapsed equivalent armor.  A tie with a piece that was pruned itself stays out
+    def __add_tied_armor(self, equivalent_armor, pruned_armor):
+        pruned_ids = {pruned.armor.instance_id for pruned in pruned_armor}
+        for pruned in pruned_armor:
+            kept_id = pruned.dominated_by.instance_id
+            if pruned.is_tie and kept_id not in pruned_ids:
+                equivalent_armor.setdefault(kept_id, [kept_id]).extend(
+                    equivalent_armor.pop(
+                        pruned.armor.instance_id, [pruned.armor.instance_id]
+                    )
+                )
+
+    def __dominated_reason(self, armor, dominated_by):
+        better_stats = [
+            stat[:3]
+            for stat in STAT_NAMES
+            if getattr(dominated_by, stat) > getattr(armor, stat)
+        ]
+        reason = f"never a tier higher than id:{dominated_by.instance_id} {dominated_by.item_name}"
+        if len(better_stats) > 0:
+            reason += f", which has more {'/'.join(better_stats)}"
+        if armor.is_artifice and not dominated_by.is_artifice:
+            reason += ", even with its artifice mod"
+        return reason
+
+    # the slot lists for each pass of outfit generation, in the order they are generated:
+    # all non-exotic armor, then a single slot of exotic armor with non-exotic armor in the other slots
+    def class_outfit_slot_lists(self, exotic_armor, non_exotic_armor):
+        slots = ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"]
+
+        # do we care about non-exotic armor?
+        slot_lists = [[non_exotic_armor[slot] for slot in slots]]
+
+        # we can only have exotic armor in a single slot, add all outfits with a single slot of exotic armor
+        # exotic class items are a different exotic for each pair of random perks, their outfits get the perk pair's exotic_hash
+        for exotic_slot in slots:
+            slot_lists.append(
+                [
+                    exotic_armor[slot]
+                    if slot == exotic_slot
+                    else non_exotic_armor[slot]
+                    for slot in slots
+                ]
+            )
+
+        return slot_lists
+
     # 4. generate all possible outfits using non-exotic armor
     # 5. add in all possible outfits using a single piece of exotic armor
     def generate_class_outfits(self, d2_class, include_ignored_armor):
-        outfits = []
+        with self.instrumentation.stage("generate_class_outfits", d2_class=d2_class):
+            outfits = []
+
+            # filter armor to only include armor for the given class and slots
+            exotic_armor, non_exotic_armor = self.group_class_armor(
+                d2_class, include_ignored_armor
+            )
+            self.__check_memory_budget(
+                d2_class, exotic_armor, non_exotic_armor, list_outfits=True
+            )
 
-        # filter armor to only include armor for the given class and slots
-        exotic_armor, non_exotic_armor = self.filter_and_group_armor(
-            d2_class,
-            ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"],
-            include_ignored_armor,
+            slot_lists_list = self.class_outfit_slot_lists(
+                exotic_armor, non_exotic_armor
+            )
+            for slot_lists in slot_lists_list:
+                self.append_outfit_permutations(outfits, *slot_lists)
+
+            if self.instrumentation.enabled:
+                self.__count_outfits(
+                    [self.slot_matrices(slot_lists) for slot_lists in slot_lists_list],
+                    pl.Series(
+                        "exotic_hash",
+                        [
+                            outfit[OUTFIT_COLUMNS.index("exotic_hash")]
+                            for outfit in outfits
+                        ],
+                        dtype=pl.Int64,
+                    ),
+                )
+
+            return outfits
+
+    # same outfits as `generate_class_outfits`, but enumerated with numpy broadcasting over a stat matrix per slot
+    # returns the columnar outfit table that PinnacleOutfits consumes rather than a list of tuples
+    def generate_class_outfits_df(self, d2_class, include_ignored_armor):
+        with self.instrumentation.stage("generate_class_outfits_df", d2_class=d2_class):
+            exotic_armor, non_exotic_armor = self.group_class_armor(
+                d2_class, include_ignored_armor
+            )
+            self.__check_memory_budget(d2_class, exotic_armor, non_exotic_armor)
+            return self.class_outfits_df(exotic_armor, non_exotic_armor)
+
+    # the outfit table for armor that is already grouped by `group_class_armor`
+    def class_outfits_df(self, exotic_armor, non_exotic_armor):
+        slots_list = self.class_outfit_slot_matrices(exotic_armor, non_exotic_armor)
+        outfits_dfs = [
+            outfit_columns_to_df(
+                enumerate_outfit_columns(
+                    slots,
+                    self.artifice_tier_table,
+                    self.FULL_MASTERWORK_STAT_BONUS,
+                    self.NO_EXOTIC_HASH,
+                ),
+                self.outfit_schema,
+            )
+            for slots in slots_list
+        ]
+
+        outfits_df = pl.concat(outfits_dfs)
+        if self.instrumentation.enabled:
+            self.__count_outfits(slots_list, outfits_df["exotic_hash"])
+        return outfits_df
+
+    # counts how the outfits of `slots_list` blew up into the outfit rows with `exotic_hashes`
+    # `armor_combinations` are the outfits before artifice expansion.  Each of them has an artifice mod permutation for
+    # every way to put its artifice mods on the stats, `artifice_dedup_ratio` is the share of those permutations that
+    # reached distinct useful tiers and became outfit rows
+    def __count_outfits(self, slots_list, exotic_hashes):
+        armor_combinations_per_artifice = self.__armor_combinations_per_artifice(
+            slots_list
+        )
+        artifice_permutations = self.__artifice_permutation_count(
+            armor_combinations_per_artifice
+        )
+        self.instrumentation.count(
+            armor_combinations=int(armor_combinations_per_artifice.sum()),
+            armor_combinations_per_artifice=armor_combinations_per_artifice.tolist(),
+            artifice_permutations=artifice_permutations,
+            outfits=len(exotic_hashes),
+            artifice_dedup_ratio=len(exotic_hashes) / artifice_permutations
+            if artifice_permutations > 0
+            else None,
+            outfits_per_exotic=rows_per_exotic(exotic_hashes),
         )
 
-        # append all possible non-exotic armor combinations
+    # the armor combinations of all of `slots_list` with 0 to MAX_ARTIFICE artifice pieces
+    def __armor_combinations_per_artifice(self, slots_list):
+        return sum(
+            (artifice_combination_counts(slots) for slots in slots_list),
+            np.zeros(self.MAX_ARTIFICE + 1, dtype=np.int64),
+        )
 
-        # do we care about non-exotic armor?
-        self.append_outfit_permutations(
-            outfits,
-            non_exotic_armor["Helmet"],
-            non_exotic_armor["Gauntlets"],
-            non_exotic_armor["Chest Armor"],
-            non_exotic_armor["Leg Armor"],
-            non_exotic_armor["Class Item"],
+    # every artifice mod permutation of every armor combination, the most outfit rows the combinations can expand to
+    def __artifice_permutation_count(self, armor_combinations_per_artifice):
+        return sum(
+            int(combinations) * len(self.artifice_permutations[num_artifice])
+            for num_artifice, combinations in enumerate(armor_combinations_per_artifice)
         )
 
-        # we can only have exotic armor in a single slot, add all outfits with a single slot of exotic armor
-        self.append_outfit_permutations(
-            outfits,
-            exotic_armor["Helmet"],
-            non_exotic_armor["Gauntlets"],
-            non_exotic_armor["Chest Armor"],
-            non_exotic_armor["Leg Armor"],
-            non_exotic_armor["Class Item"],
-        )
-        self.append_outfit_permutations(
-            outfits,
-            non_exotic_armor["Helmet"],
-            exotic_armor["Gauntlets"],
-            non_exotic_armor["Chest Armor"],
-            non_exotic_armor["Leg Armor"],
-            non_exotic_armor["Class Item"],
-        )
-        self.append_outfit_permutations(
-            outfits,
-            non_exotic_armor["Helmet"],
-            non_exotic_armor["Gauntlets"],
-            exotic_armor["Chest Armor"],
-            non_exotic_armor["Leg Armor"],
-            non_exotic_armor["Class Item"],
-        )
-        self.append_outfit_permutations(
-            outfits,
-            non_exotic_armor["Helmet"],
-            non_exotic_armor["Gauntlets"],
-            non_exotic_armor["Chest Armor"],
-            exotic_armor["Leg Armor"],
-            non_exotic_armor["Class Item"],
-        )
-
-        # as of right now, there is no exotic class item.  there will be in TFS, but unless it has stats better than a legendary class item, we don't care
-        # append_outfit_permutations(outfits, non_exotic_armor["Helmet"], non_exotic_armor["Gauntlets"], non_exotic_armor["Chest Armor"], non_exotic_armor["Leg Armor"], exotic_armor["Class Item"])
-
-        return outfits
+    # parallel version of `generate_class_outfits_df`, the product space of every pass is split into row ranges that a
+    # pool of `max_workers` processes enumerates, defaulting to one per core.  Workers hand their outfits back through
+    # shared memory instead of pickling them and the result has the same rows in the same order as the sequential version
+    def generate_class_outfits_df_parallel(
+        self,
+        d2_class,
+        include_ignored_armor,
+        max_workers=None,
+        chunk_size=DEFAULT_OUTFIT_BATCH_SIZE,
+    ):
+        with self.instrumentation.stage(
+            "generate_class_outfits_df_parallel", d2_class=d2_class
+        ):
+            exotic_armor, non_exotic_armor = self.group_class_armor(
+                d2_class, include_ignored_armor
+            )
+
+            slots_list = self.class_outfit_slot_matrices(exotic_armor, non_exotic_armor)
+            outfits_df = outfit_columns_to_df(
+                enumerate_outfit_columns_parallel(
+                    slots_list,
+                    self.artifice_tier_table,
+                    self.FULL_MASTERWORK_STAT_BONUS,
+                    self.NO_EXOTIC_HASH,
+                    max_workers,
+                    chunk_size,
+                ),
+                self.outfit_schema,
+            )
+            if self.instrumentation.enabled:
+                self.__count_outfits(slots_list, outfits_df["exotic_hash"])
+            return outfits_df
+
+    # streaming version of `generate_class_outfits_df` that yields the outfit table in batches of `batch_size` rows
+    # only a chunk of the product space is enumerated at a time, so the whole table is never held in memory
+    def generate_class_outfit_batches(
+        self, d2_class, include_ignored_armor, batch_size=DEFAULT_OUTFIT_BATCH_SIZE
+    ):
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+        yield from self.class_outfit_batches(exotic_armor, non_exotic_armor, batch_size)
+
+    # the outfit table batches for armor that is already grouped by `group_class_armor`
+    def class_outfit_batches(
+        self, exotic_armor, non_exotic_armor, batch_size=DEFAULT_OUTFIT_BATCH_SIZE
+    ):
+        column_chunks = (
+            columns
+            for slots in self.class_outfit_slot_matrices(exotic_armor, non_exotic_armor)
+            for columns in enumerate_outfit_column_chunks(
+                slots,
+                self.artifice_tier_table,
+                self.FULL_MASTERWORK_STAT_BONUS,
+                self.NO_EXOTIC_HASH,
+                batch_size,
+            )
+        )
+
+        yield from outfit_column_batches(column_chunks, batch_size, self.outfit_schema)
+
+    # one row per armor piece enumerated for a class, with everything about the piece that goes into an outfit
+    # `generate_class_outfits_update` diffs these between runs to find the armor that was added or removed
+    def enumerated_armor_df(self, exotic_armor, non_exotic_armor):
+        armor_table = self.armor_table
+        rows = armor_table.rows(
+            armor.instance_id
+            for grouped_armor in (exotic_armor, non_exotic_armor)
+            for armor_list in grouped_armor.values()
+            for armor in armor_list
+        )
+        return pl.DataFrame(
+            {
+                "instance_id": armor_table.instance_ids[rows],
+                "exotic_hash": np.where(
+                    armor_table.is_exotic[rows],
+                    armor_table.exotic_hashes[rows],
+                    self.NO_EXOTIC_HASH,
+                ),
+                **{
+                    stat: armor_table.stats[rows, i]
+                    for i, stat in enumerate(STAT_NAMES)
+                },
+                "is_artifice": armor_table.is_artifice[rows],
+            }
+        )
+
+    # the outfits that changed for a class since an earlier run enumerated `previous_armor_df` (see `enumerated_armor_df`)
+    # armor that is new, or that changed, is added and only outfits with at least one added piece are generated.  Armor
+    # that is gone, or that changed, is removed and its outfits have to be dropped from the earlier outfits.  Every other
+    # outfit is the same as last time.  Pruning and collapsing equivalent armor are diffed the same way, a piece that is
+    # no longer pruned is added and a piece that is now pruned is removed
+    #
+    # returns the added outfits with instance ids in the slot columns (OUTFIT_SCHEMA, even for `compact_outfits`), the
+    # removed instance ids and the `enumerated_armor_df` for the next run.  Without `previous_armor_df` every outfit is added
+    def generate_class_outfits_update(
+        self, d2_class, include_ignored_armor, previous_armor_df=None
+    ):
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+        armor_df = self.enumerated_armor_df(exotic_armor, non_exotic_armor)
+
+        if previous_armor_df is None:
+            outfits_dfs = [self.class_outfits_df(exotic_armor, non_exotic_armor)]
+            removed_instance_ids = []
+        else:
+            added_instance_ids = set(
+                armor_df.join(previous_armor_df, on=armor_df.columns, how="anti")[
+                    "instance_id"
+                ].to_list()
+            )
+            removed_instance_ids = previous_armor_df.join(
+                armor_df, on=armor_df.columns, how="anti"
+            )["instance_id"].to_list()
+
+            # each outfit with an added piece is generated once, from the pass where its first added piece is in slot
+            # `i`: the slots before `i` only have armor from the earlier run and the slots after `i` have all armor
+            outfits_dfs = []
+            for slot_lists in self.class_outfit_slot_lists(
+                exotic_armor, non_exotic_armor
+            ):
+                for i, armor_list in enumerate(slot_lists):
+                    added_armor = [
+                        armor
+                        for armor in armor_list
+                        if armor.instance_id in added_instance_ids
+                    ]
+                    if len(added_armor) == 0:
+                        continue
+                    earlier_slot_lists = [
+                        [
+                            armor
+                            for armor in earlier_armor_list
+                            if armor.instance_id not in added_instance_ids
+                        ]
+                        for earlier_armor_list in slot_lists[:i]
+                    ]
+                    outfits_dfs.append(
+                        self.outfit_permutations_df(
+                            *earlier_slot_lists, added_armor, *slot_lists[i + 1 :]
+                        )
+                    )
+
+        added_outfits_df = self.restore_instance_ids(
+            pl.concat(outfits_dfs)
+            if outfits_dfs
+            else empty_outfits_df(self.outfit_schema)
+        ).cast(OUTFIT_SCHEMA)
+        return added_outfits_df, removed_instance_ids, armor_df
+
+    # the pinnacle outfits for a class, kept up to date between runs in `state_directory`, ex: "data/outfits/warlock"
+    # the first run generates every outfit.  Later runs only generate the outfits with armor that is new since the last
+    # run and drop the outfits with armor that is gone, see `generate_class_outfits_update` and `PinnacleOutfits.updated`.
+    # A state from a different tier size is regenerated from scratch
+    def update_class_pinnacle_outfits(
+        self, d2_class, include_ignored_armor, state_directory
+    ):
+        state = {"d2_class": d2_class, "tier_size": self.tier_size}
+        state_path = os.path.join(state_directory, "state.json")
+        armor_path = os.path.join(state_directory, "armor.parquet")
+
+        previous_armor_df = None
+        if os.path.exists(state_path):
+            with open(state_path, "r") as file:
+                if json.load(file) == state:
+                    previous_armor_df = pl.read_parquet(armor_path)
+
+        added_outfits_df, removed_instance_ids, armor_df = (
+            self.generate_class_outfits_update(
+                d2_class, include_ignored_armor, previous_armor_df
+            )
+        )
+        if previous_armor_df is None:
+            pinnacle_outfits = PinnacleOutfits(added_outfits_df, self.equivalent_armor)
+        else:
+            pinnacle_outfits = PinnacleOutfits.read_state(
+                state_directory,
+                self.equivalent_armor,
+                added_outfits=added_outfits_df,
+                removed_instance_ids=removed_instance_ids,
+            )
+
+        pinnacle_outfits.write_state(state_directory)
+        armor_df.write_parquet(armor_path)
+        with open(state_path, "w") as file:
+            json.dump(state, file, indent=4)
+        return pinnacle_outfits
+
+    # the OutfitCache key for a class's outfits and pinnacle outfits: its enumerated armor, the equivalent armor that
+    # pinnacle outfits are expanded to, and the tier size and weights.  Compact outfit tables hold ArmorTable rows, so
+    # for those the rows of the armor are part of the key too
+    def class_outfits_fingerprint(self, exotic_armor, non_exotic_armor):
+        armor_df = self.enumerated_armor_df(exotic_armor, non_exotic_armor)
+        if self.compact_outfits:
+            armor_df = armor_df.with_columns(
+                row=self.armor_table.rows(armor_df["instance_id"].to_list())
+            )
+        equivalent_armor_df = pl.DataFrame(
+            [
+                (instance_id, equivalent_instance_id)
+                for instance_id in armor_df["instance_id"].to_list()
+                for equivalent_instance_id in self.equivalent_armor.get(instance_id, [])
+            ],
+            schema={"instance_id": pl.Int64, "equivalent_instance_id": pl.Int64},
+            orient="row",
+        )
+        return fingerprint(
+            armor_df.sort("instance_id"),
+            equivalent_armor_df.sort(pl.all()),
+            tier_size=self.tier_size,
+            compact_outfits=self.compact_outfits,
+            weighted_stat_count=PinnacleOutfits.WEIGHTED_STAT_COUNT,
+            stat_weight=PinnacleOutfits.STAT_WEIGHT,
+        )
+
+    # `class_pinnacle_outfits` through an OutfitCache, so rerunning the notebook or restarting its kernel memory maps
+    # the saved outfit and pinnacle tables instead of generating them again.  The entry is keyed by
+    # `class_outfits_fingerprint`, once the armor, tier size or `compact_outfits` change the class's entry is replaced
+    # a miss is planned like `class_pinnacle_outfits`.  Built in memory the outfits are in `pinnacle_outfits.outfits`,
+    # streamed only the pinnacle outfits and the candidates for them were kept, so that is all the entry holds
+    def cached_class_pinnacle_outfits(
+        self,
+        d2_class,
+        include_ignored_armor,
+        outfit_cache,
+        memory_budget=None,
+        batch_size=DEFAULT_OUTFIT_BATCH_SIZE,
+    ):
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+        key = self.class_outfits_fingerprint(exotic_armor, non_exotic_armor)
+
+        frames = outfit_cache.get(d2_class.lower(), key)
+        if frames is not None:
+            return PinnacleOutfits.from_frames(
+                frames, self.equivalent_armor, self.armor_table
+            )
+
+        plan = self.class_outfit_plan(
+            d2_class, exotic_armor, non_exotic_armor, memory_budget, batch_size
+        )
+        self.outfit_plans[d2_class] = plan
+        pinnacle_outfits = self.__planned_pinnacle_outfits(
+            plan, exotic_armor, non_exotic_armor
+        )
+        outfit_cache.put(d2_class.lower(), key, pinnacle_outfits.frames())
+        return pinnacle_outfits
+
+    # the slot matrices for each pass of `class_outfit_slot_lists`
+    #
+    # the legendary-only pass and every single exotic slot pass share most of their legendary slots, so rather than
+    # summing the same legendary pieces again for each pass, the partial sums of legendary helmets + gauntlets and
+    # legendary chest armor + leg armor + class items are built once per class.  Exotics are then broadcast against
+    # those shared partner tables.  Rows come out in the same order as `class_outfit_slot_lists`, except that the
+    # outfits of exotic class items with the same stats are next to each other
+    def class_outfit_slot_matrices(self, exotic_armor, non_exotic_armor):
+        helmets, gauntlets, chest_armors, leg_armors, class_items = self.slot_matrices(
+            [
+                non_exotic_armor[slot]
+                for slot in [
+                    "Helmet",
+                    "Gauntlets",
+                    "Chest Armor",
+                    "Leg Armor",
+                    "Class Item",
+                ]
+            ]
+        )
+        exotic_helmets, exotic_gauntlets, exotic_chest_armors, exotic_leg_armors = (
+            self.slot_matrices(
+                [
+                    exotic_armor[slot]
+                    for slot in ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor"]
+                ]
+            )
+        )
+        # exotic class items with different perks often roll the same stats, those share a row so their legendary
+        # partners are only enumerated once, `expand_slot_variants` gives each perk pair its own copy of the outfits
+        (exotic_class_items,) = self.slot_matrices([exotic_armor["Class Item"]])
+        exotic_class_items = exotic_class_items.with_variants()
+
+        helmets_gauntlets = combine_slot_matrices(
+            helmets, gauntlets, self.NO_EXOTIC_HASH
+        )
+        leg_armors_class_items = combine_slot_matrices(
+            leg_armors, class_items, self.NO_EXOTIC_HASH
+        )
+        chest_leg_armors_class_items = combine_slot_matrices(
+            chest_armors, leg_armors_class_items, self.NO_EXOTIC_HASH
+        )
+        chest_leg_armors = combine_slot_matrices(
+            chest_armors, leg_armors, self.NO_EXOTIC_HASH
+        )
+
+        return [
+            [helmets_gauntlets, chest_leg_armors_class_items],
+            [exotic_helmets, gauntlets, chest_leg_armors_class_items],
+            [helmets, exotic_gauntlets, chest_leg_armors_class_items],
+            [helmets_gauntlets, exotic_chest_armors, leg_armors_class_items],
+            [helmets_gauntlets, chest_armors, exotic_leg_armors, class_items],
+            [helmets_gauntlets, chest_leg_armors, exotic_class_items],
+        ]
+
+    def slot_matrices(self, slot_lists):
+        return [
+            SlotMatrix.from_armor_table(
+                self.armor_table,
+                self.armor_table.rows(armor.instance_id for armor in armor_list),
+                self.NO_EXOTIC_HASH,
+                self.compact_outfits,
+            )
+            for armor_list in slot_lists
+        ]
+
+    def outfit_permutations_df(
+        self, helmets, gauntlets, chest_armors, leg_armors, class_items
+    ):
+        columns = enumerate_outfit_columns(
+            self.slot_matrices(
+                [helmets, gauntlets, chest_armors, leg_armors, class_items]
+            ),
+            self.artifice_tier_table,
+            self.FULL_MASTERWORK_STAT_BONUS,
+            self.NO_EXOTIC_HASH,
+        )
+        return outfit_columns_to_df(columns, self.outfit_schema)
+
+    # estimate the size of `generate_class_outfits_df` for a class without generating it
+    # `tier_size` defaults to this ProfileOutfits' tier size, passing HALF_TIER_SIZE to a full tier ProfileOutfits shows
+    # how many more outfits half tiers would make before committing to them.  Half tiers roughly double the outfits,
+    # pair them with `compact_outfits` and a streaming PinnacleOutfits (`from_batches`, `from_lazy`) on large vaults
+    def estimate_class_outfits(
+        self, d2_class, include_ignored_armor, tier_size=None, sample_size=1 << 14
+    ):
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+        return self.class_outfits_estimate(
+            exotic_armor, non_exotic_armor, tier_size, sample_size
+        )
+
+    # the estimate for armor that is already grouped by `group_class_armor`
+    # the pieces per slot and how many armor combinations have each number of artifice pieces are exact, they bound the
+    # outfits at `max_outfits`, every artifice mod permutation of every combination.  `estimated_outfits` are the
+    # distinct useful tiers those permutations reach on a sample of the combinations, see `estimate_outfit_rows`, and
+    # `pinnacle_outfits` the pinnacle outfits in that sample.  They are exact when `pinnacle_outfits_exact` says the
+    # sample was every combination, otherwise a lower bound, see `sampled_pinnacle_rows`
+    def class_outfits_estimate(
+        self, exotic_armor, non_exotic_armor, tier_size=None, sample_size=1 << 14
+    ):
+        tier_size = tier_size or self.tier_size
+        artifice_tier_table = (
+            self.artifice_tier_table
+            if tier_size == self.tier_size
+            else ArtificeTierTable(tier_size, self.MAX_USEFUL_STAT)
+        )
+        slots_list = self.class_outfit_slot_matrices(exotic_armor, non_exotic_armor)
+        armor_combinations, estimated_outfits = estimate_outfit_rows(
+            slots_list,
+            artifice_tier_table,
+            self.FULL_MASTERWORK_STAT_BONUS,
+            self.NO_EXOTIC_HASH,
+            sample_size,
+        )
+        pinnacle_outfits, pinnacle_outfits_exact = sampled_pinnacle_rows(
+            slots_list,
+            artifice_tier_table,
+            self.FULL_MASTERWORK_STAT_BONUS,
+            self.NO_EXOTIC_HASH,
+            weighting_schemes(
+                stat_counts=(PinnacleOutfits.WEIGHTED_STAT_COUNT,),
+                weights=(PinnacleOutfits.STAT_WEIGHT,),
+            )[1],
+            sample_size,
+        )
+        armor_combinations_per_artifice = self.__armor_combinations_per_artifice(
+            slots_list
+        )
+        return {
+            "tier_size": tier_size,
+            "pieces_per_slot": self.__pieces_per_slot(exotic_armor, non_exotic_armor),
+            "armor_combinations": armor_combinations,
+            "armor_combinations_per_artifice": armor_combinations_per_artifice.tolist(),
+            "max_outfits": self.__artifice_permutation_count(
+                armor_combinations_per_artifice
+            ),
+            "estimated_outfits": estimated_outfits,
+            "estimated_bytes": estimated_outfits * outfit_row_bytes(self.outfit_schema),
+            "pinnacle_outfits": pinnacle_outfits,
+            "pinnacle_outfits_exact": pinnacle_outfits_exact,
+        }
+
+    # pick how to build the pinnacle outfits of a class before enumerating any of them, returns an OutfitPlan
+    # `memory_budget` defaults to this ProfileOutfits' memory budget.  The first of STRATEGIES that is estimated to fit in
+    # it is picked, without a budget that is always IN_MEMORY, and a ValueError is raised when none of them fit
+    def plan_class_outfits(
+        self,
+        d2_class,
+        include_ignored_armor,
+        memory_budget=None,
+        batch_size=DEFAULT_OUTFIT_BATCH_SIZE,
+    ):
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+        return self.class_outfit_plan(
+            d2_class, exotic_armor, non_exotic_armor, memory_budget, batch_size
+        )
+
+    # the OutfitPlan for armor that is already grouped by `group_class_armor`, `strategy` skips picking one and plans
+    # that one of STRATEGIES whatever the budget, ex: to measure it
+    def class_outfit_plan(
+        self,
+        d2_class,
+        exotic_armor,
+        non_exotic_armor,
+        memory_budget=None,
+        batch_size=DEFAULT_OUTFIT_BATCH_SIZE,
+        strategy=None,
+    ):
+        if memory_budget is None:
+            memory_budget = self.memory_budget
+
+        with self.instrumentation.stage("plan_class_outfits", d2_class=d2_class):
+            estimate = self.class_outfits_estimate(exotic_armor, non_exotic_armor)
+            estimated_bytes = estimate_pinnacle_bytes(
+                estimate["estimated_outfits"],
+                estimate["armor_combinations"],
+                batch_size,
+                self.__pinnacle_row_bytes(),
+                estimate["pinnacle_outfits"],
+            )
+            if strategy is None:
+                strategy = next(
+                    (
+                        strategy
+                        for strategy in self.STRATEGIES
+                        if memory_budget is None
+                        or estimated_bytes[strategy] <= memory_budget
+                    ),
+                    None,
+                )
+            self.instrumentation.count(
+                strategy=strategy,
+                estimated_outfits=estimate["estimated_outfits"],
+                max_outfits=estimate["max_outfits"],
+                pinnacle_outfits=estimate["pinnacle_outfits"],
+                estimated_bytes=estimated_bytes,
+                memory_budget=memory_budget,
+            )
+
+            if strategy is None:
+                streaming = "" if estimate["pinnacle_outfits_exact"] else "at least "
+                raise ValueError(
+                    f"{d2_class} has about {estimate['estimated_outfits']:,} outfits, building their pinnacle outfits "
+                    f"needs about {format_bytes(estimated_bytes[self.IN_MEMORY])} in memory, "
+                    f"{streaming}{format_bytes(estimated_bytes[self.BATCHES])} in batches of {batch_size:,} outfits and "
+                    f"{streaming}{format_bytes(estimated_bytes[self.TWO_PASSES])} in two passes, all over the memory budget of "
+                    f"{format_bytes(memory_budget)}.  A smaller batch_size, leaving out ignored armor, "
+                    f"prune_dominated_armor or compact_outfits need less"
+                )
+
+            return OutfitPlan(
+                d2_class, strategy, estimate, estimated_bytes, memory_budget, batch_size
+            )
+
+    # the PinnacleOutfits of a class, built with the strategy `plan_class_outfits` picks for `memory_budget` so a vault
+    # that is too big to hold every outfit is streamed rather than running out of memory halfway through enumerating it
+    # the plan is kept in `outfit_plans`, keyed by class, and `strategy` forces one of STRATEGIES
+    def class_pinnacle_outfits(
+        self,
+        d2_class,
+        include_ignored_armor,
+        memory_budget=None,
+        batch_size=DEFAULT_OUTFIT_BATCH_SIZE,
+        strategy=None,
+    ):
+        with self.instrumentation.stage("class_pinnacle_outfits", d2_class=d2_class):
+            exotic_armor, non_exotic_armor = self.group_class_armor(
+                d2_class, include_ignored_armor
+            )
+            plan = self.class_outfit_plan(
+                d2_class,
+                exotic_armor,
+                non_exotic_armor,
+                memory_budget,
+                batch_size,
+                strategy,
+            )
+            self.outfit_plans[d2_class] = plan
+
+            return self.__planned_pinnacle_outfits(plan, exotic_armor, non_exotic_armor)
+
+    # the PinnacleOutfits of armor grouped by `group_class_armor`, built with the strategy of `plan`
+    def __planned_pinnacle_outfits(self, plan, exotic_armor, non_exotic_armor):
+        if plan.strategy == self.IN_MEMORY:
+            return PinnacleOutfits(
+                self.class_outfits_df(exotic_armor, non_exotic_armor),
+                self.equivalent_armor,
+                self.armor_table,
+                self.instrumentation,
+            )
+        if plan.strategy == self.BATCHES:
+            return PinnacleOutfits.from_batches(
+                self.class_outfit_batches(
+                    exotic_armor, non_exotic_armor, plan.batch_size
+                ),
+                self.equivalent_armor,
+                self.armor_table,
+                self.instrumentation,
+            )
+        return PinnacleOutfits.from_two_passes(
+            lambda: self.class_outfit_batches(
+                exotic_armor, non_exotic_armor, plan.batch_size
+            ),
+            self.equivalent_armor,
+            self.armor_table,
+            self.instrumentation,
+        )
+
+    # the estimated peak bytes of holding `outfits` outfits and the PinnacleOutfits built from them, `list_outfits` is
+    # for `generate_class_outfits`, its list of tuples is turned into a full outfit table by PinnacleOutfits
+    def in_memory_bytes(self, outfits, list_outfits=False):
+        row_bytes = (
+            self.__pinnacle_row_bytes(OUTFIT_SCHEMA) + LIST_OUTFIT_ROW_BYTES
+            if list_outfits
+            else self.__pinnacle_row_bytes()
+        )
+        return PINNACLE_BASE_BYTES + outfits * row_bytes
+
+    # raises a ValueError before the outfits of a class are enumerated when `in_memory_bytes` of them is more than
+    # `memory_budget`
+    def __check_memory_budget(
+        self, d2_class, exotic_armor, non_exotic_armor, list_outfits=False
+    ):
+        if self.memory_budget is None:
+            return
+
+        outfits = self.class_outfits_estimate(exotic_armor, non_exotic_armor)[
+            "estimated_outfits"
+        ]
+        estimated_bytes = self.in_memory_bytes(outfits, list_outfits)
+        if estimated_bytes > self.memory_budget:
+            raise ValueError(
+                f"{d2_class} has about {outfits:,} outfits, building their pinnacle outfits in memory needs about "
+                f"{format_bytes(estimated_bytes)}, over the memory budget of {format_bytes(self.memory_budget)}.  "
+                f"class_pinnacle_outfits streams them instead"
+            )
+
+    # the peak bytes per outfit of building a PinnacleOutfits from this ProfileOutfits' outfit tables, or from outfit
+    # tables with `schema`
+    def __pinnacle_row_bytes(self, schema=None):
+        schema = schema or self.outfit_schema
+        return pinnacle_row_bytes(
+            schema,
+            len(list(combinations(STAT_NAMES, PinnacleOutfits.WEIGHTED_STAT_COUNT))),
+            COMPACT_WEIGHTED_DTYPE if schema is COMPACT_OUTFIT_SCHEMA else pl.Int64,
+        )
+
+    # the outfit table with instance ids in the slot columns, compact outfit tables have rows of `armor_table` there
+    def restore_instance_ids(self, outfits_df):
+        if not is_compact_outfits_df(outfits_df):
+            return outfits_df
+        return restore_instance_ids(outfits_df, self.armor_table.instance_ids)
+
+    # the slot and exotic_hash of the exotic named `exotic_name` in `exotic_armor`.  An exotic_name picks one exotic, an
+    # item_name only picks one when every piece with that name is the same exotic, ex: an exotic class item with a single
+    # perk pair.  Raises a ValueError when no exotic or more than one has the name
+    @staticmethod
+    def __find_exotic(d2_class, exotic_armor, exotic_name):
+        def matching_exotics(name_of):
+            return {
+                (slot, armor.exotic_hash): armor.exotic_name
+                for slot, armor_list in exotic_armor.items()
+                for armor in armor_list
+                if name_of(armor) == exotic_name
+            }
+
+        exotics = matching_exotics(lambda armor: armor.exotic_name) or (
+            matching_exotics(lambda armor: armor.item_name)
+        )
+        if len(exotics) == 0:
+            raise ValueError(f"No {d2_class} exotic armor named {exotic_name}")
+        if len(exotics) > 1:
+            raise ValueError(
+                f"{exotic_name} is more than one {d2_class} exotic, use one of: "
+                + ", ".join(sorted(set(exotics.values())))
+            )
+        return next(iter(exotics))
+
+    # best-first search for the `k` best outfits for one exotic and weighted stat combo, without enumerating every outfit
+    #
+    # `exotic_name` is the name of an exotic armor piece, or None for outfits without an exotic.  The `exotic_name` of an
+    # exotic class item, ex: "Solipsism (Spirit of Inmost Light + Spirit of the Star-Eater)", picks a single perk pair,
+    # its bare item name raises a ValueError when the vault has it with more than one perk pair
+    # `stats` is the weighted stat combination, ex: ["resilience", "discipline", "strength"], and `weight` is how much
+    # those stats are worth over the other stats, the same as the `weighted_*` columns in PinnacleOutfits
+    #
+    # outfits are explored one slot at a time in order of an upper bound on their weighted score: the best each remaining
+    # slot could add, ignoring tier rounding and assuming every artifice mod lands on a weighted stat, capped at 100 per stat.
+    # A complete outfit is only returned once its exact score is at least the bound of everything left to explore, so the
+    # search stops as soon as the k-th best outfit can no longer be beaten.
+    #
+    # returns a DataFrame with the outfit columns and the `weighted_*` score of each outfit's best artifice tiers, best first
+    def top_outfits(
+        self,
+        d2_class,
+        exotic_name,
+        stats,
+        k=10,
+        weight=2,
+        include_ignored_armor=True,
+    ):
+        slots = ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"]
+        exotic_armor, non_exotic_armor = self.group_class_armor(
+            d2_class, include_ignored_armor
+        )
+
+        slot_lists = [non_exotic_armor[slot] for slot in slots]
+        if exotic_name is not None:
+            exotic_slot, exotic_hash = self.__find_exotic(
+                d2_class, exotic_armor, exotic_name
+            )
+            slot_lists[slots.index(exotic_slot)] = [
+                armor
+                for armor in exotic_armor[exotic_slot]
+                if armor.exotic_hash == exotic_hash
+            ]
+
+        weighted_column_name = "weighted_" + "_".join(
+            stat for stat in STAT_NAMES if stat in stats
+        )
+        weights = [weight if stat in stats else 1 for stat in STAT_NAMES]
+        artifice_weight = self.ARTIFICE_STAT_BONUS * max(weights)
+
+        def piece_bound(armor):
+            return (
+                sum(w * getattr(armor, stat) for w, stat in zip(weights, STAT_NAMES))
+                + artifice_weight * armor.is_artifice
+            )
+
+        slot_lists = [
+            sorted(armor_list, key=piece_bound, reverse=True)
+            for armor_list in slot_lists
+        ]
+
+        top_outfits = []
+        if any(len(armor_list) == 0 for armor_list in slot_lists):
+            return pl.DataFrame(
+                top_outfits, schema=OUTFIT_SCHEMA | {weighted_column_name: pl.Int64}
+            )
+
+        # the most that the slots from `depth` onwards could add, summed from the best piece in each slot
+        remaining_bound = [0] * (len(slots) + 1)
+        remaining_stats = [[0] * len(STAT_NAMES) for _ in range(len(slots) + 1)]
+        remaining_artifice = [0] * (len(slots) + 1)
+        for depth in reversed(range(len(slots))):
+            armor_list = slot_lists[depth]
+            remaining_bound[depth] = remaining_bound[depth + 1] + max(
+                piece_bound(armor) for armor in armor_list
+            )
+            remaining_stats[depth] = [
+                remaining + max(getattr(armor, stat) for armor in armor_list)
+                for remaining, stat in zip(remaining_stats[depth + 1], STAT_NAMES)
+            ]
+            remaining_artifice[depth] = remaining_artifice[depth + 1] + max(
+                armor.is_artifice for armor in armor_list
+            )
+
+        def outfit_bound(depth, stats_sum, bound_sum, num_artifice):
+            max_artifice = num_artifice + remaining_artifice[depth]
+            capped_bound = sum(
+                w
+                * min(
+                    self.MAX_USEFUL_STAT,
+                    stat + remaining + self.ARTIFICE_STAT_BONUS * max_artifice,
+                )
+                for w, stat, remaining in zip(
+                    weights, stats_sum, remaining_stats[depth]
+                )
+            )
+            return min(bound_sum + remaining_bound[depth], capped_bound)
+
+        # heap entries are (-bound, tie breaker, depth, armor so far, stat sums, weighted bound so far, artifice count, outfit)
+        # where outfit is only set once a complete outfit has been scored exactly
+        start_stats = (self.FULL_MASTERWORK_STAT_BONUS,) * len(STAT_NAMES)
+        start_bound = sum(weights) * self.FULL_MASTERWORK_STAT_BONUS
+        tie_breaker = count()
+        heap = [
+            (
+                -outfit_bound(0, start_stats, start_bound, 0),
+                next(tie_breaker),
+                0,
+                (),
+                start_stats,
+                start_bound,
+                0,
+                None,
+            )
+        ]
+
+        while len(heap) > 0 and len(top_outfits) < k:
+            _, _, depth, outfit_armor, stats_sum, bound_sum, num_artifice, outfit = (
+                heapq.heappop(heap)
+            )
+
+            if outfit is not None:
+                top_outfits.append(outfit)
+                continue
+
+            if depth == len(slots):
+                # score the best useful tiers this outfit's artifice mods can reach
+                best_score, best_stats = max(
+                    (
+                        sum(w * stat for w, stat in zip(weights, useful_stats)),
+                        useful_stats,
+                    )
+                    for useful_stats in self.artifice_tier_table.useful_stats_permutations(
+                        stats_sum, num_artifice
+                    )
+                )
+                exotic_hash = self.NO_EXOTIC_HASH
+                for armor in outfit_armor:
+                    if armor.is_exotic:
+                        exotic_hash = armor.exotic_hash
+                        break
+                outfit = (
+                    best_stats
+                    + tuple(armor.instance_id for armor in outfit_armor)
+                    + (exotic_hash, num_artifice, best_score)
+                )
+                heapq.heappush(
+                    heap,
+                    (
+                        -best_score,
+                        next(tie_breaker),
+                        depth,
+                        outfit_armor,
+                        stats_sum,
+                        bound_sum,
+                        num_artifice,
+                        outfit,
+                    ),
+                )
+                continue
+
+            for armor in slot_lists[depth]:
+                child_stats = tuple(
+                    stat + getattr(armor, name)
+                    for stat, name in zip(stats_sum, STAT_NAMES)
+                )
+                child_bound = bound_sum + piece_bound(armor)
+                child_artifice = num_artifice + armor.is_artifice
+                heapq.heappush(
+                    heap,
+                    (
+                        -outfit_bound(
+                            depth + 1, child_stats, child_bound, child_artifice
+                        ),
+                        next(tie_breaker),
+                        depth + 1,
+                        outfit_armor + (armor,),
+                        child_stats,
+                        child_bound,
+                        child_artifice,
+                        None,
+                    ),
+                )
+
+        return pl.DataFrame(
+            top_outfits,
+            schema=OUTFIT_SCHEMA | {weighted_column_name: pl.Int64},
+            orient="row",
+        )
 
     def generate_artifice_permutations(self, num_artifice):
         # Generate all permutations artifice mods that could be assigned to each stat
@@ -430,14 +1837,10 @@ class ProfileOutfits:
 
     def round_to_useful_tier(self, stat):
         # stats above 100 aren't useful.  T10 is the highest tier
-        if stat > 100:
-            return 100
-
-        # half tiers can be useful as there are 5 point mods, so we want to round down to the nearest 5
-        # return stat - (stat % 5)
+        if stat > self.MAX_USEFUL_STAT:
+            return self.MAX_USEFUL_STAT
 
-        # EXPERMIENTAL: round to the nearest 10 and ignore half tiers
-        return stat - (stat % 10)
+        return stat - (stat % self.tier_size)
 
     def append_outfit_permutations(
         self, outfits, helmets, gauntlets, chest_armors, leg_armors, class_items
@@ -508,7 +1911,7 @@ class ProfileOutfits:
             exotic_hash = self.NO_EXOTIC_HASH
             for armor in [helmet, gauntlet, chest_armor, leg_armor, class_item]:
                 if armor.is_exotic:
-                    exotic_hash = armor.item_hash
+                    exotic_hash = armor.exotic_hash
                     break
 
             self.append_outfit_permutation(
@@ -565,21 +1968,15 @@ class ProfileOutfits:
                 )
             )
         else:
-            # create a set of stats that we can use to only build outfits with a unique set of stats, some combinations don't create unique useful tiers
+            # only build outfits with a unique set of stats, some combinations don't create unique useful tiers
             # ex: if mobility is 27 adding +3 is the same as adding +6, they both round to 30
-            useful_stats_permutations = set()
-
-            for artifice_bonus in self.artifice_permutations[num_artifice]:
-                useful_stats_permutations.add(
-                    (
-                        self.round_to_useful_tier(mobility + artifice_bonus[0]),
-                        self.round_to_useful_tier(resilience + artifice_bonus[1]),
-                        self.round_to_useful_tier(recovery + artifice_bonus[2]),
-                        self.round_to_useful_tier(discipline + artifice_bonus[3]),
-                        self.round_to_useful_tier(intellect + artifice_bonus[4]),
-                        self.round_to_useful_tier(strength + artifice_bonus[5]),
-                    )
+            # the artifice tier table finds the distinct tiers directly instead of rounding every artifice permutation
+            useful_stats_permutations = (
+                self.artifice_tier_table.useful_stats_permutations(
+                    (mobility, resilience, recovery, discipline, intellect, strength),
+                    num_artifice,
                 )
+            )
             for useful_stats in useful_stats_permutations:
                 outfits.append(
                     (
@@ -600,61 +1997,659 @@ class ProfileOutfits:
                 )
 
     # identify all non-class item armor that has the same or worse stats than another piece of armor of the same rarity and type
-    def find_eclipsed_armor(self):
-        eclipsed_armor = []
-        armor_list = [
-            armor for armor in list(self.armor_dict.values()) if not armor.ignored
-        ]
-
+    # returns (lesser, greater) pairs in the order a walk over every pair of armor sorted by power would find them
+    #
+    # `dominance` is how pieces are compared:
+    #   "stats" - every stat of the lesser piece is at most the same stat of the greater piece
+    #   "tiers" - the same rule as `prune_dominated_armor`, the greater piece never rounds to a lower useful tier for any
+    #             stat the rest of a class's outfit can reach, and it has to cover the lesser piece's +3 artifice bonus
+    #             when only the lesser piece is artifice.  Stats past a tier that can't be reached don't count, but an
+    #             artifice piece is no longer eclipsed by a non-artifice piece that only matches its stats
+    def find_eclipsed_armor(self, dominance="stats"):
+        if dominance not in ("stats", "tiers"):
+            raise ValueError(f"Unknown dominance {dominance}, use 'stats' or 'tiers'")
+
+        armor_table = self.armor_table
+        rows = np.flatnonzero(
+            ~armor_table.ignored & (armor_table.slots != "Class Item")
+        )
         # sort by power level, low to high
-        armor_list.sort(key=lambda x: x.power)
+        rows = rows[np.argsort(armor_table.power[rows], kind="stable")]
 
-        for i, armor in enumerate(armor_list):
-            if armor.slot == "Class Item":
-                continue
-            for other_armor in armor_list[i + 1 :]:
-                if armor.rarity != other_armor.rarity:
-                    continue
-                # only compare exotic armor pieces that are the same item
-                if (
-                    armor.rarity == "Exotic"
-                    and armor.item_hash != other_armor.item_hash
-                ):
-                    continue
-                if (
-                    armor.class_slot == other_armor.class_slot
-                    and armor.instance_id != other_armor.instance_id
-                ):
-                    if (
-                        armor.mobility <= other_armor.mobility
-                        and armor.resilience <= other_armor.resilience
-                        and armor.recovery <= other_armor.recovery
-                        and armor.discipline <= other_armor.discipline
-                        and armor.intellect <= other_armor.intellect
-                        and armor.strength <= other_armor.strength
-                    ):
-                        eclipsed_armor.append((armor, other_armor))
-                    elif (
-                        other_armor.mobility <= armor.mobility
-                        and other_armor.resilience <= armor.resilience
-                        and other_armor.recovery <= armor.recovery
-                        and other_armor.discipline <= armor.discipline
-                        and other_armor.intellect <= armor.intellect
-                        and other_armor.strength <= armor.strength
-                    ):
-                        eclipsed_armor.append((other_armor, armor))
-        return eclipsed_armor
+        # only compare armor of the same class, slot and rarity, and exotic armor pieces that are the same item
+        groups = defaultdict(list)
+        for position, row in enumerate(rows.tolist()):
+            groups[
+                (
+                    armor_table.d2_classes[row],
+                    armor_table.slots[row],
+                    armor_table.rarities[row],
+                    armor_table.item_hashes[row] if armor_table.is_exotic[row] else 0,
+                )
+            ].append(position)
+
+        never_lower_tier_tables = {}
+        eclipsed_pairs = []
+        for (d2_class, slot, _, _), positions in groups.items():
+            positions = np.array(positions)
+            group_rows = rows[positions]
+            if dominance == "stats":
+                at_most = self.__stats_at_most(armor_table.stats[group_rows])
+            else:
+                if (d2_class, slot) not in never_lower_tier_tables:
+                    never_lower_tier_tables[d2_class, slot] = (
+                        self.__never_lower_tier_tables(d2_class, slot)
+                    )
+                at_most = self.__tiers_at_most(
+                    armor_table.stats[group_rows],
+                    armor_table.is_artifice[group_rows],
+                    never_lower_tier_tables[d2_class, slot],
+                )
+            first, second = np.triu_indices(len(positions), k=1)
+            first_lesser = at_most[first, second]
+            eclipsed = first_lesser | at_most[second, first]
+            first, second, first_lesser = (
+                first[eclipsed],
+                second[eclipsed],
+                first_lesser[eclipsed],
+            )
+            lesser = np.where(first_lesser, first, second)
+            greater = np.where(first_lesser, second, first)
+            eclipsed_pairs.extend(
+                zip(
+                    positions[first].tolist(),
+                    positions[second].tolist(),
+                    group_rows[lesser].tolist(),
+                    group_rows[greater].tolist(),
+                )
+            )
+
+        eclipsed_pairs.sort()
+        return [
+            (
+                self.armor_dict[int(armor_table.instance_ids[lesser])],
+                self.armor_dict[int(armor_table.instance_ids[greater])],
+            )
+            for _, _, lesser, greater in eclipsed_pairs
+        ]
+
+    # at_most[a, b] is True when every stat of a is <= the same stat of b
+    #
+    # a can only be at most b when b has at least a's total stats, so with the pieces sorted by total stats, high to
+    # low, each block of pieces is only compared with the pieces up to the last one with its lowest total.  Blocks keep
+    # the (block, n, 6) comparison small for big groups
+    def __stats_at_most(self, stats, block_size=256):
+        order = np.argsort(-stats.sum(axis=1), kind="stable")
+        sorted_stats = stats[order]
+        sorted_totals = sorted_stats.sum(axis=1)
+
+        sorted_at_most = np.zeros((len(stats), len(stats)), dtype=bool)
+        for start in range(0, len(stats), block_size):
+            stop = min(start + block_size, len(stats))
+            end = np.searchsorted(-sorted_totals, -sorted_totals[stop - 1], "right")
+            sorted_at_most[start:stop, :end] = (
+                sorted_stats[start:stop, None, :] <= sorted_stats[None, :end, :]
+            ).all(axis=2)
+
+        at_most = np.empty_like(sorted_at_most)
+        at_most[np.ix_(order, order)] = sorted_at_most
+        return at_most
+
+    # at_most[a, b] is True when b never rounds to a lower tier than a in any stat, see `find_eclipsed_armor`
+    def __tiers_at_most(self, stats, is_artifice, never_lower_tier, block_size=256):
+        at_most = np.zeros((len(stats), len(stats)), dtype=bool)
+        for start in range(0, len(stats), block_size):
+            stop = min(start + block_size, len(stats))
+            artifice_bonus = self.ARTIFICE_STAT_BONUS * (
+                is_artifice[start:stop, None] & ~is_artifice[None, :]
+            )
+            at_most[start:stop] = np.logical_and.reduce(
+                [
+                    never_lower_tier[i][
+                        stats[start:stop, None, i] + artifice_bonus, stats[None, :, i]
+                    ]
+                    for i in range(len(STAT_NAMES))
+                ]
+            )
+        return at_most
+
+    # for each stat, never_lower_tier[lesser, greater] is True when adding `greater` to any value the rest of a
+    # `d2_class` outfit can reach for `slot` never rounds to a lower useful tier than adding `lesser`
+    def __never_lower_tier_tables(self, d2_class, slot):
+        exotic_armor, non_exotic_armor = self.filter_and_group_armor(d2_class)
+        reachable_stats = self.__reachable_partner_stats(
+            slot, exotic_armor, non_exotic_armor
+        )
+        piece_values = np.arange(
+            int(self.armor_table.stats.max(initial=0)) + self.ARTIFICE_STAT_BONUS + 1
+        )
+        tables = []
+        for stat in STAT_NAMES:
+            tiers = round_to_useful_tiers(
+                piece_values[:, None] + np.array(reachable_stats[stat]),
+                self.tier_size,
+                self.MAX_USEFUL_STAT,
+            )
+            tables.append((tiers[None, :, :] >= tiers[:, None, :]).all(axis=2))
+        return tables
 
 
 class PinnacleOutfits:
-    def __init__(self, outfits):
+    # `equivalent_armor` is `ProfileOutfits.equivalent_armor` when the outfits were generated with
+    # `collapse_equivalent_armor`, the pinnacle outfits are expanded back to every equivalent piece of armor
+    # so the report sees all of them.  The other tables keep the representative instance_ids
+    #
+    # compact outfit tables (see ProfileOutfits `compact_outfits`) keep their narrow types throughout, they need the
+    # `armor_table` they were generated from so the pinnacle outfits get their instance ids back for the report, without
+    # it they raise a ValueError
+    # the `weighted_*` columns weigh every combination of this many stats by `STAT_WEIGHT`
+    WEIGHTED_STAT_COUNT = 3
+    STAT_WEIGHT = 2
+
+    # an Instrumentation passed to `__init__`, `from_batches` or `from_two_passes` records how long building the
+    # pinnacle outfits took and how many rows went in and came out, see src/instrumentation.py
+    instrumentation = NO_INSTRUMENTATION
+
+    def __init__(
+        self, outfits, equivalent_armor=None, armor_table=None, instrumentation=None
+    ):
         self.outfits = outfits
-        weighted_outfits_df = self.__generate_weighted_outfits_df(outfits)
-        self.weighted_outfits_max_df = self.__weighted_outfits_max(weighted_outfits_df)
+        self.equivalent_armor = equivalent_armor
+        self.armor_table = armor_table
+        self.instrumentation = instrumentation or NO_INSTRUMENTATION
+        with self.instrumentation.stage("PinnacleOutfits"):
+            weighted_outfits_df = self.__generate_weighted_outfits_df(outfits)
+            if self.instrumentation.enabled:
+                self.instrumentation.count(
+                    outfits=len(weighted_outfits_df),
+                    outfits_per_exotic=rows_per_exotic(
+                        weighted_outfits_df["exotic_hash"]
+                    ),
+                )
+            self.__set_pinnacle_outfits(
+                weighted_outfits_df, self.__weighted_outfits_max(weighted_outfits_df)
+            )
+
+    # build the pinnacle outfits from an iterator of outfit table batches, such as `generate_class_outfit_batches`
+    # the max for each weighted column only goes up as batches arrive, so rows below the running max can never be
+    # pinnacle and are dropped as soon as they are seen.  `weighted_outfits_df` only holds the rows that were
+    # at the max when the batches ran out rather than every outfit
+    @classmethod
+    def from_batches(
+        cls,
+        outfit_batches,
+        equivalent_armor=None,
+        armor_table=None,
+        instrumentation=None,
+    ):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+        pinnacle_outfits.instrumentation = instrumentation or NO_INSTRUMENTATION
+
+        with pinnacle_outfits.instrumentation.stage("PinnacleOutfits.from_batches"):
+            batches = 0
+            outfits = 0
+            weighted_outfits_max_df = None
+            candidate_outfits_df = None
+            for outfits_batch in outfit_batches:
+                weighted_batch_df = pinnacle_outfits.__generate_weighted_outfits_df(
+                    outfits_batch
+                )
+                batches += 1
+                outfits += len(weighted_batch_df)
+                weighted_outfits_max_df = pinnacle_outfits.__running_outfits_max(
+                    weighted_outfits_max_df, weighted_batch_df
+                )
+
+                if candidate_outfits_df is None:
+                    candidate_outfits_df = weighted_batch_df
+                else:
+                    candidate_outfits_df = pl.concat(
+                        [candidate_outfits_df, weighted_batch_df]
+                    )
+
+                candidate_outfits_df = pinnacle_outfits.__outfits_at_max(
+                    candidate_outfits_df, weighted_outfits_max_df
+                )
+
+            if candidate_outfits_df is None:
+                candidate_outfits_df = pinnacle_outfits.__generate_weighted_outfits_df(
+                    empty_outfits_df()
+                )
+                weighted_outfits_max_df = pinnacle_outfits.__weighted_outfits_max(
+                    candidate_outfits_df
+                )
+
+            pinnacle_outfits.instrumentation.count(
+                batches=batches,
+                outfits=outfits,
+                candidate_outfits=len(candidate_outfits_df),
+            )
+            pinnacle_outfits.__set_pinnacle_outfits(
+                candidate_outfits_df, weighted_outfits_max_df
+            )
+        return pinnacle_outfits
+
+    # build the pinnacle outfits by enumerating the outfits twice, `outfit_batches_factory` is called once per pass
+    # and must return a fresh iterator of outfit table batches each time, ex:
+    #
+    #   PinnacleOutfits.from_two_passes(lambda: profile_outfits.generate_class_outfit_batches("Warlock", True))
+    #
+    # the first pass only keeps the max of each weighted column for each exotic, the second pass keeps the rows that
+    # hit one of those maximums.  Memory is bounded by the number of pinnacle outfits rather than the number of outfits
+    # at the cost of enumerating every outfit twice.  `weighted_outfits_df` only holds the pinnacle outfits
+    @classmethod
+    def from_two_passes(
+        cls,
+        outfit_batches_factory,
+        equivalent_armor=None,
+        armor_table=None,
+        instrumentation=None,
+    ):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+        pinnacle_outfits.instrumentation = instrumentation or NO_INSTRUMENTATION
+
+        with pinnacle_outfits.instrumentation.stage("PinnacleOutfits.from_two_passes"):
+            batches = 0
+            outfits = 0
+            weighted_outfits_max_df = None
+            for outfits_batch in outfit_batches_factory():
+                weighted_batch_df = pinnacle_outfits.__generate_weighted_outfits_df(
+                    outfits_batch
+                )
+                batches += 1
+                outfits += len(weighted_batch_df)
+                weighted_outfits_max_df = pinnacle_outfits.__running_outfits_max(
+                    weighted_outfits_max_df, weighted_batch_df
+                )
+
+            if weighted_outfits_max_df is None:
+                return cls.from_batches(
+                    [], equivalent_armor, armor_table, instrumentation
+                )
+
+            candidate_outfits_df = pl.concat(
+                pinnacle_outfits.__outfits_at_max(
+                    pinnacle_outfits.__generate_weighted_outfits_df(outfits_batch),
+                    weighted_outfits_max_df,
+                )
+                for outfits_batch in outfit_batches_factory()
+            )
+
+            pinnacle_outfits.instrumentation.count(
+                batches=batches,
+                outfits=outfits,
+                candidate_outfits=len(candidate_outfits_df),
+            )
+            pinnacle_outfits.__set_pinnacle_outfits(
+                candidate_outfits_df, weighted_outfits_max_df
+            )
+        return pinnacle_outfits
+
+    # build the pinnacle outfits with a single lazy polars plan over an outfit table or LazyFrame
+    # the max of each weighted column for each exotic is a window expression next to the weighted columns rather than a
+    # group by and join, and polars runs the weighting, maximums and pinnacle filter together with `engine`, which
+    # defaults to its streaming engine.  Only `pinnacle_outfits_df` is kept, it has the weighted columns and their
+    # `weighted_*_max` columns.  `keep_intermediates` also collects `weighted_outfits_df` and `weighted_outfits_max_df`
+    # for poking at in the notebook
+    @classmethod
+    def from_lazy(
+        cls,
+        outfits,
+        equivalent_armor=None,
+        armor_table=None,
+        engine="streaming",
+        keep_intermediates=False,
+    ):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+
+        if isinstance(outfits, pl.DataFrame):
+            outfits = outfits.lazy()
+        weighted_outfits_lf = pinnacle_outfits.__generate_weighted_outfits_df(
+            outfits
+        ).lazy()
+        weighted_columns = [
+            column_name
+            for column_name in weighted_outfits_lf.collect_schema().names()
+            if column_name.startswith("weighted_")
+        ]
+        windowed_outfits_lf = weighted_outfits_lf.with_columns(
+            col(column_name).max().over("exotic_hash").alias(f"{column_name}_max")
+            for column_name in weighted_columns
+        )
+
+        pinnacle_outfits.__set_report_pinnacle_outfits(
+            pinnacle_outfits.__pinnacle_outfits_df(windowed_outfits_lf).collect(
+                engine=engine
+            )
+        )
+
+        if keep_intermediates:
+            pinnacle_outfits.weighted_outfits_df = windowed_outfits_lf.collect(
+                engine=engine
+            )
+            pinnacle_outfits.weighted_outfits_max_df = (
+                weighted_outfits_lf.group_by("exotic_hash")
+                .agg(col(column_name).max() for column_name in weighted_columns)
+                .collect(engine=engine)
+            )
+        else:
+            pinnacle_outfits.weighted_outfits_df = None
+            pinnacle_outfits.weighted_outfits_max_df = None
+
+        return pinnacle_outfits
+
+    # build the pinnacle outfits for many weighting schemes at once, `weight_matrix` has a row of 6 stat weights for each
+    # scheme and defaults to every 1, 2, 3 and 4 stat combination at a weight of 2 (see `weighting_schemes`).  Scheme
+    # names need to start with "weighted_", they default to "weighted_scheme_<row>" for a custom `weight_matrix`
+    #
+    # every scheme is scored with one integer matrix product per chunk of outfits instead of a polars column per scheme.
+    # `pinnacle_outfits_df` has the outfits that are pinnacle for any scheme, with a score column and a `_max` column for
+    # each scheme, so the report works the same.  `weighted_outfits_max_df` has the max score of each scheme per exotic,
+    # and `weighted_outfits_df` isn't kept.  See `scheme_pinnacle_outfits_df` and `armor_pinnacle_scheme_counts`
+    @classmethod
+    def from_weight_matrix(
+        cls,
+        outfits,
+        weight_matrix=None,
+        scheme_names=None,
+        equivalent_armor=None,
+        armor_table=None,
+    ):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+
+        if weight_matrix is None:
+            scheme_names, weight_matrix = weighting_schemes()
+        elif scheme_names is None:
+            scheme_names = [f"weighted_scheme_{i}" for i in range(len(weight_matrix))]
+        weight_matrix = np.asarray(weight_matrix)
+        pinnacle_outfits.scheme_names = list(scheme_names)
+
+        if isinstance(outfits, pl.DataFrame):
+            outfits_df = outfits.select(OUTFIT_COLUMNS)
+        else:
+            outfits_df = pl.DataFrame(outfits, schema=OUTFIT_SCHEMA, orient="row")
+
+        exotic_hashes, scheme_maxima, pinnacle_rows, pinnacle_scores = (
+            scheme_pinnacle_rows(
+                outfits_df.select(STAT_NAMES).to_numpy(),
+                outfits_df["exotic_hash"].to_numpy(),
+                weight_matrix,
+            )
+        )
+
+        pinnacle_outfits.weighted_outfits_max_df = pl.DataFrame(
+            [pl.Series("exotic_hash", exotic_hashes, dtype=pl.Int64)]
+            + [
+                pl.Series(scheme_name, scheme_maxima[:, i], dtype=pl.Int32)
+                for i, scheme_name in enumerate(scheme_names)
+            ]
+        )
+        pinnacle_outfits.weighted_outfits_df = None
+
+        scored_pinnacle_outfits_df = outfits_df[pinnacle_rows].with_columns(
+            pl.Series(scheme_name, pinnacle_scores[:, i], dtype=pl.Int32)
+            for i, scheme_name in enumerate(scheme_names)
+        )
+        pinnacle_outfits.__set_report_pinnacle_outfits(
+            pinnacle_outfits.__pinnacle_outfits_df(
+                pinnacle_outfits.__joined_outfits_max(
+                    scored_pinnacle_outfits_df,
+                    pinnacle_outfits.weighted_outfits_max_df,
+                )
+            )
+        )
+        return pinnacle_outfits
+
+    # the pinnacle outfits of a single weighted column or weighting scheme, ex: "weighted_mobility_resilience_recovery"
+    def scheme_pinnacle_outfits_df(self, scheme_name):
+        return self.pinnacle_outfits_df.filter(
+            col(scheme_name) == col(f"{scheme_name}_max")
+        )
+
+    # the number of weighted columns or weighting schemes each armor piece is in a pinnacle outfit for
+    # an armor piece with a high count is pinnacle no matter how the stats are weighted, one with a low count
+    # depends on a particular weighting.  Returns `instance_id` and `pinnacle_scheme_count` columns, highest count first
+    def armor_pinnacle_scheme_counts(self):
+        scheme_names = [
+            column_name
+            for column_name in self.pinnacle_outfits_df.columns
+            if column_name.startswith("weighted_") and not column_name.endswith("_max")
+        ]
+        at_max_df = self.pinnacle_outfits_df.select(
+            *SLOT_COLUMNS,
+            *(
+                col(scheme_name) == col(f"{scheme_name}_max")
+                for scheme_name in scheme_names
+            ),
+        )
+        slot_at_max_dfs = [
+            at_max_df.group_by(slot_column)
+            .agg(col(scheme_names).any())
+            .rename({slot_column: "instance_id"})
+            for slot_column in SLOT_COLUMNS
+        ]
+        return (
+            pl.concat(slot_at_max_dfs)
+            .group_by("instance_id")
+            .agg(col(scheme_names).any())
+            .select(
+                "instance_id",
+                pl.sum_horizontal(scheme_names).alias("pinnacle_scheme_count"),
+            )
+            .sort(["pinnacle_scheme_count", "instance_id"], descending=[True, False])
+        )
+
+    # the pinnacle outfits after the vault changed, from `ProfileOutfits.generate_class_outfits_update`
+    # this needs `weighted_outfits_df` to hold every outfit, as it does when built by `PinnacleOutfits(outfits)`,
+    # `read_state`, `updated` or `from_lazy` with `keep_intermediates`
+    def updated(
+        self,
+        added_outfits,
+        removed_instance_ids,
+        equivalent_armor=None,
+        armor_table=None,
+    ):
+        if self.weighted_outfits_df is None:
+            raise ValueError("updated needs a PinnacleOutfits that kept every outfit")
+
+        pinnacle_outfits = PinnacleOutfits.__new__(PinnacleOutfits)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+        pinnacle_outfits.__set_pinnacle_outfits(
+            *pinnacle_outfits.__updated_outfits(
+                self.weighted_outfits_df.select(
+                    column_name
+                    for column_name in self.weighted_outfits_df.columns
+                    if not column_name.endswith("_max")
+                ),
+                self.weighted_outfits_max_df,
+                added_outfits,
+                removed_instance_ids,
+            )
+        )
+        return pinnacle_outfits
+
+    # save every outfit and the max of each weighted column per exotic to `state_directory` for `read_state`
+    # weighing the outfits again when they are read is quicker than writing and reading all of the weighted columns
+    def write_state(self, state_directory):
+        if self.weighted_outfits_df is None:
+            raise ValueError(
+                "write_state needs a PinnacleOutfits that kept every outfit"
+            )
+
+        os.makedirs(state_directory, exist_ok=True)
+        self.weighted_outfits_df.select(OUTFIT_COLUMNS).write_parquet(
+            os.path.join(state_directory, "outfits.parquet")
+        )
+        self.weighted_outfits_max_df.write_parquet(
+            os.path.join(state_directory, "weighted_outfits_max.parquet")
+        )
+
+    # the PinnacleOutfits saved by `write_state`.  Passing the `added_outfits` and `removed_instance_ids` of a vault
+    # change gives the same result as calling `updated` on it, without finding the saved pinnacle outfits first
+    @classmethod
+    def read_state(
+        cls,
+        state_directory,
+        equivalent_armor=None,
+        armor_table=None,
+        added_outfits=None,
+        removed_instance_ids=(),
+    ):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.outfits = None
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+
+        weighted_outfits_df = pinnacle_outfits.__generate_weighted_outfits_df(
+            pl.read_parquet(os.path.join(state_directory, "outfits.parquet"))
+        )
+        weighted_outfits_max_df = pl.read_parquet(
+            os.path.join(state_directory, "weighted_outfits_max.parquet")
+        )
+        if added_outfits is not None or len(removed_instance_ids) > 0:
+            weighted_outfits_df, weighted_outfits_max_df = (
+                pinnacle_outfits.__updated_outfits(
+                    weighted_outfits_df,
+                    weighted_outfits_max_df,
+                    empty_outfits_df() if added_outfits is None else added_outfits,
+                    removed_instance_ids,
+                )
+            )
+        pinnacle_outfits.__set_pinnacle_outfits(
+            weighted_outfits_df, weighted_outfits_max_df
+        )
+        return pinnacle_outfits
+
+    # the tables of a PinnacleOutfits that kept every outfit, by name, ex: for saving them in an OutfitCache
+    def frames(self):
+        if self.weighted_outfits_df is None:
+            raise ValueError("frames needs a PinnacleOutfits that kept every outfit")
+
+        return {
+            "weighted_outfits": self.weighted_outfits_df,
+            "weighted_outfits_max": self.weighted_outfits_max_df,
+            "pinnacle_outfits": self.pinnacle_outfits_df,
+        }
+
+    # the PinnacleOutfits with the tables from `frames`, nothing is weighed or joined again
+    @classmethod
+    def from_frames(cls, frames, equivalent_armor=None, armor_table=None):
+        pinnacle_outfits = cls.__new__(cls)
+        pinnacle_outfits.equivalent_armor = equivalent_armor
+        pinnacle_outfits.armor_table = armor_table
+        pinnacle_outfits.weighted_outfits_df = frames["weighted_outfits"]
+        pinnacle_outfits.weighted_outfits_max_df = frames["weighted_outfits_max"]
+        pinnacle_outfits.pinnacle_outfits_df = frames["pinnacle_outfits"]
+        pinnacle_outfits.outfits = pinnacle_outfits.weighted_outfits_df.select(
+            OUTFIT_COLUMNS
+        )
+        return pinnacle_outfits
+
+    # outfits with a removed piece are dropped and the added outfits are weighted, every other outfit keeps its weights.
+    # An exotic's max only has to be found again from its outfits when one of them was dropped, otherwise it is the
+    # larger of its old max and the max of its added outfits
+    def __updated_outfits(
+        self,
+        weighted_outfits_df,
+        weighted_outfits_max_df,
+        added_outfits,
+        removed_instance_ids,
+    ):
+        removed = pl.any_horizontal(
+            col(slot_column).is_in(removed_instance_ids) for slot_column in SLOT_COLUMNS
+        )
+        changed_exotics = col("exotic_hash").is_in(
+            weighted_outfits_df.filter(removed)["exotic_hash"].unique().implode()
+        )
+        kept_outfits_df = weighted_outfits_df.filter(~removed)
+        added_outfits_df = self.__generate_weighted_outfits_df(added_outfits).select(
+            weighted_outfits_df.columns
+        )
+
+        max_columns = weighted_outfits_max_df.columns
+        weighted_outfits_max_df = self.__weighted_outfits_max(
+            pl.concat(
+                [
+                    weighted_outfits_max_df.filter(~changed_exotics),
+                    self.__weighted_outfits_max(added_outfits_df).select(max_columns),
+                    self.__weighted_outfits_max(
+                        kept_outfits_df.filter(changed_exotics)
+                    ).select(max_columns),
+                ]
+            )
+        )
+        return (
+            pl.concat([kept_outfits_df, added_outfits_df]),
+            weighted_outfits_max_df,
+        )
+
+    # fold the max of a batch of weighted outfits into the max of the batches seen so far
+    def __running_outfits_max(self, weighted_outfits_max_df, weighted_batch_df):
+        batch_max_df = self.__weighted_outfits_max(weighted_batch_df)
+        if weighted_outfits_max_df is None:
+            return batch_max_df
+        return self.__weighted_outfits_max(
+            pl.concat([weighted_outfits_max_df, batch_max_df])
+        )
+
+    # only keep the weighted outfits that are at the max of at least one weighted column for their exotic
+    def __outfits_at_max(self, weighted_outfits_df, weighted_outfits_max_df):
+        return (
+            self.__joined_outfits_max(weighted_outfits_df, weighted_outfits_max_df)
+            .filter(self.__pinnacle_condition(weighted_outfits_df.columns))
+            .select(weighted_outfits_df.columns)
+        )
+
+    def __set_pinnacle_outfits(self, weighted_outfits_df, weighted_outfits_max_df):
+        self.weighted_outfits_max_df = weighted_outfits_max_df
         self.weighted_outfits_df = self.__joined_outfits_max(
-            weighted_outfits_df, self.weighted_outfits_max_df
+            weighted_outfits_df, weighted_outfits_max_df
+        )
+        self.__set_report_pinnacle_outfits(
+            self.__pinnacle_outfits_df(self.weighted_outfits_df)
         )
-        self.pinnacle_outfits_df = self.__pinnacle_outfits_df(self.weighted_outfits_df)
+
+    # compact outfit tables have ArmorTable rows in their slot columns, they can't be turned into instance ids without it
+    def __check_armor_table(self):
+        if self.armor_table is None:
+            raise ValueError(
+                "compact outfit tables need the armor_table they were generated from"
+            )
+
+    # the pinnacle outfits the report sees, with instance ids and every equivalent piece of armor
+    def __set_report_pinnacle_outfits(self, pinnacle_outfits_df):
+        if is_compact_outfits_df(pinnacle_outfits_df):
+            self.__check_armor_table()
+            pinnacle_outfits_df = restore_instance_ids(
+                pinnacle_outfits_df, self.armor_table.instance_ids
+            )
+        if self.equivalent_armor:
+            pinnacle_outfits_df = expand_equivalent_outfits(
+                pinnacle_outfits_df, self.equivalent_armor
+            )
+        self.pinnacle_outfits_df = pinnacle_outfits_df
+
+        if self.instrumentation.enabled:
+            self.instrumentation.count(
+                pinnacle_outfits=len(pinnacle_outfits_df),
+                pinnacle_outfits_per_exotic=rows_per_exotic(
+                    pinnacle_outfits_df["exotic_hash"]
+                ),
+            )
 
     # Create weighted columns for stat combinations, this weight is used to determine how much that stat is worth in that combination
     # adding that stat to all other stats to determine the outfits worth for that combo
@@ -664,39 +2659,28 @@ class PinnacleOutfits:
     # `stat_count` is the number of stats we want to combine in a weighted sum.
     # a value of `3` (the default) would give us all 3 stat combos: mob/res/rec, mob/res/dis, mob/res/int, ...
     # `weight` is how much we want to value the stats associated with the weighted column over unweighted stats
-    def __generate_weighted_outfits_df(self, outfits, stat_count=3, weight=2):
-        column_names = [
-            "mobility",
-            "resilience",
-            "recovery",
-            "discipline",
-            "intellect",
-            "strength",
-            "helmet",
-            "gauntlets",
-            "chest_armor",
-            "leg_armor",
-            "class_item",
-            "exotic_hash",
-            "num_artifice",
-        ]
-
-        schema = {}
-
-        for column_name in column_names:
-            schema[column_name] = pl.Int64
-
-        outfits_df = pl.DataFrame(outfits, schema=schema, orient="row")
+    #
+    # `outfits` is either the list of outfit tuples from `generate_class_outfits` or the outfit table from `generate_class_outfits_df`
+    def __generate_weighted_outfits_df(
+        self, outfits, stat_count=WEIGHTED_STAT_COUNT, weight=STAT_WEIGHT
+    ):
+        if isinstance(outfits, (pl.DataFrame, pl.LazyFrame)):
+            # compact outfits keep their narrow types, the weighted sums are widened just enough to not overflow
+            if is_compact_outfits_df(outfits):
+                self.__check_armor_table()
+                schema, weighted_dtype = COMPACT_OUTFIT_SCHEMA, COMPACT_WEIGHTED_DTYPE
+            else:
+                schema, weighted_dtype = OUTFIT_SCHEMA, pl.Int64
+            outfits_df = outfits.select(
+                col(column_name).cast(schema[column_name])
+                for column_name in OUTFIT_COLUMNS
+            )
+        else:
+            weighted_dtype = pl.Int64
+            outfits_df = pl.DataFrame(outfits, schema=OUTFIT_SCHEMA, orient="row")
 
         # the stats that can be weighted
-        stats = [
-            "mobility",
-            "resilience",
-            "recovery",
-            "discipline",
-            "intellect",
-            "strength",
-        ]
+        stats = STAT_NAMES
 
         # Generate the weighted columns for each combination
         weighted_columns = []
@@ -706,7 +2690,12 @@ class PinnacleOutfits:
         for combo in combos:
             # Create a list of the column expressions for the weighted sum
             column_exprs = [
-                (col(stat) * weight if stat in combo else col(stat)) for stat in stats
+                (
+                    col(stat).cast(weighted_dtype) * weight
+                    if stat in combo
+                    else col(stat).cast(weighted_dtype)
+                )
+                for stat in stats
             ]
 
             # Create the alias for the weighted column
@@ -726,13 +2715,12 @@ class PinnacleOutfits:
             weighted_outfits_max_df, on="exotic_hash", suffix="_max"
         )
 
-    def __pinnacle_outfits_df(self, joined_outfits_df):
-        # filter the original DataFrame to only include rows where it has any `weighted_*` column that matches the max value for that exotic_hash
-
+    # a condition that is True if any `weighted_*` column matches its `weighted_*_max` column
+    def __pinnacle_condition(self, columns):
         # Get the column names starting with 'weighted_' and don't end in '_max'
         weighted_columns = [
             col
-            for col in joined_outfits_df.columns
+            for col in columns
             if (col.startswith("weighted_") and not col.endswith("_max"))
         ]
 
@@ -746,14 +2734,22 @@ class PinnacleOutfits:
         for condition in conditions[1:]:
             combined_condition = combined_condition | condition
 
+        return combined_condition
+
+    def __pinnacle_outfits_df(self, joined_outfits_df):
+        # filter the original DataFrame to only include rows where it has any `weighted_*` column that matches the max value for that exotic_hash
+
         # filter rows where the outfit has at least one column that is the max value for that exotic
-        pinnacle_outfits_df = joined_outfits_df.filter(combined_condition)
-        # eclipsed_outfits_df = joined_outfits_df.filter(~combined_condition)
+        pinnacle_outfits_df = joined_outfits_df.filter(
+            self.__pinnacle_condition(joined_outfits_df.collect_schema().names())
+        )
+        # eclipsed_outfits_df = joined_outfits_df.filter(~self.__pinnacle_condition(joined_outfits_df.columns))
 
         # add a total_stats column to the dataframe that sums mobility, resilience, recovery, discipline, intellect, and strength
+        # the cast keeps compact 8 bit stats from overflowing
         pinnacle_outfits_df = pinnacle_outfits_df.with_columns(
             (
-                col("mobility")
+                col("mobility").cast(pl.Int64)
                 + col("resilience")
                 + col("recovery")
                 + col("discipline")
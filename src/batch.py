@@ -0,0 +1,293 @@
+# headless version of the d2armor.ipynb pipeline for scheduled jobs, run it from the repo root with
+#
+#   python -m src.batch
+#
+# it loads the profile and definitions downloaded by d2profile.ipynb, flags the armor in ignored-armor.json, then runs
+# every class in its own process and writes an armor-report-<class>.json for each, printing the wall time of every stage
+#
+# polars is only imported by the functions that use it: worker processes import this module before `init_worker` runs,
+# and polars sizes its thread pool from POLARS_MAX_THREADS when it is imported
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from src.instrumentation import Instrumentation
+
+D2_CLASSES = ["Hunter", "Titan", "Warlock"]
+
+
+# records the wall time of the `with` block in `stage_times[stage]`
+@contextmanager
+def timed(stage_times, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[stage] = time.perf_counter() - start
+
+
+def read_json(path):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+# the armor in the profile, keyed by instance_id, with `ignored` set on every piece
+def load_armor_dict(data_directory, stage_times):
+    from src.armor import ProfileArmor
+
+    with timed(stage_times, "load profile"):
+        for file_name in [
+            "profile.json",
+            "item_definitions.json",
+            "stat_definitions.json",
+        ]:
+            assert os.path.exists(os.path.join(data_directory, file_name)), (
+                f"{file_name} not found in {data_directory}. Run the d2profile.ipynb notebook first to generate it."
+            )
+        profile = read_json(os.path.join(data_directory, "profile.json"))
+        item_definitions = read_json(
+            os.path.join(data_directory, "item_definitions.json")
+        )
+        stat_definitions = read_json(
+            os.path.join(data_directory, "stat_definitions.json")
+        )
+    print("Character profile loaded at:", profile["responseMintedTimestamp"])
+
+    with timed(stage_times, "extract armor"):
+        armor_dict = ProfileArmor(
+            profile, item_definitions, stat_definitions
+        ).get_armor_dict()
+
+    with timed(stage_times, "flag ignored armor"):
+        ignored_count = flag_ignored_armor(
+            armor_dict, os.path.join(data_directory, "ignored-armor.json")
+        )
+    print(f"Found {ignored_count} current armor pieces to ignore.")
+
+    return armor_dict
+
+
+# sets `ignored` on every piece of armor from a list of objects with an `instance_id`, see d2armor.ipynb for the format
+# the report reads `ignored`, so armor is flagged as not ignored when there is no ignored armor file
+def flag_ignored_armor(armor_dict, ignored_armor_path):
+    ignored_ids = set()
+    if os.path.exists(ignored_armor_path):
+        ignored_ids = {armor["instance_id"] for armor in read_json(ignored_armor_path)}
+
+    for armor in armor_dict.values():
+        armor.ignored = armor.instance_id in ignored_ids
+    return sum(armor.ignored for armor in armor_dict.values())
+
+
+# generate the outfits, pinnacle outfits and json report of one class, returns the wall time of each stage
+# with a `cache_directory` the pinnacle outfits come from an OutfitCache when the class' armor hasn't changed, and with
+# a `metrics_directory` the Instrumentation of every stage is appended to metrics-<class>.jsonl in it
+# with a `memory_budget` in bytes the outfits are streamed when holding all of them wouldn't fit, and a class that
+# doesn't fit either way fails before enumerating anything, see `ProfileOutfits.class_pinnacle_outfits`.  Cache misses
+# are planned the same way
+def run_class(
+    d2_class,
+    armor_dict,
+    include_ignored_armor=True,
+    report_directory="data",
+    cache_directory=None,
+    metrics_directory=None,
+    memory_budget=None,
+):
+    from src import report
+    from src.armor import PinnacleOutfits, ProfileOutfits
+    from src.outfit_cache import OutfitCache
+
+    stage_times = {}
+    instrumentation = None
+    if metrics_directory is not None:
+        os.makedirs(metrics_directory, exist_ok=True)
+        instrumentation = Instrumentation(
+            os.path.join(metrics_directory, f"metrics-{d2_class.lower()}.jsonl")
+        )
+    profile_outfits = ProfileOutfits(
+        armor_dict, instrumentation=instrumentation, memory_budget=memory_budget
+    )
+
+    if cache_directory is not None:
+        with timed(stage_times, "pinnacle outfits"):
+            pinnacle_outfits = profile_outfits.cached_class_pinnacle_outfits(
+                d2_class, include_ignored_armor, OutfitCache(cache_directory)
+            )
+    elif memory_budget is not None:
+        with timed(stage_times, "pinnacle outfits"):
+            pinnacle_outfits = profile_outfits.class_pinnacle_outfits(
+                d2_class, include_ignored_armor
+            )
+    else:
+        with timed(stage_times, "generate outfits"):
+            outfits_df = profile_outfits.generate_class_outfits_df(
+                d2_class, include_ignored_armor
+            )
+        with timed(stage_times, "pinnacle outfits"):
+            pinnacle_outfits = PinnacleOutfits(
+                outfits_df,
+                profile_outfits.equivalent_armor,
+                profile_outfits.armor_table,
+                instrumentation,
+            )
+    if memory_budget is not None and d2_class in profile_outfits.outfit_plans:
+        print(profile_outfits.outfit_plans[d2_class])
+
+    with timed(stage_times, "write report"):
+        report.armor_to_pinnacle_outfits_json(
+            d2_class,
+            armor_dict,
+            pinnacle_outfits.pinnacle_outfits_df,
+            report_directory,
+            instrumentation,
+        )
+
+    return stage_times
+
+
+# sets up a `run_classes` worker process, before it imports polars
+def init_worker(polars_max_threads):
+    os.environ.setdefault("POLARS_MAX_THREADS", str(polars_max_threads))
+
+
+# runs `run_class` for each of `d2_classes` concurrently, one process per class, returns class -> stage times
+# every worker only gets its own class' armor
+def run_classes(
+    armor_dict,
+    d2_classes=D2_CLASSES,
+    max_workers=None,
+    include_ignored_armor=True,
+    report_directory="data",
+    cache_directory=None,
+    metrics_directory=None,
+    memory_budget=None,
+):
+    max_workers = min(len(d2_classes), max_workers or os.cpu_count() or 1)
+
+    # each worker runs its own polars thread pool, split the cores between them rather than every worker taking all
+    # of them.  A POLARS_MAX_THREADS set for this process is passed on to the workers as is
+    polars_max_threads = max(1, (os.cpu_count() or 1) // max_workers)
+
+    # polars runs its own threads, so workers aren't forked straight from this process
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    class_stage_times = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=init_worker,
+        initargs=(polars_max_threads,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                run_class,
+                d2_class,
+                {
+                    instance_id: armor
+                    for instance_id, armor in armor_dict.items()
+                    if armor.d2_class == d2_class
+                },
+                include_ignored_armor,
+                report_directory,
+                cache_directory,
+                metrics_directory,
+                memory_budget,
+            ): d2_class
+            for d2_class in d2_classes
+        }
+        for future in as_completed(futures):
+            d2_class = futures[future]
+            class_stage_times[d2_class] = future.result()
+            print(
+                f"Finished {d2_class}: {format_stage_times(class_stage_times[d2_class])}"
+            )
+
+    return {d2_class: class_stage_times[d2_class] for d2_class in d2_classes}
+
+
+def format_stage_times(stage_times):
+    return ", ".join(
+        f"{stage} {seconds:.2f}s" for stage, seconds in stage_times.items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the armor pinnacle outfit reports of every class"
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        default="data",
+        help="directory with profile.json and the definitions, the reports are written here",
+    )
+    parser.add_argument(
+        "-c",
+        "--classes",
+        nargs="+",
+        choices=D2_CLASSES,
+        default=D2_CLASSES,
+    )
+    parser.add_argument(
+        "-w",
+        "--max-workers",
+        type=int,
+        default=None,
+        help="defaults to one process per class",
+    )
+    parser.add_argument(
+        "--exclude-ignored",
+        action="store_true",
+        help="leave armor in ignored-armor.json out of the outfits rather than only flagging it in the reports",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="reuse pinnacle outfits from this OutfitCache directory for classes whose armor hasn't changed",
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        default=None,
+        help="append the timings, memory and counters of every stage to metrics-<class>.jsonl files in this directory",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        default=None,
+        help="GiB each class may use, classes that wouldn't fit in memory are streamed or fail before enumerating outfits",
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stage_times = {}
+    armor_dict = load_armor_dict(args.data_dir, stage_times)
+    print(f"Loaded {len(armor_dict)} armor pieces: {format_stage_times(stage_times)}")
+
+    with timed(stage_times, "classes"):
+        run_classes(
+            armor_dict,
+            args.classes,
+            args.max_workers,
+            not args.exclude_ignored,
+            args.data_dir,
+            args.cache_dir,
+            args.metrics_dir,
+            None if args.memory_budget is None else int(args.memory_budget * (1 << 30)),
+        )
+
+    print(
+        f"Wrote {len(args.classes)} reports in {time.perf_counter() - start:.2f}s: "
+        f"{format_stage_times(stage_times)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
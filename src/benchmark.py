@@ -0,0 +1,482 @@
+# benchmarks of every stage of the d2armor.ipynb pipeline over synthetic vaults of increasing size, run from the repo
+# root with
+#
+#   python -m src.benchmark --compare data/benchmarks/<an earlier commit>.json
+#
+# results are saved as json under data/benchmarks, named after the commit they ran on, and comparing against an earlier
+# run exits with an error when a stage got slower than the threshold.  Enumerating every outfit grows with the fifth
+# power of the pieces per slot, so stages that enumerate outfits are skipped for vaults with more than `max_outfits`
+# estimated outfits, the other stages still run on them
+#
+# with --memory the pinnacle outfits are also built with every strategy ProfileOutfits can pick for a memory budget,
+# each in a fresh process, and the max RSS it took is saved next to the estimate the budget is checked against
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout
+from dataclasses import asdict, dataclass
+from functools import partial
+
+import polars as pl
+
+from src import report
+from src.armor import PinnacleOutfits, ProfileArmor, ProfileOutfits
+from src.instrumentation import max_rss_bytes
+from src.outfit_engine import DEFAULT_OUTFIT_BATCH_SIZE, format_bytes
+from src.synthetic_vault import SyntheticVault
+
+DEFAULT_PIECES_PER_SLOT = [10, 20, 50, 100]
+DEFAULT_RESULTS_DIRECTORY = "data/benchmarks"
+
+# the list of tuples from `generate_class_outfits` is a lot slower and bigger than the outfit table, so it gets a
+# smaller limit
+DEFAULT_MAX_OUTFITS = 5_000_000
+DEFAULT_MAX_LIST_OUTFITS = 500_000
+
+# a stage regressed when it is this much slower than the baseline, and slower by more than `min_seconds` so timer
+# noise on the fast stages doesn't count
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_MIN_SECONDS = 0.01
+
+# the ways of building pinnacle outfits `--memory` measures, "list" is `generate_class_outfits` into PinnacleOutfits
+MEMORY_STRATEGIES = ["list", *ProfileOutfits.STRATEGIES]
+
+
+# the timing of one stage on one vault size, `seconds` is the fastest of `repeats` runs
+# `rows` is the size of what the stage produced, ex: the number of outfits, and `skipped` says why a stage didn't run
+# memory stages have the `estimated_bytes` of a strategy and the `max_rss_bytes` it took rather than timings
+@dataclass
+class BenchmarkResult:
+    pieces_per_slot: int
+    stage: str
+    seconds: float = None
+    median_seconds: float = None
+    repeats: int = 0
+    rows: int = None
+    skipped: str = None
+    estimated_bytes: int = None
+    max_rss_bytes: int = None
+
+    @property
+    def key(self):
+        return (self.pieces_per_slot, self.stage)
+
+
+# a stage that got slower than its baseline
+@dataclass
+class Regression:
+    result: BenchmarkResult
+    baseline: BenchmarkResult
+
+    @property
+    def ratio(self):
+        return self.result.seconds / self.baseline.seconds
+
+    def __str__(self):
+        return (
+            f"{self.result.stage} with {self.result.pieces_per_slot} pieces per slot: "
+            f"{self.baseline.seconds:.3f}s -> {self.result.seconds:.3f}s ({self.ratio:.2f}x)"
+        )
+
+
+# runs `stage` `repeats` times and returns its BenchmarkResult along with the value of its last run
+# `rows` turns that value into the row count of the result
+def time_stage(pieces_per_slot, stage_name, stage, repeats, rows=len):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        value = stage()
+        times.append(time.perf_counter() - start)
+
+    result = BenchmarkResult(
+        pieces_per_slot,
+        stage_name,
+        seconds=min(times),
+        median_seconds=statistics.median(times),
+        repeats=repeats,
+        rows=None if rows is None else rows(value),
+    )
+    return result, value
+
+
+# benchmarks the stages for one vault size, for the armor of `d2_class`
+def benchmark_vault(
+    vault,
+    d2_class="Warlock",
+    repeats=3,
+    max_outfits=DEFAULT_MAX_OUTFITS,
+    max_list_outfits=DEFAULT_MAX_LIST_OUTFITS,
+):
+    pieces_per_slot = vault.pieces_per_slot
+    results = []
+
+    def run(stage_name, stage, rows=len):
+        result, value = time_stage(pieces_per_slot, stage_name, stage, repeats, rows)
+        results.append(result)
+        return value
+
+    def skip(stage_name, reason):
+        results.append(BenchmarkResult(pieces_per_slot, stage_name, skipped=reason))
+
+    profile_armor = ProfileArmor(*vault.profile())
+    armor_dict = run("get_armor_dict", profile_armor.get_armor_dict)
+    for armor in armor_dict.values():
+        armor.ignored = False
+
+    profile_outfits = ProfileOutfits(armor_dict)
+    for dominance in ["stats", "tiers"]:
+        run(
+            f"find_eclipsed_armor {dominance}",
+            partial(profile_outfits.find_eclipsed_armor, dominance),
+        )
+
+    estimate = run(
+        "estimate_class_outfits",
+        lambda: profile_outfits.estimate_class_outfits(d2_class, True),
+        rows=lambda estimate: estimate["estimated_outfits"],
+    )
+    estimated_outfits = estimate["estimated_outfits"]
+
+    if estimated_outfits > max_list_outfits:
+        skip(
+            "generate_class_outfits",
+            f"{estimated_outfits} estimated outfits, over {max_list_outfits}",
+        )
+    else:
+        run(
+            "generate_class_outfits",
+            lambda: profile_outfits.generate_class_outfits(d2_class, True),
+        )
+
+    outfit_stages = [
+        "generate_class_outfits_df",
+        "PinnacleOutfits",
+        "pinnacle_report",
+        "legendary_armor_to_pinnacle_outfits_report",
+        "exotic_armor_to_pinnacle_outfits_report",
+        "armor_to_pinnacle_outfits_json",
+    ]
+    if estimated_outfits > max_outfits:
+        for stage_name in outfit_stages:
+            skip(
+                stage_name, f"{estimated_outfits} estimated outfits, over {max_outfits}"
+            )
+        return results
+
+    outfits_df = run(
+        "generate_class_outfits_df",
+        lambda: profile_outfits.generate_class_outfits_df(d2_class, True),
+    )
+    pinnacle_outfits_df = run(
+        "PinnacleOutfits",
+        lambda: PinnacleOutfits(outfits_df).pinnacle_outfits_df,
+    )
+
+    # the renderers after the report model are passed it like they are in the notebook, so they only time rendering
+    pinnacle_report = run(
+        "pinnacle_report",
+        lambda: report.pinnacle_report(d2_class, armor_dict, pinnacle_outfits_df),
+        rows=lambda model: len(model.armor_pinnacle_stats_list),
+    )
+    for renderer in [
+        report.legendary_armor_to_pinnacle_outfits_report,
+        report.exotic_armor_to_pinnacle_outfits_report,
+    ]:
+        run(
+            renderer.__name__,
+            partial(
+                renderer,
+                d2_class,
+                armor_dict,
+                pinnacle_outfits_df,
+                model=pinnacle_report,
+            ),
+            rows=None,
+        )
+    with tempfile.TemporaryDirectory() as report_directory:
+        run(
+            "armor_to_pinnacle_outfits_json",
+            lambda: report.armor_to_pinnacle_outfits_json(
+                d2_class,
+                armor_dict,
+                pinnacle_outfits_df,
+                report_directory,
+                model=pinnacle_report,
+            ),
+            rows=None,
+        )
+
+    return results
+
+
+# builds the pinnacle outfits of `d2_class` in `vault` with one of MEMORY_STRATEGIES, returns the bytes ProfileOutfits
+# estimates it needs and how much the max RSS of this process went up while it ran.  The max RSS never comes down, so
+# this has to run in a fresh process, see `measure_memory`
+def pinnacle_memory(vault, d2_class, strategy, batch_size=DEFAULT_OUTFIT_BATCH_SIZE):
+    armor_dict = vault.armor_dict()
+    for armor in armor_dict.values():
+        armor.ignored = False
+    profile_outfits = ProfileOutfits(armor_dict)
+    exotic_armor, non_exotic_armor = profile_outfits.group_class_armor(d2_class, True)
+    plan = profile_outfits.class_outfit_plan(
+        d2_class,
+        exotic_armor,
+        non_exotic_armor,
+        batch_size=batch_size,
+        strategy=None if strategy == "list" else strategy,
+    )
+    if strategy == "list":
+        estimated_bytes = profile_outfits.in_memory_bytes(
+            plan.estimate["estimated_outfits"], list_outfits=True
+        )
+    else:
+        estimated_bytes = plan.estimated_bytes[strategy]
+
+    start_rss_bytes = peak_rss_bytes()
+    with redirect_stdout(io.StringIO()):
+        if strategy == "list":
+            PinnacleOutfits(profile_outfits.generate_class_outfits(d2_class, True))
+        else:
+            profile_outfits.class_pinnacle_outfits(
+                d2_class, True, batch_size=batch_size, strategy=strategy
+            )
+    return estimated_bytes, peak_rss_bytes() - start_rss_bytes
+
+
+# the most memory this process has held at once.  linux keeps the max RSS of getrusage across exec, so a spawned process
+# starts out with its parent's, the high water mark in /proc is this process' own
+def peak_rss_bytes():
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return max_rss_bytes()
+
+
+# the BenchmarkResult of `pinnacle_memory` for each of `strategies`, each run in its own process
+# every strategy enumerates every outfit, so they are skipped for vaults over the same limits as `benchmark_vault`
+def measure_memory(
+    vault,
+    d2_class="Warlock",
+    strategies=MEMORY_STRATEGIES,
+    batch_size=DEFAULT_OUTFIT_BATCH_SIZE,
+    max_outfits=DEFAULT_MAX_OUTFITS,
+    max_list_outfits=DEFAULT_MAX_LIST_OUTFITS,
+):
+    armor_dict = vault.armor_dict()
+    for armor in armor_dict.values():
+        armor.ignored = False
+    estimated_outfits = ProfileOutfits(armor_dict).estimate_class_outfits(
+        d2_class, True
+    )["estimated_outfits"]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for strategy in strategies:
+        stage_name = f"memory {strategy}"
+        limit = max_list_outfits if strategy == "list" else max_outfits
+        if estimated_outfits > limit:
+            results.append(
+                BenchmarkResult(
+                    vault.pieces_per_slot,
+                    stage_name,
+                    skipped=f"{estimated_outfits} estimated outfits, over {limit}",
+                )
+            )
+            continue
+
+        with context.Pool(1) as pool:
+            estimated_bytes, rss_bytes = pool.apply(
+                pinnacle_memory, (vault, d2_class, strategy, batch_size)
+            )
+        results.append(
+            BenchmarkResult(
+                vault.pieces_per_slot,
+                stage_name,
+                rows=estimated_outfits,
+                estimated_bytes=estimated_bytes,
+                max_rss_bytes=rss_bytes,
+            )
+        )
+    return results
+
+
+# the stages that are slower than their baseline result by more than `threshold`, ex: 0.25 is 25% slower
+# stages that were skipped in either run, or that only one of the runs has, aren't compared
+def find_regressions(
+    results,
+    baseline_results,
+    threshold=DEFAULT_THRESHOLD,
+    min_seconds=DEFAULT_MIN_SECONDS,
+):
+    baselines = {baseline.key: baseline for baseline in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baselines.get(result.key)
+        if baseline is None or result.seconds is None or baseline.seconds is None:
+            continue
+        if (
+            result.seconds > baseline.seconds * (1 + threshold)
+            and result.seconds - baseline.seconds > min_seconds
+        ):
+            regressions.append(Regression(result, baseline))
+    return regressions
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if changes else commit
+
+
+def write_results(path, results, **run_info):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(
+            run_info | {"results": [asdict(result) for result in results]},
+            file,
+            indent=2,
+        )
+
+
+def read_results(path):
+    with open(path, "r") as file:
+        run = json.load(file)
+    return run, [BenchmarkResult(**result) for result in run["results"]]
+
+
+def format_result(result):
+    if result.skipped is not None:
+        return (
+            f"{result.pieces_per_slot:>5} {result.stage:<45} skipped: {result.skipped}"
+        )
+    if result.max_rss_bytes is not None:
+        return (
+            f"{result.pieces_per_slot:>5} {result.stage:<45} "
+            f"max rss {format_bytes(result.max_rss_bytes)}, estimated {format_bytes(result.estimated_bytes)} "
+            f"({result.estimated_bytes / max(result.max_rss_bytes, 1):.2f}x)"
+        )
+    rows = "" if result.rows is None else f"{result.rows:>12} rows"
+    return (
+        f"{result.pieces_per_slot:>5} {result.stage:<45} {result.seconds:9.3f}s "
+        f"(median {result.median_seconds:.3f}s) {rows}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the armor pipeline on synthetic vaults"
+    )
+    parser.add_argument(
+        "-p",
+        "--pieces-per-slot",
+        type=int,
+        nargs="+",
+        default=DEFAULT_PIECES_PER_SLOT,
+        help="legendary pieces in every slot of every class for each vault size",
+    )
+    parser.add_argument("-c", "--d2-class", default="Warlock")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    parser.add_argument("--max-outfits", type=int, default=DEFAULT_MAX_OUTFITS)
+    parser.add_argument(
+        "--max-list-outfits", type=int, default=DEFAULT_MAX_LIST_OUTFITS
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=None,
+        help=f"defaults to {DEFAULT_RESULTS_DIRECTORY}/<commit>.json",
+    )
+    parser.add_argument(
+        "--compare", default=None, help="results of an earlier run to check against"
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-seconds", type=float, default=DEFAULT_MIN_SECONDS)
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also measure the max RSS of each pinnacle outfits strategy against its estimate",
+    )
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    for pieces_per_slot in args.pieces_per_slot:
+        vault = SyntheticVault(pieces_per_slot=pieces_per_slot, seed=args.seed)
+        with redirect_stdout(io.StringIO()):
+            vault_results = benchmark_vault(
+                vault,
+                args.d2_class,
+                args.repeats,
+                args.max_outfits,
+                args.max_list_outfits,
+            )
+        if args.memory:
+            vault_results.extend(
+                measure_memory(
+                    vault,
+                    args.d2_class,
+                    max_outfits=args.max_outfits,
+                    max_list_outfits=args.max_list_outfits,
+                )
+            )
+        for result in vault_results:
+            print(format_result(result))
+        results.extend(vault_results)
+
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIRECTORY, f"{commit}.json")
+    write_results(
+        output,
+        results,
+        commit=commit,
+        d2_class=args.d2_class,
+        seed=args.seed,
+        repeats=args.repeats,
+        python=platform.python_version(),
+        polars=pl.__version__,
+    )
+    print(f"Wrote {len(results)} results to {output}")
+
+    if args.compare is not None:
+        baseline_run, baseline_results = read_results(args.compare)
+        if (baseline_run["seed"], baseline_run["d2_class"]) != (
+            args.seed,
+            args.d2_class,
+        ):
+            print(f"Warning: {args.compare} ran on a different vault")
+        regressions = find_regressions(
+            results, baseline_results, args.threshold, args.min_seconds
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions against {baseline_run['commit']}")
+
+
+if __name__ == "__main__":
+    main()
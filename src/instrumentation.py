@@ -0,0 +1,143 @@
+# opt-in timings, memory and counters for the stages of the pipeline, to find which vaults blow up and why
+#
+# pass an Instrumentation to ProfileArmor, ProfileOutfits, PinnacleOutfits and the report functions and every stage they
+# run is recorded as a StageMetrics with its wall time, peak memory and counters, ex: how many outfits a class made
+# before and after artifice expansion.  Stages can nest, ex: `group_class_armor` runs inside `generate_class_outfits_df`
+#
+# `peak_traced_bytes` is the most memory python and numpy had allocated at once during the stage, over what was
+# allocated when it started, measured with tracemalloc.  Tracing slows python code down, `trace_memory=False` turns it
+# off.  polars allocates its buffers outside of python, they only show up in `max_rss_bytes`, the high water mark of
+# the whole process so far
+#
+# with a `jsonl_path` every stage is also appended to that file as a line of json as soon as it finishes, so the stages
+# before a crash or OOM kill are still there
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    parent: str = None
+    labels: dict = field(default_factory=dict)
+    seconds: float = None
+    peak_traced_bytes: int = None
+    max_rss_bytes: int = None
+    counters: dict = field(default_factory=dict)
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, jsonl_path=None, trace_memory=True):
+        self.jsonl_path = jsonl_path
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.__open_stages = []
+        # the peak traced memory of each open stage, from before its latest nested stage reset the peak
+        self.__open_peaks = []
+        self.__started_tracing = False
+
+    # records the `with` block as a stage, `labels` say what it ran on, ex: d2_class="Warlock"
+    # yields the StageMetrics, counters can be added to it or with `count`
+    @contextmanager
+    def stage(self, name, **labels):
+        if (
+            not self.__open_stages
+            and self.trace_memory
+            and not tracemalloc.is_tracing()
+        ):
+            tracemalloc.start()
+            self.__started_tracing = True
+
+        parent = self.__open_stages[-1].name if self.__open_stages else None
+        stage = StageMetrics(name, parent, labels)
+
+        traced_start = self.__enter_peak()
+        self.__open_stages.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            self.__open_stages.pop()
+            stage.peak_traced_bytes = self.__exit_peak(traced_start)
+            stage.max_rss_bytes = max_rss_bytes()
+            self.stages.append(stage)
+            self.__write_jsonl(stage)
+
+            if not self.__open_stages and self.__started_tracing:
+                tracemalloc.stop()
+                self.__started_tracing = False
+
+    # adds counters to the innermost open stage
+    def count(self, **counters):
+        if self.__open_stages:
+            self.__open_stages[-1].counters.update(counters)
+
+    # the finished stages called `name`, in the order they finished
+    def stages_named(self, name):
+        return [stage for stage in self.stages if stage.name == name]
+
+    def to_dicts(self):
+        return [asdict(stage) for stage in self.stages]
+
+    def __enter_peak(self):
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        if self.__open_peaks:
+            self.__open_peaks[-1] = max(self.__open_peaks[-1], peak)
+        self.__open_peaks.append(current)
+        tracemalloc.reset_peak()
+        return current
+
+    def __exit_peak(self, traced_start):
+        if traced_start is None or not tracemalloc.is_tracing():
+            return None
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(self.__open_peaks.pop(), peak)
+        # the parent's peak includes everything its nested stages allocated
+        if self.__open_peaks:
+            self.__open_peaks[-1] = max(self.__open_peaks[-1], peak)
+        return peak - traced_start
+
+    def __write_jsonl(self, stage):
+        if self.jsonl_path is None:
+            return
+        with open(self.jsonl_path, "a") as file:
+            file.write(json.dumps(asdict(stage), default=str) + "\n")
+
+
+# stands in for an Instrumentation when nothing is being recorded, so the instrumented code can always call it
+class NoInstrumentation:
+    enabled = False
+    stages = ()
+
+    @contextmanager
+    def stage(self, name, **labels):
+        yield None
+
+    def count(self, **counters):
+        pass
+
+
+NO_INSTRUMENTATION = NoInstrumentation()
+
+
+# the most memory this process has held at once, in bytes, or None where the platform can't tell
+def max_rss_bytes():
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
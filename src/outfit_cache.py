@@ -0,0 +1,114 @@
+# on-disk cache of polars frames, ex: the outfit and pinnacle tables of a class, so they survive restarting the notebook
+# every entry is a directory of uncompressed Arrow IPC files that are memory mapped when they are read, so reading an
+# entry only maps the files and the operating system pages in the parts that get used
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import polars as pl
+import pyarrow as pa
+
+DEFAULT_CACHE_DIRECTORY = "data/outfit_cache"
+
+# bump when the outfits or pinnacle tables change for the same armor, so older entries are never read
+CACHE_VERSION = 1
+
+
+# a stable hex digest of some polars frames and json parameters, for use as a cache key
+# frames are hashed in their row order, sort them first when the order doesn't matter
+def fingerprint(*frames, **parameters):
+    digest = hashlib.sha256()
+    digest.update(
+        json.dumps({"version": CACHE_VERSION} | parameters, sort_keys=True).encode()
+    )
+    for frame in frames:
+        digest.update(
+            json.dumps(
+                [[name, str(dtype)] for name, dtype in frame.schema.items()]
+            ).encode()
+        )
+        for series in frame.iter_columns():
+            digest.update(series.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# a DataFrame over a memory map of an uncompressed Arrow IPC file, without copying the columns into memory
+# polars' own read_ipc reads the whole file, going through pyarrow keeps the buffers pointing at the map
+def read_memory_mapped_ipc(path):
+    # the map is closed once the last column using it is garbage collected
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return pl.from_arrow(table, rechunk=False)
+
+
+# entries are stored as `cache_directory/<name>/<key>/<frame name>.arrow`, where `name` is what the entry is for,
+# ex: "warlock", and `key` is the fingerprint of everything that went into it.  Saving an entry drops the other
+# entries with the same name, as its fingerprint changed they are stale, and beyond `max_entries` entries the least
+# recently read or saved ones are evicted
+class OutfitCache:
+    def __init__(self, cache_directory=DEFAULT_CACHE_DIRECTORY, max_entries=8):
+        self.cache_directory = cache_directory
+        self.max_entries = max_entries
+
+    # the frames saved for `name` and `key`, memory mapped, or None if there aren't any
+    def get(self, name, key):
+        entry_directory = os.path.join(self.cache_directory, name, key)
+        if not os.path.isdir(entry_directory):
+            return None
+
+        # reading an entry counts as using it for eviction
+        os.utime(entry_directory)
+        return {
+            file_name.removesuffix(".arrow"): read_memory_mapped_ipc(
+                os.path.join(entry_directory, file_name)
+            )
+            for file_name in sorted(os.listdir(entry_directory))
+            if file_name.endswith(".arrow")
+        }
+
+    # save a dict of frame name -> polars DataFrame for `name` and `key`
+    def put(self, name, key, frames):
+        name_directory = os.path.join(self.cache_directory, name)
+        os.makedirs(name_directory, exist_ok=True)
+
+        # frames are written next to the entry and renamed into place, a write that fails never looks like an entry
+        partial_directory = tempfile.mkdtemp(prefix=".partial-", dir=name_directory)
+        try:
+            for frame_name, frame in frames.items():
+                frame.write_ipc(
+                    os.path.join(partial_directory, f"{frame_name}.arrow"),
+                    compression="uncompressed",
+                )
+            self.invalidate(name)
+            os.rename(partial_directory, os.path.join(name_directory, key))
+        except BaseException:
+            shutil.rmtree(partial_directory, ignore_errors=True)
+            raise
+
+        self.__evict()
+
+    # drop every entry for `name`
+    def invalidate(self, name):
+        for entry_directory in self.__entry_directories(name):
+            shutil.rmtree(entry_directory, ignore_errors=True)
+
+    def __entry_directories(self, name):
+        name_directory = os.path.join(self.cache_directory, name)
+        if not os.path.isdir(name_directory):
+            return []
+        return [
+            os.path.join(name_directory, key)
+            for key in os.listdir(name_directory)
+            if not key.startswith(".")
+        ]
+
+    def __evict(self):
+        entry_directories = [
+            entry_directory
+            for name in os.listdir(self.cache_directory)
+            for entry_directory in self.__entry_directories(name)
+        ]
+        entry_directories.sort(key=os.path.getmtime, reverse=True)
+        for entry_directory in entry_directories[self.max_entries :]:
+            shutil.rmtree(entry_directory, ignore_errors=True)
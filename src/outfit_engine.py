@@ -0,0 +1,953 @@
+# vectorized outfit enumeration used by ProfileOutfits
+# each armor slot is held as a matrix of stats so the stats for every outfit in the product of the five slots
+# can be summed with numpy broadcasting instead of walking itertools.product one outfit at a time
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import combinations
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import polars as pl
+
+STAT_NAMES = [
+    "mobility",
+    "resilience",
+    "recovery",
+    "discipline",
+    "intellect",
+    "strength",
+]
+
+SLOT_COLUMNS = [
+    "helmet",
+    "gauntlets",
+    "chest_armor",
+    "leg_armor",
+    "class_item",
+]
+
+# the columns of an outfit, in the same order as the tuples built by ProfileOutfits.append_outfit_permutation
+OUTFIT_COLUMNS = STAT_NAMES + SLOT_COLUMNS + ["exotic_hash", "num_artifice"]
+
+OUTFIT_SCHEMA = {column_name: pl.Int64 for column_name in OUTFIT_COLUMNS}
+
+# narrow version of OUTFIT_SCHEMA, stats are rounded to at most 100 and there are at most 5 artifice pieces
+# the slot columns hold rows of the ArmorTable instead of instance ids, `restore_instance_ids` swaps them back
+# exotic_hash stays 64 bit as NO_EXOTIC_HASH is -1 and item hashes use all 32 bits
+COMPACT_OUTFIT_SCHEMA = (
+    {stat: pl.UInt8 for stat in STAT_NAMES}
+    | {slot_column: pl.UInt16 for slot_column in SLOT_COLUMNS}
+    | {"exotic_hash": pl.Int64, "num_artifice": pl.UInt8}
+)
+
+# the slot columns of COMPACT_OUTFIT_SCHEMA can only number this many ArmorTable rows
+COMPACT_MAX_ARMOR_ROWS = np.iinfo(np.uint16).max + 1
+
+# sums of compact stats, 6 stats of at most 100 with a handful of them weighted, fit easily in 16 bits
+COMPACT_WEIGHTED_DTYPE = pl.UInt16
+
+# each artifice armor piece gives a +3 bonus to one stat
+ARTIFICE_STAT_BONUS = 3
+
+MAX_ARTIFICE = 5
+
+# number of outfit rows in each batch when streaming outfits
+DEFAULT_OUTFIT_BATCH_SIZE = 1 << 18
+
+
+# the stats, artifice count, instance ids and exotic hashes of a list of armor pieces in a single slot
+# a slot matrix can also hold the partial sums of several slots (see `combine_slot_matrices`), in which case
+# `instance_ids` has a column for each of the slots it covers
+#
+# armor that only differs by its random exotic perks, ex: exotic class items, can share a row.  `variants` is then a tuple
+# of the row, instance id and exotic hash of every piece sharing a row, see `SlotMatrix.with_variants`
+@dataclass
+class SlotMatrix:
+    stats: np.ndarray
+    num_artifice: np.ndarray
+    instance_ids: np.ndarray
+    exotic_hashes: np.ndarray
+    variants: tuple = None
+
+    @classmethod
+    def from_armor_list(cls, armor_list, no_exotic_hash):
+        stats = np.array(
+            [[getattr(armor, stat) for stat in STAT_NAMES] for armor in armor_list],
+            dtype=np.int64,
+        ).reshape(-1, len(STAT_NAMES))
+        return cls(
+            stats=stats,
+            num_artifice=np.array(
+                [armor.is_artifice for armor in armor_list], dtype=np.int64
+            ),
+            instance_ids=np.array(
+                [armor.instance_id for armor in armor_list], dtype=np.int64
+            ).reshape(-1, 1),
+            exotic_hashes=np.array(
+                [
+                    armor.exotic_hash if armor.is_exotic else no_exotic_hash
+                    for armor in armor_list
+                ],
+                dtype=np.int64,
+            ),
+        )
+
+    # the slot matrix for some rows of an ArmorTable, sliced straight from its arrays
+    # with `compact` the rows themselves stand in for the instance ids, for COMPACT_OUTFIT_SCHEMA outfits
+    @classmethod
+    def from_armor_table(cls, armor_table, rows, no_exotic_hash, compact=False):
+        return cls(
+            stats=armor_table.stats[rows],
+            num_artifice=armor_table.is_artifice[rows].astype(np.int64),
+            instance_ids=(rows if compact else armor_table.instance_ids[rows]).reshape(
+                -1, 1
+            ),
+            exotic_hashes=np.where(
+                armor_table.is_exotic[rows],
+                armor_table.exotic_hashes[rows],
+                no_exotic_hash,
+            ),
+        )
+
+    # a single slot matrix where pieces with the same stats and artifice-ness share a row, so the product with the
+    # other slots is only enumerated once for all of them.  `expand_slot_variants` then copies each outfit using the
+    # shared row once for every piece in it, with that piece's instance id and exotic hash
+    def with_variants(self):
+        _, first_rows, variant_rows = np.unique(
+            np.column_stack([self.stats, self.num_artifice]),
+            axis=0,
+            return_index=True,
+            return_inverse=True,
+        )
+        # keep the rows in the order their first piece came in
+        order = np.argsort(first_rows, kind="stable")
+        row_of_unique = np.empty_like(order)
+        row_of_unique[order] = np.arange(len(order))
+        shared_rows = first_rows[order]
+        return SlotMatrix(
+            stats=self.stats[shared_rows],
+            num_artifice=self.num_artifice[shared_rows],
+            instance_ids=self.instance_ids[shared_rows],
+            exotic_hashes=self.exotic_hashes[shared_rows],
+            variants=(
+                row_of_unique[variant_rows.reshape(-1)],
+                self.instance_ids[:, 0],
+                self.exotic_hashes,
+            ),
+        )
+
+    def __len__(self):
+        return len(self.instance_ids)
+
+
+# the partial sums of two slot matrices for every pair of their pieces, in product order
+# these are built once per class and shared between the outfit passes that use the same legendary slots
+def combine_slot_matrices(first, second, no_exotic_hash):
+    first_rows = np.repeat(np.arange(len(first)), len(second))
+    second_rows = np.tile(np.arange(len(second)), len(first))
+
+    first_hashes = first.exotic_hashes[first_rows]
+    return SlotMatrix(
+        stats=first.stats[first_rows] + second.stats[second_rows],
+        num_artifice=first.num_artifice[first_rows] + second.num_artifice[second_rows],
+        instance_ids=np.concatenate(
+            [first.instance_ids[first_rows], second.instance_ids[second_rows]], axis=1
+        ),
+        exotic_hashes=np.where(
+            first_hashes != no_exotic_hash,
+            first_hashes,
+            second.exotic_hashes[second_rows],
+        ),
+    )
+
+
+# vectorized version of ProfileOutfits.round_to_useful_tier
+def round_to_useful_tiers(stats, tier_size, max_stat):
+    return np.minimum(stats - (stats % tier_size), max_stat)
+
+
+# broadcast the slot matrices against each other so every outfit in the product of the slots is computed at once
+# rows are in the same order as itertools.product(*slots), the helmet is the outermost loop
+# returns the summed base stats, the number of artifice pieces, the instance ids of each armor slot and the exotic hash
+def outfit_product(slots, masterwork_bonus, no_exotic_hash):
+    slot_count = len(slots)
+    shape = tuple(len(slot) for slot in slots)
+
+    stats = np.full((1,) * slot_count + (len(STAT_NAMES),), masterwork_bonus)
+    num_artifice = np.zeros((1,) * slot_count, dtype=np.int64)
+    exotic_hash = np.full((1,) * slot_count, no_exotic_hash, dtype=np.int64)
+
+    for axis, slot in enumerate(slots):
+        axis_shape = [1] * slot_count
+        axis_shape[axis] = len(slot)
+        stats = stats + slot.stats.reshape(axis_shape + [len(STAT_NAMES)])
+        num_artifice = num_artifice + slot.num_artifice.reshape(axis_shape)
+
+    # should be at most one exotic armor piece in an outfit, walk backwards so the first slot with an exotic wins
+    for axis in reversed(range(slot_count)):
+        axis_shape = [1] * slot_count
+        axis_shape[axis] = len(slots[axis])
+        slot_hashes = slots[axis].exotic_hashes.reshape(axis_shape)
+        exotic_hash = np.where(slot_hashes != no_exotic_hash, slot_hashes, exotic_hash)
+
+    instance_ids = [
+        np.broadcast_to(
+            slot_ids.reshape(
+                [len(slot) if i == axis else 1 for i in range(slot_count)]
+            ),
+            shape,
+        ).reshape(-1)
+        for axis, slot in enumerate(slots)
+        for slot_ids in slot.instance_ids.T
+    ]
+
+    return (
+        np.broadcast_to(stats, shape + (len(STAT_NAMES),)).reshape(-1, len(STAT_NAMES)),
+        np.broadcast_to(num_artifice, shape).reshape(-1),
+        instance_ids,
+        np.broadcast_to(exotic_hash, shape).reshape(-1),
+    )
+
+
+# the rows `start` to `stop` of `outfit_product`, gathered from the slot matrices so only that range is in memory
+def outfit_product_range(slots, start, stop, masterwork_bonus, no_exotic_hash):
+    return outfit_product_rows(
+        slots, np.arange(start, stop), masterwork_bonus, no_exotic_hash
+    )
+
+
+# any rows of `outfit_product`, `rows` is an array of row numbers in the product
+def outfit_product_rows(slots, rows, masterwork_bonus, no_exotic_hash):
+    shape = tuple(len(slot) for slot in slots)
+    slot_indices = np.unravel_index(rows, shape)
+
+    stats = np.full((len(rows), len(STAT_NAMES)), masterwork_bonus, dtype=np.int64)
+    num_artifice = np.zeros(len(rows), dtype=np.int64)
+    exotic_hash = np.full(len(rows), no_exotic_hash, dtype=np.int64)
+
+    for slot, indices in zip(slots, slot_indices):
+        stats += slot.stats[indices]
+        num_artifice += slot.num_artifice[indices]
+
+    # should be at most one exotic armor piece in an outfit, walk backwards so the first slot with an exotic wins
+    for slot, indices in reversed(list(zip(slots, slot_indices))):
+        slot_hashes = slot.exotic_hashes[indices]
+        exotic_hash = np.where(slot_hashes != no_exotic_hash, slot_hashes, exotic_hash)
+
+    instance_ids = [
+        slot_ids[indices]
+        for slot, indices in zip(slots, slot_indices)
+        for slot_ids in slot.instance_ids.T
+    ]
+
+    return stats, num_artifice, instance_ids, exotic_hash
+
+
+# closed form version of rounding every artifice permutation to useful tiers and throwing away the duplicates
+#
+# for a single stat, the only things that matter are the remainder of the stat modulo the tier size and how many
+# tiers are left before the max useful stat.  From those we precompute which tier bumps are reachable with
+# up to `num_artifice` +3 mods, and the fewest and most mods that land on each bump (the stat's "levels").
+# A vector of bumps across the 6 stats is reachable with exactly `num_artifice` mods when the fewest mods it needs
+# is <= num_artifice <= the most mods it can absorb.
+#
+# the reachable bump vectors don't depend on which stat has which levels, so outfits are looked up by their sorted
+# level ids and the bumps are permuted back onto the outfit's stats
+class ArtificeTierTable:
+    def __init__(self, tier_size, max_stat, max_artifice=MAX_ARTIFICE):
+        self.tier_size = tier_size
+        self.max_stat = max_stat
+        self.max_artifice = max_artifice
+
+        # the most tiers a single stat can gain if every artifice mod is applied to it
+        self.max_bump = (
+            tier_size - 1 + ARTIFICE_STAT_BONUS * max_artifice
+        ) // tier_size
+
+        # level id -> tuple of (tier bump, fewest mods, most mods) for a single stat
+        self.levels = []
+
+        # [residue, headroom, num_artifice] -> level id
+        self.level_ids = np.zeros(
+            (tier_size, self.max_bump + 1, max_artifice + 1), dtype=np.int64
+        )
+
+        level_id_lookup = {}
+        for residue in range(tier_size):
+            for headroom in range(self.max_bump + 1):
+                for num_artifice in range(max_artifice + 1):
+                    levels = self.__stat_levels(residue, headroom, num_artifice)
+                    if levels not in level_id_lookup:
+                        level_id_lookup[levels] = len(self.levels)
+                        self.levels.append(levels)
+                    self.level_ids[residue, headroom, num_artifice] = level_id_lookup[
+                        levels
+                    ]
+
+        # (sorted level ids, num_artifice) -> tuple of distinct tier bump vectors, in sorted level id order
+        self.tier_bumps_cache = {}
+
+    def __stat_levels(self, residue, headroom, num_artifice):
+        levels = []
+        for mods in range(num_artifice + 1):
+            bump = min(
+                (residue + ARTIFICE_STAT_BONUS * mods) // self.tier_size, headroom
+            )
+            if len(levels) > 0 and levels[-1][0] == bump:
+                levels[-1] = (bump, levels[-1][1], mods)
+            else:
+                levels.append((bump, mods, mods))
+        return tuple(levels)
+
+    def tier_bumps(self, sorted_level_ids, num_artifice):
+        key = (sorted_level_ids, num_artifice)
+        tier_bumps = self.tier_bumps_cache.get(key)
+        if tier_bumps is None:
+            tier_bumps = tuple(
+                self.__reachable_bumps(
+                    [self.levels[level_id] for level_id in sorted_level_ids],
+                    num_artifice,
+                )
+            )
+            self.tier_bumps_cache[key] = tier_bumps
+        return tier_bumps
+
+    # walk the product of the stats' levels in order, cutting off a prefix as soon as it needs more than
+    # `num_artifice` mods or the rest of the stats can't absorb the mods it leaves over.  Half tiers have many more
+    # levels per stat than full tiers, so this is much cheaper than filtering the whole product
+    def __reachable_bumps(self, stat_levels, num_artifice):
+        # the most mods the stats from i onwards can absorb, a stat's last level is the one with the most mods
+        remaining_most = [0] * (len(stat_levels) + 1)
+        for i in reversed(range(len(stat_levels))):
+            remaining_most[i] = remaining_most[i + 1] + stat_levels[i][-1][2]
+
+        bumps = []
+
+        def extend(i, fewest, most):
+            if i == len(stat_levels):
+                yield tuple(bumps)
+                return
+            for bump, level_fewest, level_most in stat_levels[i]:
+                # levels are in order of mods, every later level needs even more
+                if fewest + level_fewest > num_artifice:
+                    break
+                if most + level_most + remaining_most[i + 1] < num_artifice:
+                    continue
+                bumps.append(bump)
+                yield from extend(i + 1, fewest + level_fewest, most + level_most)
+                bumps.pop()
+
+        return extend(0, 0, 0)
+
+    # the distinct useful tiers an outfit with these base stats can reach with `num_artifice` artifice mods
+    def useful_stats_permutations(self, stats, num_artifice):
+        base_tiers = [stat - (stat % self.tier_size) for stat in stats]
+        level_ids = [
+            self.level_ids[
+                stat % self.tier_size,
+                max(
+                    0, min((self.max_stat - base_tier) // self.tier_size, self.max_bump)
+                ),
+                num_artifice,
+            ]
+            for stat, base_tier in zip(stats, base_tiers)
+        ]
+        order = sorted(range(len(stats)), key=level_ids.__getitem__)
+
+        useful_stats_permutations = []
+        for bumps in self.tier_bumps(
+            tuple(int(level_ids[i]) for i in order), num_artifice
+        ):
+            useful_stats = [0] * len(stats)
+            for i, bump in zip(order, bumps):
+                useful_stats[i] = min(
+                    base_tiers[i] + bump * self.tier_size, self.max_stat
+                )
+            useful_stats_permutations.append(tuple(useful_stats))
+        return useful_stats_permutations
+
+    # vectorized version of `useful_stats_permutations` for a matrix of outfit stats
+    # returns the row of the source outfit for each expanded outfit and its rounded stats, each outfit's rows stay together
+    def expand(self, stats, num_artifice):
+        if len(stats) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(STAT_NAMES)), np.int64)
+
+        residues = stats % self.tier_size
+        base_tiers = stats - residues
+        headrooms = np.clip(
+            (self.max_stat - base_tiers) // self.tier_size, 0, self.max_bump
+        )
+        level_ids = self.level_ids[residues, headrooms, num_artifice[:, None]]
+
+        order = np.argsort(level_ids, axis=1, kind="stable")
+        sorted_level_ids = np.take_along_axis(level_ids, order, axis=1)
+
+        # one key per outfit from its sorted level ids and artifice count, outfits with the same key share bumps
+        level_count = len(self.levels)
+        keys = sorted_level_ids @ (
+            level_count ** np.arange(len(STAT_NAMES), dtype=np.int64)
+        )
+        keys = keys * (self.max_artifice + 1) + num_artifice
+
+        _, first_rows, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+        group_bumps = [
+            self.tier_bumps(
+                tuple(sorted_level_ids[row].tolist()), int(num_artifice[row])
+            )
+            for row in first_rows
+        ]
+        group_counts = np.array([len(bumps) for bumps in group_bumps], dtype=np.int64)
+        group_starts = np.cumsum(group_counts) - group_counts
+        flat_bumps = np.array(
+            [bump for bumps in group_bumps for bump in bumps], dtype=np.int64
+        ).reshape(-1, len(STAT_NAMES))
+
+        # every outfit is repeated once per tier bump vector in its group
+        row_counts = group_counts[inverse]
+        source_rows = np.repeat(np.arange(len(stats)), row_counts)
+        positions = np.arange(len(source_rows)) - np.repeat(
+            np.cumsum(row_counts) - row_counts, row_counts
+        )
+        sorted_bumps = flat_bumps[group_starts[inverse][source_rows] + positions]
+
+        # permute the bumps from sorted level id order back onto the outfit's stats
+        bumps = np.empty_like(sorted_bumps)
+        np.put_along_axis(bumps, order[source_rows], sorted_bumps, axis=1)
+
+        return source_rows, np.minimum(
+            base_tiers[source_rows] + bumps * self.tier_size, self.max_stat
+        )
+
+
+# the outfit columns of a random sample of `sample_size` armor combinations from each product of `slots_list` (all of
+# them if smaller), yields the size of each product, the number of combinations sampled from it and their columns
+def sample_outfit_columns(
+    slots_list,
+    artifice_tier_table,
+    masterwork_bonus,
+    no_exotic_hash,
+    sample_size=1 << 14,
+    seed=0,
+):
+    rng = np.random.default_rng(seed)
+    for slots in slots_list:
+        product_size = int(np.prod([len(slot) for slot in slots]))
+        if product_size == 0:
+            continue
+        if product_size <= sample_size:
+            rows = np.arange(product_size)
+        else:
+            rows = rng.integers(0, product_size, sample_size)
+        yield (
+            product_size,
+            len(rows),
+            expand_slot_variants(
+                expand_outfit_columns(
+                    *outfit_product_rows(slots, rows, masterwork_bonus, no_exotic_hash),
+                    artifice_tier_table,
+                ),
+                slots,
+            ),
+        )
+
+
+# estimate how many outfit rows enumerating the products of `slots_list` makes without enumerating them
+# the number of armor combinations is exact, each one becomes a row for every distinct useful tier its artifice mods
+# reach, which is measured on a random sample of `sample_size` combinations from each product (all of them if smaller)
+# returns the number of armor combinations and the estimated number of outfit rows
+def estimate_outfit_rows(
+    slots_list,
+    artifice_tier_table,
+    masterwork_bonus,
+    no_exotic_hash,
+    sample_size=1 << 14,
+    seed=0,
+):
+    armor_combinations = sum(armor_combination_count(slots) for slots in slots_list)
+    estimated_rows = 0.0
+    for product_size, sampled, columns in sample_outfit_columns(
+        slots_list,
+        artifice_tier_table,
+        masterwork_bonus,
+        no_exotic_hash,
+        sample_size,
+        seed,
+    ):
+        estimated_rows += product_size * len(columns["exotic_hash"]) / sampled
+    return armor_combinations, round(estimated_rows)
+
+
+# the pinnacle outfits among the same sample as `estimate_outfit_rows`, the rows at the max score of one of the
+# weighting schemes of `weight_matrix` for their exotic, see `scheme_pinnacle_rows`
+# returns the number of them and whether the sample covered every armor combination.  When it did the count is exact,
+# otherwise it is only what the sample found: more outfits can tie at the max, so treat it as a lower bound
+def sampled_pinnacle_rows(
+    slots_list,
+    artifice_tier_table,
+    masterwork_bonus,
+    no_exotic_hash,
+    weight_matrix,
+    sample_size=1 << 14,
+    seed=0,
+):
+    samples = list(
+        sample_outfit_columns(
+            slots_list,
+            artifice_tier_table,
+            masterwork_bonus,
+            no_exotic_hash,
+            sample_size,
+            seed,
+        )
+    )
+    exact = all(product_size == sampled for product_size, sampled, _ in samples)
+    if not samples:
+        return 0, exact
+
+    stats = np.column_stack(
+        [
+            np.concatenate([columns[stat] for _, _, columns in samples])
+            for stat in STAT_NAMES
+        ]
+    )
+    exotic_hash = np.concatenate([columns["exotic_hash"] for _, _, columns in samples])
+    _, _, pinnacle_rows, _ = scheme_pinnacle_rows(stats, exotic_hash, weight_matrix)
+    return len(pinnacle_rows), exact
+
+
+# the bytes in an outfit table row with `schema`, ex: OUTFIT_SCHEMA or COMPACT_OUTFIT_SCHEMA
+def outfit_row_bytes(schema):
+    return sum(
+        pl.Series([], dtype=dtype).to_numpy().dtype.itemsize
+        for dtype in schema.values()
+    )
+
+
+# a rough model of the peak memory of building pinnacle outfits, `python -m src.benchmark` measures the max RSS of each
+# strategy in a fresh process next to its estimate.  Outfits are always enumerated as int64 columns before they are
+# cast to the outfit schema
+ENUMERATED_ROW_BYTES = outfit_row_bytes(OUTFIT_SCHEMA)
+
+# polars and numpy working memory that building pinnacle outfits needs however few outfits there are
+PINNACLE_BASE_BYTES = 128 << 20
+
+# a row of the list of tuples from `generate_class_outfits`, the ints in it are shared with the armor
+LIST_OUTFIT_ROW_BYTES = 160
+
+
+# the peak bytes per outfit of building pinnacle outfits from an outfit table with `schema`
+# each outfit gets `weighted_columns` columns of `weighted_dtype` and a `weighted_*_max` column for each of them, and
+# polars holds about two copies of that joined row at its peak
+def pinnacle_row_bytes(schema, weighted_columns, weighted_dtype):
+    weighted_row_bytes = outfit_row_bytes(schema) + 2 * weighted_columns * (
+        outfit_row_bytes({"weighted": weighted_dtype})
+    )
+    return 2 * weighted_row_bytes + ENUMERATED_ROW_BYTES
+
+
+# the estimated peak bytes of building the pinnacle outfits of `outfits` outfit rows from `armor_combinations` each way
+# PinnacleOutfits can.  "in_memory" holds every outfit.  "two_passes" (`from_two_passes`) holds a batch of `batch_size`
+# outfits, the outfits a chunk of `batch_size` armor combinations expands to while they are enumerated and the
+# `pinnacle_outfits` it keeps.  "batches" (`from_batches`) also keeps the candidates still at the running max of their
+# exotic, the pinnacle outfits and up to a batch more of them.  The streaming estimates are only as good as
+# `pinnacle_outfits`, see `sampled_pinnacle_rows`
+def estimate_pinnacle_bytes(
+    outfits, armor_combinations, batch_size, row_bytes, pinnacle_outfits=0
+):
+    batch_rows = min(outfits, batch_size)
+    enumerated_rows = min(outfits, batch_size * outfits // max(armor_combinations, 1))
+    two_passes = (
+        PINNACLE_BASE_BYTES
+        + batch_rows * row_bytes
+        + enumerated_rows * ENUMERATED_ROW_BYTES
+        + pinnacle_outfits * row_bytes
+    )
+    return {
+        "in_memory": PINNACLE_BASE_BYTES + outfits * row_bytes,
+        "batches": two_passes + batch_rows * row_bytes,
+        "two_passes": two_passes,
+    }
+
+
+# ex: 1.5 GiB
+def format_bytes(size):
+    if size < 1024:
+        return f"{size} B"
+    for unit in ["KiB", "MiB", "GiB", "TiB"]:
+        size /= 1024
+        if size < 1024 or unit == "TiB":
+            return f"{size:.1f} {unit}"
+
+
+# enumerate every outfit in the product of the slot matrices and return the columns of the outfit table
+def enumerate_outfit_columns(
+    slots, artifice_tier_table, masterwork_bonus, no_exotic_hash
+):
+    return expand_slot_variants(
+        expand_outfit_columns(
+            *outfit_product(slots, masterwork_bonus, no_exotic_hash),
+            artifice_tier_table,
+        ),
+        slots,
+    )
+
+
+# streaming version of `enumerate_outfit_columns`, yields the columns for `chunk_size` outfits of the product at a time
+def enumerate_outfit_column_chunks(
+    slots, artifice_tier_table, masterwork_bonus, no_exotic_hash, chunk_size
+):
+    product_size = int(np.prod([len(slot) for slot in slots]))
+    for start in range(0, product_size, chunk_size):
+        yield expand_slot_variants(
+            expand_outfit_columns(
+                *outfit_product_range(
+                    slots,
+                    start,
+                    min(start + chunk_size, product_size),
+                    masterwork_bonus,
+                    no_exotic_hash,
+                ),
+                artifice_tier_table,
+            ),
+            slots,
+        )
+
+
+# every outfit is expanded into each distinct useful tier its artifice mods can reach, outfits without artifice have exactly one
+def expand_outfit_columns(
+    stats, num_artifice, instance_ids, exotic_hash, artifice_tier_table
+):
+    source_rows, expanded_stats = artifice_tier_table.expand(stats, num_artifice)
+
+    columns = {stat: expanded_stats[:, i] for i, stat in enumerate(STAT_NAMES)}
+    for column_name, ids in zip(SLOT_COLUMNS, instance_ids):
+        columns[column_name] = ids[source_rows]
+    columns["exotic_hash"] = exotic_hash[source_rows]
+    columns["num_artifice"] = num_artifice[source_rows]
+
+    return columns
+
+
+# copy every outfit that uses a shared row of a slot matrix `with_variants` once for each piece sharing the row
+# the copies are next to each other in the order of the pieces, each with its own instance id and exotic hash
+def expand_slot_variants(columns, slots):
+    column_index = 0
+    for slot in slots:
+        if slot.variants is not None:
+            variant_rows, variant_ids, variant_hashes = slot.variants
+            order = np.argsort(variant_rows, kind="stable")
+            counts = np.bincount(variant_rows, minlength=len(slot))
+            offsets = np.cumsum(counts) - counts
+
+            slot_column = SLOT_COLUMNS[column_index]
+            shared_ids = slot.instance_ids[:, 0]
+            sorter = np.argsort(shared_ids)
+            outfit_rows = sorter[
+                np.searchsorted(shared_ids, columns[slot_column], sorter=sorter)
+            ]
+            repeats = counts[outfit_rows]
+            source_rows = np.repeat(np.arange(len(outfit_rows)), repeats)
+            within_row = np.arange(len(source_rows)) - np.repeat(
+                np.cumsum(repeats) - repeats, repeats
+            )
+            variants = order[np.repeat(offsets[outfit_rows], repeats) + within_row]
+
+            columns = {name: values[source_rows] for name, values in columns.items()}
+            columns[slot_column] = variant_ids[variants]
+            columns["exotic_hash"] = variant_hashes[variants]
+        column_index += slot.instance_ids.shape[1]
+    return columns
+
+
+# the number of armor combinations in the product of the slot matrices, counting every piece sharing a row
+def armor_combination_count(slots):
+    return int(
+        np.prod(
+            [
+                len(slot) if slot.variants is None else len(slot.variants[0])
+                for slot in slots
+            ]
+        )
+    )
+
+
+# the number of outfit rows of each exotic, as a dict of exotic hash -> rows from the most rows to the fewest
+def rows_per_exotic(exotic_hashes):
+    counts = pl.Series("exotic_hash", exotic_hashes).value_counts(sort=True)
+    return dict(zip(counts["exotic_hash"].to_list(), counts["count"].to_list()))
+
+
+# the number of armor combinations in the product of the slot matrices with 0 to MAX_ARTIFICE artifice pieces, counting
+# every piece sharing a row.  These are the outfits before artifice expansion, `armor_combination_count` is their sum
+def artifice_combination_counts(slots):
+    if any(len(slot) == 0 for slot in slots):
+        return np.zeros(MAX_ARTIFICE + 1, dtype=np.int64)
+
+    counts = np.ones(1)
+    for slot in slots:
+        pieces_per_row = (
+            np.ones(len(slot))
+            if slot.variants is None
+            else np.bincount(slot.variants[0], minlength=len(slot))
+        )
+        counts = np.convolve(
+            counts, np.bincount(slot.num_artifice, weights=pieces_per_row)
+        )
+    counts = np.pad(counts, (0, max(0, MAX_ARTIFICE + 1 - len(counts))))
+    return np.rint(counts[: MAX_ARTIFICE + 1]).astype(np.int64)
+
+
+# enumerate the rows `start` to `stop` of the product of the slot matrices into a shared memory block
+# the block holds each of OUTFIT_COLUMNS as a contiguous int64 column, so only its name and row count are pickled back
+# returns (None, 0) when there are no outfits, otherwise the caller owns the block and must unlink it
+def enumerate_outfit_range_to_shared_memory(
+    slots, start, stop, artifice_tier_table, masterwork_bonus, no_exotic_hash
+):
+    columns = expand_slot_variants(
+        expand_outfit_columns(
+            *outfit_product_range(slots, start, stop, masterwork_bonus, no_exotic_hash),
+            artifice_tier_table,
+        ),
+        slots,
+    )
+    row_count = len(columns["exotic_hash"])
+    if row_count == 0:
+        return None, 0
+
+    shared_memory = SharedMemory(
+        create=True, size=row_count * len(OUTFIT_COLUMNS) * np.dtype(np.int64).itemsize
+    )
+    shared_columns = np.ndarray(
+        (len(OUTFIT_COLUMNS), row_count), dtype=np.int64, buffer=shared_memory.buf
+    )
+    for i, column_name in enumerate(OUTFIT_COLUMNS):
+        shared_columns[i] = columns[column_name]
+    del shared_columns
+    shared_memory.close()
+    return shared_memory.name, row_count
+
+
+# parallel version of `enumerate_outfit_columns` over several products of slot matrices, ex: every pass for a class
+# each product is split into row ranges of at most `chunk_size` outfits that are enumerated by a pool of `max_workers`
+# processes, defaulting to one per core.  The shared memory blocks are copied into the output in the order of the ranges,
+# so the columns are the same as concatenating `enumerate_outfit_columns` for each product
+def enumerate_outfit_columns_parallel(
+    slots_list,
+    artifice_tier_table,
+    masterwork_bonus,
+    no_exotic_hash,
+    max_workers=None,
+    chunk_size=DEFAULT_OUTFIT_BATCH_SIZE,
+):
+    max_workers = max_workers or os.cpu_count() or 1
+
+    ranges = []
+    for slots in slots_list:
+        product_size = int(np.prod([len(slot) for slot in slots]))
+        range_size = max(1, min(chunk_size, -(-product_size // max_workers)))
+        ranges.extend(
+            (slots, start, min(start + range_size, product_size))
+            for start in range(0, product_size, range_size)
+        )
+
+    # polars runs its own threads, so workers aren't forked straight from this process.  The resource tracker is
+    # started first so the workers share it with us, otherwise it warns about the blocks we unlink
+    resource_tracker.ensure_running()
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(start_method)
+    ) as executor:
+        futures = [
+            executor.submit(
+                enumerate_outfit_range_to_shared_memory,
+                slots,
+                start,
+                stop,
+                artifice_tier_table,
+                masterwork_bonus,
+                no_exotic_hash,
+            )
+            for slots, start, stop in ranges
+        ]
+        blocks = [future.result() for future in futures]
+
+    row_count = sum(block_rows for _, block_rows in blocks)
+    outfit_columns = np.empty((len(OUTFIT_COLUMNS), row_count), dtype=np.int64)
+    offset = 0
+    for name, block_rows in blocks:
+        if name is None:
+            continue
+        shared_memory = SharedMemory(name=name)
+        try:
+            shared_columns = np.ndarray(
+                (len(OUTFIT_COLUMNS), block_rows),
+                dtype=np.int64,
+                buffer=shared_memory.buf,
+            )
+            outfit_columns[:, offset : offset + block_rows] = shared_columns
+            offset += block_rows
+            del shared_columns
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+    return {
+        column_name: outfit_columns[i] for i, column_name in enumerate(OUTFIT_COLUMNS)
+    }
+
+
+# turn the columns from enumerate_outfit_columns into the outfit table consumed by PinnacleOutfits
+# `schema` is OUTFIT_SCHEMA or COMPACT_OUTFIT_SCHEMA
+def outfit_columns_to_df(columns, schema=OUTFIT_SCHEMA):
+    return pl.DataFrame({name: columns[name] for name in OUTFIT_COLUMNS}, schema=schema)
+
+
+def empty_outfits_df(schema=OUTFIT_SCHEMA):
+    return pl.DataFrame(schema=schema)
+
+
+# works for a DataFrame or a LazyFrame
+def is_compact_outfits_df(outfits_df):
+    return outfits_df.collect_schema()["helmet"] == COMPACT_OUTFIT_SCHEMA["helmet"]
+
+
+# swap the ArmorTable rows in the slot columns of a compact outfit table for the instance ids of those rows
+# `instance_ids` is the `instance_ids` array of the ArmorTable the outfits were generated from
+def restore_instance_ids(outfits_df, instance_ids):
+    return outfits_df.with_columns(
+        pl.Series(
+            slot_column,
+            instance_ids[outfits_df[slot_column].to_numpy()],
+            dtype=pl.Int64,
+        )
+        for slot_column in SLOT_COLUMNS
+    )
+
+
+# regroup a stream of outfit columns into outfit tables of exactly `batch_size` rows, the last batch may be smaller
+# the batches are polars DataFrames backed by arrow memory, `batch.to_arrow()` gives a pyarrow Table without copying
+def outfit_column_batches(column_chunks, batch_size, schema=OUTFIT_SCHEMA):
+    pending = []
+    pending_rows = 0
+    for columns in column_chunks:
+        outfits_df = outfit_columns_to_df(columns, schema)
+        if len(outfits_df) == 0:
+            continue
+        pending.append(outfits_df)
+        pending_rows += len(outfits_df)
+
+        while pending_rows >= batch_size:
+            pending_df = pl.concat(pending)
+            yield pending_df.slice(0, batch_size)
+            pending = [pending_df.slice(batch_size)]
+            pending_rows -= batch_size
+
+    if pending_rows > 0:
+        yield pl.concat(pending)
+
+
+# the weight vectors for every combination of `stat_counts` stats at each of `weights`.  Weighted stats are multiplied by
+# the weight and the rest count once, the same scoring as the `weighted_*` columns of PinnacleOutfits
+# returns the scheme names, ex: "weighted_mobility_strength_x2", and a (schemes, 6) int matrix with a row per scheme
+def weighting_schemes(stat_counts=(1, 2, 3, 4), weights=(2,)):
+    scheme_names = []
+    weight_rows = []
+    for weight in weights:
+        for stat_count in stat_counts:
+            for combo in combinations(STAT_NAMES, stat_count):
+                scheme_names.append(f"weighted_{'_'.join(combo)}_x{weight}")
+                weight_rows.append(
+                    [weight if stat in combo else 1 for stat in STAT_NAMES]
+                )
+    return scheme_names, np.array(weight_rows, dtype=np.int64).reshape(
+        -1, len(STAT_NAMES)
+    )
+
+
+# score every outfit under every weighting scheme and find the outfits that have the best score of at least one scheme
+# for their exotic.  Each chunk of `chunk_size` outfits is scored with one (outfits, 6) x (6, schemes) matrix
+# product, so memory is bounded by the chunk rather than outfits x schemes.  Two passes: maxima, then the rows at a max
+# returns the exotic hashes, their (exotics, schemes) maximum scores, the pinnacle outfit rows and their scores
+def scheme_pinnacle_rows(stats, exotic_hash, weight_matrix, chunk_size=1 << 16):
+    exotic_hashes, exotic_index = np.unique(exotic_hash, return_inverse=True)
+    # numpy only hands float matrix products to BLAS, the scores are small integers so float64 holds them exactly
+    weights = weight_matrix.T.astype(np.float64)
+    scheme_maxima = np.full(
+        (len(exotic_hashes), len(weight_matrix)), np.iinfo(np.int32).min, dtype=np.int32
+    )
+
+    def chunk_scores(chunk):
+        return (stats[chunk].astype(np.float64) @ weights).astype(np.int32)
+
+    chunks = [
+        slice(start, min(start + chunk_size, len(stats)))
+        for start in range(0, len(stats), chunk_size)
+    ]
+    for chunk in chunks:
+        scores = chunk_scores(chunk)
+        # sort the chunk by exotic so each exotic's max is a reduce over a contiguous run of rows
+        order = np.argsort(exotic_index[chunk], kind="stable")
+        sorted_index = exotic_index[chunk][order]
+        run_starts = np.flatnonzero(np.diff(sorted_index, prepend=-1))
+        scheme_maxima[sorted_index[run_starts]] = np.maximum(
+            scheme_maxima[sorted_index[run_starts]],
+            np.maximum.reduceat(scores[order], run_starts, axis=0),
+        )
+
+    pinnacle_rows = []
+    pinnacle_scores = []
+    for chunk in chunks:
+        scores = chunk_scores(chunk)
+        at_max = (scores == scheme_maxima[exotic_index[chunk]]).any(axis=1)
+        pinnacle_rows.append(np.flatnonzero(at_max) + chunk.start)
+        pinnacle_scores.append(scores[at_max])
+
+    return (
+        exotic_hashes,
+        scheme_maxima,
+        np.concatenate(pinnacle_rows or [np.empty(0, dtype=np.int64)]),
+        np.concatenate(
+            pinnacle_scores or [np.empty((0, len(weight_matrix)), dtype=np.int32)]
+        ),
+    )
+
+
+# replace each representative instance id in the slot columns of `outfits_df` with every instance id it stands for
+# `equivalent_armor` maps a representative instance id to the instance ids of all of the armor it is equivalent to,
+# itself included.  A row with representatives of n and m pieces becomes n * m rows, ids not in the map are kept as is
+def expand_equivalent_outfits(outfits_df, equivalent_armor):
+    equivalents_df = pl.DataFrame(
+        {
+            "representative_id": [
+                representative_id
+                for representative_id, instance_ids in equivalent_armor.items()
+                for _ in instance_ids
+            ],
+            "equivalent_id": [
+                instance_id
+                for instance_ids in equivalent_armor.values()
+                for instance_id in instance_ids
+            ],
+        },
+        schema={"representative_id": pl.Int64, "equivalent_id": pl.Int64},
+    )
+
+    for slot_column in SLOT_COLUMNS:
+        outfits_df = (
+            outfits_df.join(
+                equivalents_df.rename({"representative_id": slot_column}),
+                on=slot_column,
+                how="left",
+            )
+            .with_columns(pl.coalesce("equivalent_id", slot_column).alias(slot_column))
+            .drop("equivalent_id")
+        )
+    return outfits_df
@@ -1,7 +1,13 @@
 import json
 from collections import defaultdict
 from dataclasses import dataclass, field
+from functools import cached_property
+
+import polars as pl
+
 from src.armor import Armor, ProfileOutfits
+from src.instrumentation import NO_INSTRUMENTATION
+from src.outfit_engine import SLOT_COLUMNS
 
 
 # holds the stat combination (ex: mob, or mob/res/str) and whether it is unique for this armor piece or not
@@ -51,7 +57,8 @@ class ArmorPinnacleStats:
     def pinnacle_exotic_count(self):
         return len(self.exotic_to_pinnacle_stats)
 
-    @property
+    # the counts are cached, the stat combinations don't change once the report model is built
+    @cached_property
     def total_pinnacle_outfits(self):
         return sum(
             [
@@ -60,7 +67,7 @@ class ArmorPinnacleStats:
             ]
         )
 
-    @property
+    @cached_property
     def unique_pinnacle_outfits(self):
         return sum(
             [
@@ -88,7 +95,7 @@ class ArmorPinnacleStats:
 
     def __str__(self):
         armor = self.armor
-        string = f"""id:{armor.instance_id} -- {armor.item_name} -- {armor.slot} -- m:{armor.mobility} r:{armor.resilience} r:{armor.recovery} d:{armor.discipline} i:{armor.intellect} s:{armor.strength} Σ:{armor.total_stats} α:{"T" if armor.is_artifice else "F"}-- total pinnacle outfits: {self.total_pinnacle_outfits} -- unique pinnacle outfits: {self.unique_pinnacle_outfits}"""
+        string = f"""id:{armor.instance_id} -- {armor.exotic_name} -- {armor.slot} -- m:{armor.mobility} r:{armor.resilience} r:{armor.recovery} d:{armor.discipline} i:{armor.intellect} s:{armor.strength} Σ:{armor.total_stats} α:{"T" if armor.is_artifice else "F"}-- total pinnacle outfits: {self.total_pinnacle_outfits} -- unique pinnacle outfits: {self.unique_pinnacle_outfits}"""
         for exotic, stat_combinations in sorted(
             self.exotic_to_pinnacle_stats.items(), key=lambda x: -len(x[1])
         ):
@@ -138,9 +145,12 @@ def find_weighted_max_column_pairs(df):
 
 
 # for each piece of armor, find the outfits where it is in a pinnacle outfit and identify the exotic and stat combinations that was pinnacle
+# armor pruned by ProfileOutfits' `prune_dominated_armor` is in no pinnacle outfit unless it was a tie, it has no pinnacle
+# outfits here and doesn't make another piece's stat combinations less unique
 def create_armor_pinnacle_stats_list(d2_class, armor_dict, outfits_df_max):
+    # exotic class items are a separate exotic for each pair of random perks, keyed by their exotic_hash
     armor_hash_to_name = {
-        armor.item_hash: armor.item_name
+        armor.exotic_hash: armor.exotic_name
         for armor in armor_dict.values()
         if armor.d2_class == d2_class
     }
@@ -150,134 +160,170 @@ def create_armor_pinnacle_stats_list(d2_class, armor_dict, outfits_df_max):
         if armor.d2_class == d2_class
     }
 
-    helmet_ordinal = find_field_ordinal("helmet", outfits_df_max)
-    gauntlets_ordinal = find_field_ordinal("gauntlets", outfits_df_max)
-    chest_ordinal = find_field_ordinal("chest_armor", outfits_df_max)
-    leg_ordinal = find_field_ordinal("leg_armor", outfits_df_max)
-    class_item_ordinal = find_field_ordinal("class_item", outfits_df_max)
-    exotic_hash_ordinal = find_field_ordinal("exotic_hash", outfits_df_max)
-
     weighted_max_pairs_dict = find_weighted_max_column_pairs(outfits_df_max)
+    stat_combinations = list(weighted_max_pairs_dict)
+
+    # flag the stat combinations each outfit is pinnacle for, then turn the five armor columns into rows so each armor
+    # piece gets the stat combinations of every pinnacle outfit it is in, for each exotic.  `first_row` is the first
+    # outfit where the armor is pinnacle with that exotic, it keeps the exotics in the order the outfits have them
+    pinnacle_flags = [
+        (
+            pl.col(outfits_df_max.columns[weighted_ordinal])
+            == pl.col(outfits_df_max.columns[max_ordinal])
+        ).alias(stat_combination)
+        for stat_combination, (weighted_ordinal, max_ordinal) in weighted_max_pairs_dict.items()
+    ]
+    armor_pinnacle_df = (
+        outfits_df_max.lazy()
+        .with_row_index("row")
+        .select("row", "exotic_hash", *SLOT_COLUMNS, *pinnacle_flags)
+        .filter(pl.any_horizontal(stat_combinations))
+        .unpivot(
+            on=SLOT_COLUMNS,
+            index=["row", "exotic_hash", *stat_combinations],
+            value_name="instance_id",
+        )
+        .group_by("instance_id", "exotic_hash")
+        .agg(
+            pl.col("row").min().alias("first_row"),
+            pl.col(stat_combinations).any(),
+        )
+        .unpivot(
+            on=stat_combinations,
+            index=["instance_id", "exotic_hash", "first_row"],
+            variable_name="stat_combination",
+            value_name="is_pinnacle",
+        )
+        .filter(pl.col("is_pinnacle"))
+        .sort("first_row", "instance_id", "exotic_hash")
+        .select("instance_id", "exotic_hash", "stat_combination")
+        .collect()
+    )
 
     # create a dictionary that is a hash where the key is Armor and the value is
     # another hash of `exotic_name` to a set of stat combinations where this armor is pinnacle
-    for row in outfits_df_max.iter_rows():
-        helmet_id = row[helmet_ordinal]
-        gauntlets_id = row[gauntlets_ordinal]
-        chest_id = row[chest_ordinal]
-        leg_id = row[leg_ordinal]
-        class_item_id = row[class_item_ordinal]
-        exotic_hash = row[exotic_hash_ordinal]
-
+    for instance_id, exotic_hash, stat_combination in armor_pinnacle_df.iter_rows():
         exotic_name = "No Exotic"
 
         if exotic_hash != ProfileOutfits.NO_EXOTIC_HASH:
             exotic_name = armor_hash_to_name[exotic_hash]
 
-        for key, value in weighted_max_pairs_dict.items():
-            if row[value[0]] == row[value[1]]:
-                armor_to_exotic_to_set[armor_dict[helmet_id]][exotic_name].add(
-                    PinnacleStats(key)
-                )
-                armor_to_exotic_to_set[armor_dict[gauntlets_id]][exotic_name].add(
-                    PinnacleStats(key)
-                )
-                armor_to_exotic_to_set[armor_dict[chest_id]][exotic_name].add(
-                    PinnacleStats(key)
-                )
-                armor_to_exotic_to_set[armor_dict[leg_id]][exotic_name].add(
-                    PinnacleStats(key)
-                )
-                armor_to_exotic_to_set[armor_dict[class_item_id]][exotic_name].add(
-                    PinnacleStats(key)
-                )
+        armor_to_exotic_to_set[armor_dict[instance_id]][exotic_name].add(stat_combination)
 
-    # turn the armor_to_exotic_set into a list of ArmorPinnacleStats, turn the defaultdict(set) into a dict
-    armor_pinnacle_stats_list = [
-        ArmorPinnacleStats(armor, dict(exotic_to_set))
-        for armor, exotic_to_set in armor_to_exotic_to_set.items()
-    ]
+    # a pinnacle stat combination is unique when no other armor piece in the same slot is pinnacle for the same exotic and
+    # stat combination.  Exotic armor only counts for its own exotic, another exotic in the same slot is never fungible
+    def counts_for(armor, exotic):
+        return not armor.is_exotic or armor.exotic_name == exotic
+
+    # (slot, exotic, stat combination) -> the number of armor pieces that are pinnacle for it
+    pinnacle_counts = defaultdict(int)
+    for armor, exotic_to_set in armor_to_exotic_to_set.items():
+        for exotic, stat_combinations in exotic_to_set.items():
+            if counts_for(armor, exotic):
+                for stat_combination in stat_combinations:
+                    pinnacle_counts[(armor.slot, exotic, stat_combination)] += 1
 
-    for armor_pinnacle_stats in armor_pinnacle_stats_list:
-        armor = armor_pinnacle_stats.armor
-        exotic_to_pinnacle_stats = armor_pinnacle_stats.exotic_to_pinnacle_stats
-
-        for exotic, pinnacle_stat_combinations in exotic_to_pinnacle_stats.items():
-            for other_armor_pinnacle_stats in armor_pinnacle_stats_list:
-                if (
-                    other_armor_pinnacle_stats.armor.slot != armor.slot
-                ):  # if it is in another slot, it isn't fungible
-                    continue
-                if other_armor_pinnacle_stats.armor == armor:  # same armor piece
-                    continue
-
-                # only compare an exotic to another instance of the same exotic
-                if (
-                    other_armor_pinnacle_stats.armor.is_exotic
-                    and other_armor_pinnacle_stats.armor.item_name != exotic
-                ):
-                    continue
-
-                if exotic in other_armor_pinnacle_stats.exotic_to_pinnacle_stats:
-                    for pinnacle_stat in pinnacle_stat_combinations:
-                        # if we still think it is unique, but find that the other armor has this same pinnacle stat, mark it as not unique
-                        if (
-                            pinnacle_stat
-                            in other_armor_pinnacle_stats.exotic_to_pinnacle_stats[
-                                exotic
-                            ]
-                        ):
-                            pinnacle_stat.is_unique = False
+    # turn the armor_to_exotic_set into a list of ArmorPinnacleStats, turn the defaultdict(set) into a dict
+    armor_pinnacle_stats_list = []
+    for armor, exotic_to_set in armor_to_exotic_to_set.items():
+        exotic_to_pinnacle_stats = {}
+        for exotic, stat_combinations in exotic_to_set.items():
+            # don't count this piece against itself
+            own_count = 1 if counts_for(armor, exotic) else 0
+            exotic_to_pinnacle_stats[exotic] = {
+                PinnacleStats(
+                    stat_combination,
+                    pinnacle_counts[(armor.slot, exotic, stat_combination)] == own_count,
+                )
+                for stat_combination in stat_combinations
+            }
+        armor_pinnacle_stats_list.append(ArmorPinnacleStats(armor, exotic_to_pinnacle_stats))
 
     return armor_pinnacle_stats_list
 
 
+# the report model for a class's pinnacle outfits, build it once with `pinnacle_report` and pass it as `model` to the
+# legendary, exotic and JSON reports to share it between them
+@dataclass
+class PinnacleReport:
+    d2_class: str
+    armor_pinnacle_stats_list: list
+
+    # most unique, then most total pinnacle outfits first
+    @cached_property
+    def by_pinnacle_outfits(self):
+        return sorted(
+            self.armor_pinnacle_stats_list,
+            key=lambda x: (x.unique_pinnacle_outfits, x.total_pinnacle_outfits),
+            reverse=True,
+        )
+
+    # by item name, then most unique and most total pinnacle outfits first
+    @cached_property
+    def by_item_name(self):
+        return sorted(
+            self.armor_pinnacle_stats_list,
+            key=lambda x: (
+                x.item_name,
+                -x.unique_pinnacle_outfits,
+                -x.total_pinnacle_outfits,
+            ),
+        )
+
+
+# the PinnacleReport for a class
+def pinnacle_report(d2_class, armor_dict, pinnacle_outfits_df, instrumentation=None):
+    instrumentation = instrumentation or NO_INSTRUMENTATION
+    with instrumentation.stage("pinnacle_report", d2_class=d2_class):
+        report = PinnacleReport(
+            d2_class,
+            create_armor_pinnacle_stats_list(d2_class, armor_dict, pinnacle_outfits_df),
+        )
+        instrumentation.count(
+            pinnacle_outfits=len(pinnacle_outfits_df),
+            armor=len(report.armor_pinnacle_stats_list),
+        )
+    return report
+
+
 # prints out the legendary armor pieces and the exotic and stat combinations where this armor piece was in a pinnacle outfit
+# `model` is the PinnacleReport of the pinnacle outfits, it is built from them when it isn't passed
 def legendary_armor_to_pinnacle_outfits_report(
-    d2_class, armor_dict, pinnacle_outfits_df
+    d2_class, armor_dict, pinnacle_outfits_df, instrumentation=None, model=None
 ):
-    armor_pinnacle_stats_list = create_armor_pinnacle_stats_list(
-        d2_class, armor_dict, pinnacle_outfits_df
-    )
-
-    num = 0
-    for armor_pinnacle_stats in sorted(
-        armor_pinnacle_stats_list,
-        key=lambda x: (x.unique_pinnacle_outfits, x.total_pinnacle_outfits),
-        reverse=True,
-    ):
-        if armor_pinnacle_stats.is_exotic:
-            continue
-        if armor_pinnacle_stats.is_ignored and armor_pinnacle_stats.unique_pinnacle_outfits == 0:
-            continue
-        num += 1
-        print(armor_pinnacle_stats)
-    print(f"Total pieces: {num}")
+    instrumentation = instrumentation or NO_INSTRUMENTATION
+    with instrumentation.stage("legendary_armor_to_pinnacle_outfits_report", d2_class=d2_class):
+        report = model or pinnacle_report(d2_class, armor_dict, pinnacle_outfits_df, instrumentation)
+
+        num = 0
+        for armor_pinnacle_stats in report.by_pinnacle_outfits:
+            if armor_pinnacle_stats.is_exotic:
+                continue
+            if armor_pinnacle_stats.is_ignored and armor_pinnacle_stats.unique_pinnacle_outfits == 0:
+                continue
+            num += 1
+            print(armor_pinnacle_stats)
+        print(f"Total pieces: {num}")
+        instrumentation.count(pieces=num)
 
 
 # prints out the exotic armor pieces and the stat combinations where this armor piece was in a pinnacle outfit
-# sorts by exotic name and then by the number of pinnacle outfits
-def exotic_armor_to_pinnacle_outfits_report(d2_class, armor_dict, pinnacle_outfits_df):
-    armor_pinnacle_stats_list = create_armor_pinnacle_stats_list(
-        d2_class, armor_dict, pinnacle_outfits_df
-    )
-
-    num = 0
-    for armor_pinnacle_stats in sorted(
-        armor_pinnacle_stats_list,
-        key=lambda x: (
-            x.item_name,
-            -x.unique_pinnacle_outfits,
-            -x.total_pinnacle_outfits,
-        ),
-    ):
-        if not armor_pinnacle_stats.is_exotic:
-            continue
-        if armor_pinnacle_stats.is_ignored and armor_pinnacle_stats.unique_pinnacle_outfits == 0:
-            continue
-        num += 1
-        print(armor_pinnacle_stats)
-    print(f"Total pieces: {num}")
+# sorts by exotic name and then by the number of pinnacle outfits, `model` is as for the legendary report
+def exotic_armor_to_pinnacle_outfits_report(d2_class, armor_dict, pinnacle_outfits_df, instrumentation=None, model=None):
+    instrumentation = instrumentation or NO_INSTRUMENTATION
+    with instrumentation.stage("exotic_armor_to_pinnacle_outfits_report", d2_class=d2_class):
+        report = model or pinnacle_report(d2_class, armor_dict, pinnacle_outfits_df, instrumentation)
+
+        num = 0
+        for armor_pinnacle_stats in report.by_item_name:
+            if not armor_pinnacle_stats.is_exotic:
+                continue
+            if armor_pinnacle_stats.is_ignored and armor_pinnacle_stats.unique_pinnacle_outfits == 0:
+                continue
+            num += 1
+            print(armor_pinnacle_stats)
+        print(f"Total pieces: {num}")
+        instrumentation.count(pieces=num)
 
 def convert_stat_group(*, stat_group, is_unique):
     # converts a list of stat groups like 'dis/int/str' into their json representation.
@@ -286,62 +332,57 @@ def convert_stat_group(*, stat_group, is_unique):
         groups.append({"stats": sg.split(sep="/"), "unique": is_unique })
     return groups
 
-def armor_to_pinnacle_outfits_json(d2_class, armor_dict, pinnacle_outfits_df):
-    armor_pinnacle_stats_list = create_armor_pinnacle_stats_list(
-        d2_class, armor_dict, pinnacle_outfits_df
-    )
-    report = []
-    for armor_pinnacle_stats in sorted(
-        armor_pinnacle_stats_list,
-        key=lambda x: (
-            x.item_name,
-            -x.unique_pinnacle_outfits,
-            -x.total_pinnacle_outfits,
-        ),
-    ):
-        armor = {}
-        armor['name']        = armor_pinnacle_stats.armor.item_name
-        armor['type']        = armor_pinnacle_stats.armor.slot
-        armor['id']          = armor_pinnacle_stats.armor.instance_id
-        armor['hash']        = armor_pinnacle_stats.armor.item_hash
-        armor['is_exotic']   = armor_pinnacle_stats.armor.rarity == "Exotic"
-        armor['is_artifice'] = armor_pinnacle_stats.armor.is_artifice
-        armor['total_pinnacle_outfit_count']  = armor_pinnacle_stats.total_pinnacle_outfits
-        armor['unique_pinnacle_outfit_count'] = armor_pinnacle_stats.unique_pinnacle_outfits
-        armor['mobility']   = armor_pinnacle_stats.armor.mobility
-        armor['resilience'] = armor_pinnacle_stats.armor.resilience
-        armor['recovery']   = armor_pinnacle_stats.armor.recovery
-        armor['discipline'] = armor_pinnacle_stats.armor.discipline
-        armor['intellect']  = armor_pinnacle_stats.armor.intellect
-        armor['strength']   = armor_pinnacle_stats.armor.strength
-        armor['stat_total'] = armor_pinnacle_stats.armor.mobility + \
-                                armor_pinnacle_stats.armor.resilience + \
-                                armor_pinnacle_stats.armor.recovery + \
-                                armor_pinnacle_stats.armor.discipline + \
-                                armor_pinnacle_stats.armor.intellect + \
-                                armor_pinnacle_stats.armor.strength
-        armor['d2_class'] = armor_pinnacle_stats.armor.d2_class
-
-        pinnacle_outfits = {}
-        for exotic, stat_combinations in sorted(
-            armor_pinnacle_stats.exotic_to_pinnacle_stats.items(), key=lambda x: -len(x[1])
-        ):
-            stat_combination_list = sorted (
-                [str(stat_combination).strip('~') for stat_combination in stat_combinations if not stat_combination.is_unique]
-            )
-            unique_stat_combination_list = sorted (
-                [str(stat_combination) for stat_combination in stat_combinations if stat_combination.is_unique]
-            )
-            nonunique_stats = convert_stat_group(stat_group=stat_combination_list, is_unique=False)
-            unique_stats    = convert_stat_group(stat_group=unique_stat_combination_list, is_unique=True)
+# `model` is as for the legendary report
+def armor_to_pinnacle_outfits_json(d2_class, armor_dict, pinnacle_outfits_df, report_directory="./data", instrumentation=None, model=None):
+    instrumentation = instrumentation or NO_INSTRUMENTATION
+    with instrumentation.stage("armor_to_pinnacle_outfits_json", d2_class=d2_class):
+        model = model or pinnacle_report(d2_class, armor_dict, pinnacle_outfits_df, instrumentation)
+        report = []
+        for armor_pinnacle_stats in model.by_item_name:
+            armor = {}
+            armor['name']        = armor_pinnacle_stats.armor.item_name
+            armor['type']        = armor_pinnacle_stats.armor.slot
+            armor['id']          = armor_pinnacle_stats.armor.instance_id
+            armor['hash']        = armor_pinnacle_stats.armor.item_hash
+            armor['is_exotic']   = armor_pinnacle_stats.armor.rarity == "Exotic"
+            armor['is_artifice'] = armor_pinnacle_stats.armor.is_artifice
+            armor['total_pinnacle_outfit_count']  = armor_pinnacle_stats.total_pinnacle_outfits
+            armor['unique_pinnacle_outfit_count'] = armor_pinnacle_stats.unique_pinnacle_outfits
+            armor['mobility']   = armor_pinnacle_stats.armor.mobility
+            armor['resilience'] = armor_pinnacle_stats.armor.resilience
+            armor['recovery']   = armor_pinnacle_stats.armor.recovery
+            armor['discipline'] = armor_pinnacle_stats.armor.discipline
+            armor['intellect']  = armor_pinnacle_stats.armor.intellect
+            armor['strength']   = armor_pinnacle_stats.armor.strength
+            armor['stat_total'] = armor_pinnacle_stats.armor.mobility + \
+                                    armor_pinnacle_stats.armor.resilience + \
+                                    armor_pinnacle_stats.armor.recovery + \
+                                    armor_pinnacle_stats.armor.discipline + \
+                                    armor_pinnacle_stats.armor.intellect + \
+                                    armor_pinnacle_stats.armor.strength
+            armor['d2_class'] = armor_pinnacle_stats.armor.d2_class
+
+            pinnacle_outfits = {}
+            for exotic, stat_combinations in sorted(
+                armor_pinnacle_stats.exotic_to_pinnacle_stats.items(), key=lambda x: -len(x[1])
+            ):
+                stat_combination_list = sorted (
+                    [str(stat_combination).strip('~') for stat_combination in stat_combinations if not stat_combination.is_unique]
+                )
+                unique_stat_combination_list = sorted (
+                    [str(stat_combination) for stat_combination in stat_combinations if stat_combination.is_unique]
+                )
+                nonunique_stats = convert_stat_group(stat_group=stat_combination_list, is_unique=False)
+                unique_stats    = convert_stat_group(stat_group=unique_stat_combination_list, is_unique=True)
 
-            # merge and return the two lists
-            pinnacle_outfits[exotic] = unique_stats + nonunique_stats
+                # merge and return the two lists
+                pinnacle_outfits[exotic] = unique_stats + nonunique_stats
 
-        armor['pinnacle_outfits'] = pinnacle_outfits
-        report.append(armor)
+            armor['pinnacle_outfits'] = pinnacle_outfits
+            report.append(armor)
 
-    with open(f"./data/armor-report-{d2_class.lower()}.json", 'w', encoding="utf-8") as f:
-        json.dump(report, f, indent = 2)
+        with open(f"{report_directory}/armor-report-{d2_class.lower()}.json", 'w', encoding="utf-8") as f:
+            json.dump(report, f, indent = 2)
 
-    print(f"Wrote JSON file with {len(report)} {d2_class} items.")
+        print(f"Wrote JSON file with {len(report)} {d2_class} items.")
+        instrumentation.count(pieces=len(report))
@@ -0,0 +1,272 @@
+# seeded synthetic vaults for benchmarks, a vault of any size with roughly the stat rolls, artifice armor and exotics of
+# a real one, and the profile json that d2profile.ipynb would download for it so ProfileArmor can be measured as well
+#
+# the rolls follow armor 2.0: every piece has 4 stat plugs of 3 stats each, two for mobility/resilience/recovery and two
+# for discipline/intellect/strength.  Totals land between 48 and 68, skewed towards the 60s as low rolls get sharded, and
+# each plug puts most of its points into one or two stats.  Legendary class items have no stat plugs
+import random
+import zlib
+from dataclasses import dataclass
+
+from src.armor import Armor, ProfileArmor
+
+SLOTS = ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"]
+
+CLASS_ITEM_NAMES = {
+    "Hunter": "Hunter Cloak",
+    "Titan": "Titan Mark",
+    "Warlock": "Warlock Bond",
+}
+
+STAT_PLUG_GROUPS = [
+    [ProfileArmor.MOBILITY_ID, ProfileArmor.RESILIENCE_ID, ProfileArmor.RECOVERY_ID],
+    [ProfileArmor.DISCIPLINE_ID, ProfileArmor.INTELLECT_ID, ProfileArmor.STRENGTH_ID],
+]
+
+STAT_DEFINITION_NAMES = {
+    ProfileArmor.MOBILITY_ID: "Mobility",
+    ProfileArmor.RESILIENCE_ID: "Resilience",
+    ProfileArmor.RECOVERY_ID: "Recovery",
+    ProfileArmor.DISCIPLINE_ID: "Discipline",
+    ProfileArmor.INTELLECT_ID: "Intellect",
+    ProfileArmor.STRENGTH_ID: "Strength",
+}
+
+EXOTIC_CLASS_ITEM_PERKS = [
+    ["Spirit of the Assassin", "Spirit of Inmost Light", "Spirit of the Ophidian"],
+    ["Spirit of the Star-Eater", "Spirit of Synthoceps", "Spirit of Verity"],
+]
+
+MIN_STAT_TOTAL = 48
+MAX_STAT_TOTAL = 68
+STAT_TOTAL_MODE = 63
+
+# the power and energy of everything in the vault, only masterworked armor has an energy capacity of 10
+POWER = 1990
+POWER_STAT_HASH = 1935470627
+MASTERWORK_ENERGY = 10
+
+# plugs get made up hashes above the crc32 item hashes of the armor
+PLUG_HASH_OFFSET = 1 << 32
+
+
+# how a synthetic vault is made up, `pieces_per_slot` legendary pieces in every slot of every class and the exotics are
+# ratios of it.  `exotics_per_item` is how many copies of each exotic the vault holds, `legendary_items_per_slot` how
+# many different legendary armor items the legendary pieces are spread over, and `artifice_ratio` is of legendary armor
+@dataclass
+class SyntheticVault:
+    pieces_per_slot: int = 10
+    d2_classes: tuple = ("Hunter", "Titan", "Warlock")
+    seed: int = 0
+    artifice_ratio: float = 0.3
+    exotic_ratio: float = 0.2
+    exotic_class_item_ratio: float = 0.1
+    masterworked_ratio: float = 0.8
+    exotics_per_item: int = 2
+    legendary_items_per_slot: int = 12
+
+    # the Armor in the vault, in the order ProfileArmor reads them back from `profile`
+    def armor_list(self):
+        return [armor for armor, _ in self.__rolls()]
+
+    # the armor keyed by instance_id, like `ProfileArmor.get_armor_dict`
+    def armor_dict(self):
+        return {armor.instance_id: armor for armor in self.armor_list()}
+
+    # the profile, item definitions and stat definitions of the vault, in the shape of the files d2profile.ipynb saves
+    # all armor is in the vault rather than on a character.  `ProfileArmor(*vault.profile()).get_armor_dict()` equals
+    # `vault.armor_dict()`
+    def profile(self):
+        item_definitions = {}
+        plug_hashes = {}
+
+        def plug_hash(name, item_type_and_tier, investment_stats=None):
+            key = (name, item_type_and_tier, investment_stats)
+            if key not in plug_hashes:
+                plug_hashes[key] = PLUG_HASH_OFFSET + len(plug_hashes)
+                plug_definition = {
+                    "displayProperties": {"name": name},
+                    "itemTypeAndTierDisplayName": item_type_and_tier,
+                }
+                if investment_stats is not None:
+                    plug_definition["investmentStats"] = [
+                        {"statTypeHash": int(stat_hash), "value": value}
+                        for stat_hash, value in investment_stats
+                    ]
+                item_definitions[str(plug_hashes[key])] = plug_definition
+            return plug_hashes[key]
+
+        class_types = {
+            d2_class: class_type
+            for class_type, d2_class in ProfileArmor.CLASS_MAP.items()
+        }
+
+        items = []
+        instances = {}
+        sockets = {}
+        for armor, stat_plugs in self.__rolls():
+            item_definitions[str(armor.item_hash)] = {
+                "itemType": ProfileArmor.ARMOR_ITEM_TYPE,
+                "displayProperties": {"name": armor.item_name},
+                "inventory": {"tierTypeName": armor.rarity},
+                "itemTypeDisplayName": CLASS_ITEM_NAMES[armor.d2_class]
+                if armor.slot == "Class Item"
+                else armor.slot,
+                "classType": class_types[armor.d2_class],
+            }
+
+            plugs = [
+                plug_hash(
+                    "Synthetic Stat Plug",
+                    "Common Armor Stat Plug",
+                    tuple(zip(stat_hashes, values)),
+                )
+                for stat_hashes, values in stat_plugs
+            ]
+            if armor.is_artifice:
+                plugs.append(plug_hash("Artifice Armor", "Intrinsic"))
+            plugs.extend(
+                plug_hash(perk, "Exotic Intrinsic")
+                for perk in armor.random_exotic_perks
+            )
+
+            items.append(
+                {
+                    "itemHash": armor.item_hash,
+                    "itemInstanceId": str(armor.instance_id),
+                    "quantity": 1,
+                    "location": 2,
+                }
+            )
+            instances[str(armor.instance_id)] = {
+                "primaryStat": {"statHash": POWER_STAT_HASH, "value": armor.power},
+                "energy": {
+                    "energyCapacity": MASTERWORK_ENERGY
+                    if armor.is_masterworked
+                    else MASTERWORK_ENERGY - 1
+                },
+            }
+            sockets[str(armor.instance_id)] = {
+                "sockets": [
+                    {"plugHash": plug, "isEnabled": True, "isVisible": True}
+                    for plug in plugs
+                ]
+            }
+
+        profile = {
+            "responseMintedTimestamp": "2024-01-01T00:00:00Z",
+            "profile": {"data": {"characterIds": []}},
+            "characterEquipment": {"data": {}},
+            "characterInventories": {"data": {}},
+            "profileInventory": {"data": {"items": items}},
+            "itemComponents": {
+                "instances": {"data": instances},
+                "sockets": {"data": sockets},
+            },
+        }
+        stat_definitions = {
+            stat_hash: {"displayProperties": {"name": name}}
+            for stat_hash, name in STAT_DEFINITION_NAMES.items()
+        }
+        return profile, item_definitions, stat_definitions
+
+    # every armor piece with the stat plugs it rolled as (stat hashes, values) pairs, its stats are the sum of its plugs
+    # the same seed always rolls the same vault
+    def __rolls(self):
+        rng = random.Random(self.seed)
+        rolls = []
+        for d2_class in self.d2_classes:
+            for slot in SLOTS:
+                for i in range(self.pieces_per_slot):
+                    rolls.append(
+                        self.__roll(
+                            rng,
+                            d2_class,
+                            slot,
+                            "Legendary",
+                            i % self.legendary_items_per_slot,
+                        )
+                    )
+
+                # exotic class items are all the same item with a different pair of perks, like Solipsism
+                if slot == "Class Item":
+                    exotic_count = round(
+                        self.pieces_per_slot * self.exotic_class_item_ratio
+                    )
+                    item_count = 1
+                else:
+                    exotic_count = round(self.pieces_per_slot * self.exotic_ratio)
+                    item_count = max(1, exotic_count // self.exotics_per_item)
+                for i in range(exotic_count):
+                    rolls.append(
+                        self.__roll(rng, d2_class, slot, "Exotic", i % item_count)
+                    )
+        return rolls
+
+    def __roll(self, rng, d2_class, slot, rarity, item_index):
+        item_name = f"{d2_class} {rarity} {slot} {item_index + 1}"
+        random_exotic_perks = ()
+        if rarity == "Exotic" and slot == "Class Item":
+            random_exotic_perks = tuple(
+                rng.choice(perks) for perks in EXOTIC_CLASS_ITEM_PERKS
+            )
+
+        stat_plugs = []
+        if rarity == "Exotic" or slot != "Class Item":
+            stat_plugs = [
+                (stat_hashes, plug_values(rng, plug_total))
+                for stat_hashes, group_total in zip(
+                    STAT_PLUG_GROUPS, group_totals(rng, stat_total(rng))
+                )
+                for plug_total in split_total(rng, group_total)
+            ]
+
+        stats = {stat_hash: 0 for stat_hash in STAT_DEFINITION_NAMES}
+        for stat_hashes, values in stat_plugs:
+            for stat_hash, value in zip(stat_hashes, values):
+                stats[stat_hash] += value
+
+        armor = Armor(
+            item_name=item_name,
+            item_hash=zlib.crc32(item_name.encode()),
+            instance_id=rng.randint(0, 9223372036854775807),
+            rarity=rarity,
+            slot=slot,
+            power=POWER,
+            mobility=stats[ProfileArmor.MOBILITY_ID],
+            resilience=stats[ProfileArmor.RESILIENCE_ID],
+            recovery=stats[ProfileArmor.RECOVERY_ID],
+            discipline=stats[ProfileArmor.DISCIPLINE_ID],
+            intellect=stats[ProfileArmor.INTELLECT_ID],
+            strength=stats[ProfileArmor.STRENGTH_ID],
+            is_artifice=rarity == "Legendary" and rng.random() < self.artifice_ratio,
+            is_masterworked=rng.random() < self.masterworked_ratio,
+            d2_class=d2_class,
+            random_exotic_perks=random_exotic_perks,
+        )
+        return armor, stat_plugs
+
+
+# the total stats of a piece between MIN_STAT_TOTAL and MAX_STAT_TOTAL, most of them in the 60s
+def stat_total(rng):
+    return round(rng.triangular(MIN_STAT_TOTAL, MAX_STAT_TOTAL, STAT_TOTAL_MODE))
+
+
+# a piece's total split between its mobility/resilience/recovery and discipline/intellect/strength plugs
+def group_totals(rng, total):
+    first_group_total = rng.randint(total // 2 - 6, total // 2 + 6)
+    return [first_group_total, total - first_group_total]
+
+
+# the totals of the two plugs of a stat group
+def split_total(rng, total):
+    first_plug_total = rng.randint(total // 2 - 3, total // 2 + 3)
+    return [first_plug_total, total - first_plug_total]
+
+
+# the 3 stats of a plug, at least 1 each and most of the points in one or two of them
+def plug_values(rng, total):
+    weights = [rng.expovariate(1) for _ in range(3)]
+    values = [1 + int((total - 3) * weight / sum(weights)) for weight in weights]
+    values[weights.index(max(weights))] += total - sum(values)
+    return tuple(values)
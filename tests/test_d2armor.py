@@ -1,8 +1,50 @@
 import unittest
 import random
-from src.armor import Armor, ProfileOutfits, random_64_int
+from dataclasses import replace
+from src.armor import (
+    Armor,
+    ArmorTable,
+    PinnacleOutfits,
+    ProfileArmor,
+    ProfileOutfits,
+    random_64_int,
+)
+from src.outfit_engine import (
+    COMPACT_MAX_ARMOR_ROWS,
+    OUTFIT_COLUMNS,
+    SLOT_COLUMNS,
+    STAT_NAMES,
+    ArtificeTierTable,
+    weighting_schemes,
+)
+from src.outfit_cache import OutfitCache
+from src.batch import flag_ignored_armor, run_classes
+from src.benchmark import (
+    BenchmarkResult,
+    find_regressions,
+    measure_memory,
+    read_results,
+    write_results,
+)
+from src.instrumentation import Instrumentation
+from src.synthetic_vault import SyntheticVault
+from src import report
+from src.report import (
+    PinnacleReport,
+    create_armor_pinnacle_stats_list,
+    exotic_armor_to_pinnacle_outfits_report,
+    legendary_armor_to_pinnacle_outfits_report,
+    pinnacle_report,
+)
 
+import io
 import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from itertools import product
+
+import polars as pl
 
 random.seed(42)
 
@@ -14,7 +56,7 @@ class TestOutfits(unittest.TestCase):
     def random_stat(self):
         return random.randint(1, 42)
 
-    def random_armor(self, slot, rarity="Legendary", item_hash=None):
+    def random_armor(self, slot, rarity="Legendary", item_hash=None, is_artifice=False):
         if item_hash is None:
             item_hash = random_64_int()
         return Armor(
@@ -27,6 +69,36 @@ class TestOutfits(unittest.TestCase):
             discipline=self.random_stat(),
             intellect=self.random_stat(),
             strength=self.random_stat(),
+            is_artifice=is_artifice,
+        )
+
+    # a small vault with a mix of artifice, non-artifice and exotic armor in every slot
+    def random_armor_list(self, pieces_per_slot=3, exotics_per_slot=1):
+        armor_list = []
+        for slot in ["Helmet", "Gauntlets", "Chest Armor", "Leg Armor", "Class Item"]:
+            for i in range(pieces_per_slot):
+                armor_list.append(self.random_armor(slot, is_artifice=i % 2 == 0))
+            if slot == "Class Item":
+                continue
+            for i in range(exotics_per_slot):
+                armor_list.append(self.random_armor(slot, "Exotic"))
+        return armor_list
+
+    # the Warlock pinnacle outfits of `armor_dict` built eagerly, every outfit in one table, which the other ways of
+    # building outfits and pinnacle outfits are checked against.  Its `outfits` is that table
+    def eager_pinnacle_outfits(self, armor_dict):
+        return PinnacleOutfits(
+            ProfileOutfits(armor_dict).generate_class_outfits_df("Warlock", True)
+        )
+
+    # the outfit tables have the same rows in any order, compared on `columns`, by default the columns of `outfits_df`
+    # but the `*_max` columns.  Those also hold the max instance ids, which depend on the armor that was enumerated
+    def assertSameOutfits(self, outfits_df, expected_outfits_df, columns=None):
+        if columns is None:
+            columns = [c for c in outfits_df.columns if not c.endswith("_max")]
+        self.assertEqual(
+            sorted(outfits_df.select(columns).rows()),
+            sorted(expected_outfits_df.select(columns).rows()),
         )
 
     def setUp(self):
@@ -814,9 +886,1278 @@ class TestOutfits(unittest.TestCase):
         outfits_4 = profile_outfits_4.generate_class_outfits("Warlock", True)
         self.assertEqual(len(outfits_4), 22)
 
-        # print outfits_4 to a file in data as json
-        with open("data/outfits_4.json", "w") as f:
-            json.dump(outfits_4, f, indent=4)
+        # print outfits_4 to a temporary file as json
+        with tempfile.TemporaryDirectory() as output_directory:
+            with open(os.path.join(output_directory, "outfits_4.json"), "w") as f:
+                json.dump(outfits_4, f, indent=4)
+
+    def test_shared_partial_sum_outfit_order(self):
+        armor_dict = self.armor_list_to_dict(
+            [
+                self.helmet,
+                self.gauntlets,
+                self.chest_armor,
+                self.leg_armor,
+                self.class_item,
+                self.exotic_helmet,
+                self.exotic_helmet2,
+                self.exotic_gauntlets,
+            ]
+        )
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        # the shared partial sum tables keep the outfits in the same order as the list of outfits
+        self.assertEqual(
+            profile_outfits.generate_class_outfits_df("Warlock", True).rows(),
+            profile_outfits.generate_class_outfits("Warlock", True),
+        )
+
+    def test_generate_class_outfits_df(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        outfits = profile_outfits.generate_class_outfits("Warlock", True)
+        outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+
+        self.assertEqual(outfits_df.columns[0], "mobility")
+        self.assertEqual(len(outfits_df), len(outfits))
+
+        # an empty slot means there are no outfits for that pass
+        self.assertEqual(
+            len(profile_outfits.generate_class_outfits_df("Titan", True)), 0
+        )
+
+    # every other way of generating the outfit table makes the same table as `generate_class_outfits_df`, in order
+    def test_outfits_match_eager(self):
+        armor_list = self.random_armor_list()
+        armor_dict = self.armor_list_to_dict(armor_list)
+        outfits_df = self.eager_pinnacle_outfits(armor_dict).outfits
+        profile_outfits = ProfileOutfits(armor_dict)
+        compact_profile_outfits = ProfileOutfits(armor_dict, compact_outfits=True)
+
+        builds = {
+            "parallel": lambda: profile_outfits.generate_class_outfits_df_parallel(
+                "Warlock", True, max_workers=2, chunk_size=7
+            ),
+            "armor table": lambda: ProfileOutfits(
+                ArmorTable.from_armor_list(armor_list)
+            ).generate_class_outfits_df("Warlock", True),
+            "batches": lambda: pl.concat(
+                profile_outfits.generate_class_outfit_batches(
+                    "Warlock", True, batch_size=100
+                )
+            ),
+            "compact": lambda: compact_profile_outfits.restore_instance_ids(
+                compact_profile_outfits.generate_class_outfits_df("Warlock", True)
+            ).cast(pl.Int64),
+        }
+        for name, build in builds.items():
+            with self.subTest(name):
+                self.assertTrue(build().equals(outfits_df))
+
+    # every other way of building pinnacle outfits finds the same pinnacle outfits as PinnacleOutfits on every outfit
+    def test_pinnacle_outfits_match_eager(self):
+        armor_list = self.random_armor_list()
+        # copies of a legendary and an exotic that only differ by instance_id, for collapsing equivalent armor
+        armor_list += [
+            replace(armor, instance_id=random_64_int())
+            for armor in armor_list
+            if armor.slot in ["Helmet", "Leg Armor"]
+        ]
+        armor_dict = self.armor_list_to_dict(armor_list)
+        pinnacle_outfits = self.eager_pinnacle_outfits(armor_dict)
+        profile_outfits = ProfileOutfits(armor_dict)
+        collapsed_profile_outfits = ProfileOutfits(
+            armor_dict, collapse_equivalent_armor=True
+        )
+        compact_profile_outfits = ProfileOutfits(armor_dict, compact_outfits=True)
+
+        def batches():
+            return profile_outfits.generate_class_outfit_batches(
+                "Warlock", True, batch_size=50
+            )
+
+        builds = {
+            "list": lambda: PinnacleOutfits(
+                profile_outfits.generate_class_outfits("Warlock", True)
+            ),
+            "batches": lambda: PinnacleOutfits.from_batches(batches()),
+            "two passes": lambda: PinnacleOutfits.from_two_passes(batches),
+            "lazy": lambda: PinnacleOutfits.from_lazy(pinnacle_outfits.outfits.lazy()),
+            "collapsed equivalent armor": lambda: PinnacleOutfits(
+                collapsed_profile_outfits.generate_class_outfits_df("Warlock", True),
+                collapsed_profile_outfits.equivalent_armor,
+            ),
+            "compact": lambda: PinnacleOutfits.from_batches(
+                [compact_profile_outfits.generate_class_outfits_df("Warlock", True)],
+                armor_table=compact_profile_outfits.armor_table,
+            ),
+        }
+        for name, build in builds.items():
+            with self.subTest(name):
+                self.assertSameOutfits(
+                    build().pinnacle_outfits_df, pinnacle_outfits.pinnacle_outfits_df
+                )
+
+    def test_artifice_tier_table_matches_permutations(self):
+        profile_outfits = ProfileOutfits({})
+        half_tier_table = ArtificeTierTable(5, 100)
+
+        for i in range(300):
+            stats = tuple(random.randint(10, 120) for _ in range(6))
+            for num_artifice in range(6):
+                useful_stats_permutations = set()
+                half_tier_permutations = set()
+                for bonus in profile_outfits.artifice_permutations[num_artifice]:
+                    boosted = [stat + b for stat, b in zip(stats, bonus)]
+                    useful_stats_permutations.add(
+                        tuple(profile_outfits.round_to_useful_tier(s) for s in boosted)
+                    )
+                    half_tier_permutations.add(
+                        tuple(min(s - s % 5, 100) for s in boosted)
+                    )
+
+                tiers = profile_outfits.artifice_tier_table.useful_stats_permutations(
+                    stats, num_artifice
+                )
+                self.assertEqual(len(tiers), len(useful_stats_permutations))
+                self.assertEqual(set(tiers), useful_stats_permutations)
+
+                half_tiers = half_tier_table.useful_stats_permutations(
+                    stats, num_artifice
+                )
+                self.assertEqual(len(half_tiers), len(half_tier_permutations))
+                self.assertEqual(set(half_tiers), half_tier_permutations)
+
+    def test_find_dominated_armor(self):
+        def helmet(mobility, resilience, other, is_artifice=False):
+            return Armor(
+                slot="Helmet",
+                mobility=mobility,
+                resilience=resilience,
+                recovery=other,
+                discipline=other,
+                intellect=other,
+                strength=other,
+                is_artifice=is_artifice,
+            )
+
+        lesser_helmet = helmet(10, 20, 10)
+        better_helmet = helmet(13, 30, 13)
+        artifice_helmet = helmet(10, 27, 10, is_artifice=True)
+        same_helmet = helmet(13, 30, 13)
+        different_helmet = helmet(30, 10, 2)
+        armor_dict = self.armor_list_to_dict(
+            [
+                lesser_helmet,
+                better_helmet,
+                artifice_helmet,
+                same_helmet,
+                different_helmet,
+                self.gauntlets,
+                self.chest_armor,
+                self.leg_armor,
+                self.class_item,
+                self.exotic_helmet,
+                self.exotic_helmet2,
+            ]
+        )
+        profile_outfits = ProfileOutfits(armor_dict, prune_dominated_armor=True)
+        exotic_armor, non_exotic_armor = profile_outfits.group_class_armor(
+            "Warlock", True
+        )
+
+        # better_helmet covers the +3 artifice bonus of artifice_helmet in every stat, and only one of two equal pieces is kept
+        self.assertEqual(len(non_exotic_armor["Helmet"]), 2)
+        self.assertIn(different_helmet, non_exotic_armor["Helmet"])
+        self.assertEqual(
+            exotic_armor["Helmet"], [self.exotic_helmet, self.exotic_helmet2]
+        )
+
+        pruned_armor = profile_outfits.pruned_armor["Warlock"]
+        self.assertEqual(len(pruned_armor), 3)
+        pruned = {p.armor.instance_id: p for p in pruned_armor}
+        self.assertIn(lesser_helmet.instance_id, pruned)
+        self.assertIn(artifice_helmet.instance_id, pruned)
+        self.assertIn("res", pruned[lesser_helmet.instance_id].reason)
+        self.assertIn("artifice", pruned[artifice_helmet.instance_id].reason)
+
+        # the equal helmets tie in every outfit, the pruned one is in the same pinnacle outfits as the kept one
+        equal_helmets = {better_helmet.instance_id, same_helmet.instance_id}
+        tied_helmet = next(
+            p for p in pruned_armor if p.armor.instance_id in equal_helmets
+        )
+        self.assertTrue(tied_helmet.is_tie)
+        self.assertFalse(pruned[lesser_helmet.instance_id].is_tie)
+        self.assertEqual(
+            set(profile_outfits.equivalent_armor[tied_helmet.dominated_by.instance_id]),
+            equal_helmets,
+        )
+
+        equal_helmet_outfits = pl.col("helmet").is_in(list(equal_helmets))
+        self.assertSameOutfits(
+            PinnacleOutfits(
+                profile_outfits.generate_class_outfits_df("Warlock", True),
+                profile_outfits.equivalent_armor,
+            ).pinnacle_outfits_df.filter(equal_helmet_outfits),
+            self.eager_pinnacle_outfits(armor_dict).pinnacle_outfits_df.filter(
+                equal_helmet_outfits
+            ),
+        )
+
+    def test_pruned_pinnacle_outfits_match(self):
+        # reseed so the vault, and whether anything is pruned, doesn't depend on which tests ran before
+        random.seed(1)
+        armor_list = self.random_armor_list(pieces_per_slot=6, exotics_per_slot=2)
+        armor_dict = self.armor_list_to_dict(armor_list)
+
+        pruned_profile_outfits = ProfileOutfits(armor_dict, prune_dominated_armor=True)
+        pruned_pinnacle_outfits_df = PinnacleOutfits(
+            pruned_profile_outfits.generate_class_outfits_df("Warlock", True)
+        ).pinnacle_outfits_df
+
+        # pruning only removes pinnacle outfits that use a pruned piece, they tie an outfit that is kept
+        pruned_ids = {
+            p.armor.instance_id for p in pruned_profile_outfits.pruned_armor["Warlock"]
+        }
+        self.assertGreater(len(pruned_ids), 0)
+        self.assertSameOutfits(
+            pruned_pinnacle_outfits_df,
+            self.eager_pinnacle_outfits(armor_dict).pinnacle_outfits_df.filter(
+                ~pl.any_horizontal(
+                    pl.col(slot_column).is_in(list(pruned_ids))
+                    for slot_column in SLOT_COLUMNS
+                )
+            ),
+        )
+
+    def test_equivalent_armor_pinnacle_outfits_match(self):
+        armor_list = self.random_armor_list(pieces_per_slot=4, exotics_per_slot=2)
+        # copies of a legendary and an exotic that only differ by instance_id
+        armor_list += [
+            replace(armor, instance_id=random_64_int())
+            for armor in armor_list
+            if armor.slot in ["Helmet", "Leg Armor"]
+        ]
+        armor_dict = self.armor_list_to_dict(armor_list)
+
+        profile_outfits = ProfileOutfits(armor_dict, collapse_equivalent_armor=True)
+        collapsed_outfits_df = profile_outfits.generate_class_outfits_df(
+            "Warlock", True
+        )
+        self.assertEqual(
+            len(collapsed_outfits_df),
+            len(ProfileOutfits(armor_dict).generate_class_outfits_df("Warlock", True))
+            // 4,
+        )
+        self.assertEqual(
+            sorted(len(ids) for ids in profile_outfits.equivalent_armor.values()),
+            [1] * 13 + [2] * 12,
+        )
+
+    def test_armor_table(self):
+        armor_list = self.random_armor_list()
+        armor_table = ArmorTable.from_armor_list(armor_list)
+
+        self.assertEqual(len(armor_table), len(armor_list))
+        self.assertEqual(armor_table.stats.shape, (len(armor_list), 6))
+        self.assertEqual(
+            armor_table.stat("intellect").tolist(),
+            [armor.intellect for armor in armor_list],
+        )
+        self.assertEqual(
+            armor_table.total_stats.tolist(),
+            [armor.total_stats for armor in armor_list],
+        )
+        self.assertEqual(armor_table.to_armor_list(), armor_list)
+
+        exotic_table = armor_table.select(armor_table.is_exotic)
+        self.assertEqual(
+            exotic_table.to_armor_list(),
+            [armor for armor in armor_list if armor.is_exotic],
+        )
+        self.assertEqual(
+            armor_table.rows(
+                [armor_list[3].instance_id, armor_list[0].instance_id]
+            ).tolist(),
+            [3, 0],
+        )
+
+    def test_find_eclipsed_armor(self):
+        helmet = Armor(slot="Helmet", power=2, mobility=10, resilience=10)
+        worse_helmet = Armor(slot="Helmet", power=1, mobility=10, resilience=9)
+        other_helmet = Armor(slot="Helmet", power=3, mobility=11, resilience=2)
+        exotic_helmet = Armor(slot="Helmet", rarity="Exotic", mobility=2)
+        other_exotic_helmet = Armor(slot="Helmet", rarity="Exotic", mobility=1)
+        same_exotic_helmet = Armor(
+            slot="Helmet",
+            rarity="Exotic",
+            item_hash=exotic_helmet.item_hash,
+            mobility=3,
+        )
+        class_item = Armor(slot="Class Item")
+        other_class_item = Armor(slot="Class Item")
+        titan_helmet = Armor(slot="Helmet", d2_class="Titan", mobility=20)
+
+        profile_outfits = ProfileOutfits(
+            self.armor_list_to_dict(
+                [
+                    helmet,
+                    worse_helmet,
+                    other_helmet,
+                    exotic_helmet,
+                    other_exotic_helmet,
+                    same_exotic_helmet,
+                    class_item,
+                    other_class_item,
+                    titan_helmet,
+                ]
+            )
+        )
+
+        self.assertEqual(
+            profile_outfits.find_eclipsed_armor(),
+            [(exotic_helmet, same_exotic_helmet), (worse_helmet, helmet)],
+        )
+        self.assertEqual(
+            profile_outfits.find_eclipsed_armor("tiers"),
+            profile_outfits.find_eclipsed_armor(),
+        )
+
+        # an artifice helmet with the same stats as a legendary helmet has its +3 on top, it is only eclipsed by stats
+        artifice_helmet = replace(
+            helmet, instance_id=random_64_int(), power=0, is_artifice=True
+        )
+        profile_outfits = ProfileOutfits(
+            self.armor_list_to_dict([helmet, artifice_helmet])
+        )
+        self.assertEqual(
+            profile_outfits.find_eclipsed_armor(), [(artifice_helmet, helmet)]
+        )
+        self.assertEqual(
+            profile_outfits.find_eclipsed_armor("tiers"), [(helmet, artifice_helmet)]
+        )
+        with self.assertRaises(ValueError):
+            profile_outfits.find_eclipsed_armor("totals")
+
+    def test_compact_outfits(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        outfits_df = ProfileOutfits(armor_dict).generate_class_outfits_df(
+            "Warlock", True
+        )
+
+        profile_outfits = ProfileOutfits(armor_dict, compact_outfits=True)
+        compact_outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+        self.assertEqual(compact_outfits_df.schema["mobility"], pl.UInt8)
+        self.assertEqual(compact_outfits_df.schema["helmet"], pl.UInt16)
+        self.assertLess(
+            compact_outfits_df.estimated_size() * 3, outfits_df.estimated_size()
+        )
+        compact_pinnacle_outfits = PinnacleOutfits.from_batches(
+            [compact_outfits_df], armor_table=profile_outfits.armor_table
+        )
+        self.assertEqual(
+            compact_pinnacle_outfits.weighted_outfits_df.schema[
+                "weighted_mobility_resilience_recovery"
+            ],
+            pl.UInt16,
+        )
+
+        # without the armor table the slot columns would stay ArmorTable rows
+        with self.assertRaises(ValueError):
+            PinnacleOutfits(compact_outfits_df)
+        with self.assertRaises(ValueError):
+            PinnacleOutfits.from_batches([compact_outfits_df])
+
+        # more armor than the UInt16 slot columns can number
+        armor = next(iter(armor_dict.values()))
+        with self.assertRaises(ValueError):
+            ProfileOutfits(
+                ArmorTable.from_armor_list([armor] * (COMPACT_MAX_ARMOR_ROWS + 1)),
+                compact_outfits=True,
+            )
+
+    def test_pinnacle_outfits_from_lazy(self):
+        pinnacle_outfits = self.eager_pinnacle_outfits(
+            self.armor_list_to_dict(self.random_armor_list())
+        )
+        outfits_df = pinnacle_outfits.outfits
+
+        lazy_pinnacle_outfits = PinnacleOutfits.from_lazy(outfits_df.lazy())
+        self.assertIsNone(lazy_pinnacle_outfits.weighted_outfits_df)
+
+        debug_pinnacle_outfits = PinnacleOutfits.from_lazy(
+            outfits_df, engine="in-memory", keep_intermediates=True
+        )
+        self.assertEqual(
+            len(debug_pinnacle_outfits.weighted_outfits_df), len(outfits_df)
+        )
+        self.assertEqual(
+            sorted(debug_pinnacle_outfits.weighted_outfits_max_df.rows()),
+            sorted(
+                pinnacle_outfits.weighted_outfits_max_df.select(
+                    debug_pinnacle_outfits.weighted_outfits_max_df.columns
+                ).rows()
+            ),
+        )
+
+    def test_pinnacle_outfits_from_weight_matrix(self):
+        pinnacle_outfits = self.eager_pinnacle_outfits(
+            self.armor_list_to_dict(self.random_armor_list())
+        )
+        outfits_df = pinnacle_outfits.outfits
+
+        # the 3 stat schemes at a weight of 2 are the same as the weighted columns of PinnacleOutfits
+        scheme_names, weight_matrix = weighting_schemes(stat_counts=(3,), weights=(2,))
+        self.assertEqual(weight_matrix.shape, (20, 6))
+        self.assertEqual(scheme_names[0], "weighted_mobility_resilience_recovery_x2")
+        matrix_pinnacle_outfits = PinnacleOutfits.from_weight_matrix(
+            outfits_df, weight_matrix, scheme_names
+        )
+        columns = OUTFIT_COLUMNS + ["total_stats"]
+        self.assertSameOutfits(
+            matrix_pinnacle_outfits.pinnacle_outfits_df,
+            pinnacle_outfits.pinnacle_outfits_df,
+            columns,
+        )
+        self.assertSameOutfits(
+            matrix_pinnacle_outfits.scheme_pinnacle_outfits_df(
+                "weighted_discipline_intellect_strength_x2"
+            ),
+            pinnacle_outfits.scheme_pinnacle_outfits_df(
+                "weighted_discipline_intellect_strength"
+            ),
+            columns,
+        )
+
+        all_schemes_pinnacle_outfits = PinnacleOutfits.from_weight_matrix(outfits_df)
+        self.assertEqual(len(all_schemes_pinnacle_outfits.scheme_names), 56)
+        scheme_counts = all_schemes_pinnacle_outfits.armor_pinnacle_scheme_counts()
+        self.assertTrue(
+            all(1 <= count <= 56 for count in scheme_counts["pinnacle_scheme_count"])
+        )
+        self.assertEqual(
+            set(scheme_counts["instance_id"]),
+            {
+                instance_id
+                for slot_column in SLOT_COLUMNS
+                for instance_id in all_schemes_pinnacle_outfits.pinnacle_outfits_df[
+                    slot_column
+                ]
+            },
+        )
+
+    def test_half_tier_outfits(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+        half_tier_profile_outfits = ProfileOutfits(
+            armor_dict, tier_size=ProfileOutfits.HALF_TIER_SIZE
+        )
+
+        self.assertEqual(half_tier_profile_outfits.round_to_useful_tier(57), 55)
+        self.assertEqual(half_tier_profile_outfits.round_to_useful_tier(103), 100)
+
+        outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+        half_tier_outfits_df = half_tier_profile_outfits.generate_class_outfits_df(
+            "Warlock", True
+        )
+        self.assertGreater(len(half_tier_outfits_df), len(outfits_df))
+        self.assertTrue(
+            all(
+                value % 5 == 0
+                for stat in STAT_NAMES
+                for value in half_tier_outfits_df[stat]
+            )
+        )
+        # the numpy path rounds and dedups half tiers the same as the tuple path
+        self.assertEqual(
+            sorted(half_tier_outfits_df.rows()),
+            sorted(half_tier_profile_outfits.generate_class_outfits("Warlock", True)),
+        )
+
+        # the sample covers every armor combination of this small vault, so the estimates are exact
+        estimate = profile_outfits.estimate_class_outfits("Warlock", True)
+        self.assertEqual(estimate["estimated_outfits"], len(outfits_df))
+        self.assertEqual(estimate["estimated_bytes"], len(outfits_df) * 13 * 8)
+        half_tier_estimate = profile_outfits.estimate_class_outfits(
+            "Warlock", True, tier_size=ProfileOutfits.HALF_TIER_SIZE
+        )
+        self.assertEqual(
+            half_tier_estimate["estimated_outfits"], len(half_tier_outfits_df)
+        )
+        self.assertEqual(
+            half_tier_estimate["armor_combinations"], estimate["armor_combinations"]
+        )
+
+    def test_exotic_class_items(self):
+        armor_list = self.random_armor_list()
+        solipsism = self.random_armor("Class Item", "Exotic")
+        perk_pairs = [
+            ("Spirit of Inmost Light", "Spirit of the Star-Eater"),
+            ("Spirit of the Assassin", "Spirit of the Star-Eater"),
+            ("Spirit of Inmost Light", "Spirit of Synthoceps"),
+        ]
+        # the first two roll the same stats, the last one doesn't
+        exotic_class_items = [
+            replace(
+                solipsism,
+                instance_id=random_64_int(),
+                random_exotic_perks=perks,
+                mobility=solipsism.mobility + (i == 2),
+            )
+            for i, perks in enumerate(perk_pairs)
+        ]
+        armor_dict = self.armor_list_to_dict(armor_list + exotic_class_items)
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        exotic_hashes = [armor.exotic_hash for armor in exotic_class_items]
+        self.assertEqual(len(set(exotic_hashes)), 3)
+        self.assertNotIn(solipsism.item_hash, exotic_hashes)
+        self.assertEqual(
+            exotic_class_items[0].exotic_name,
+            "Generic Armor (Spirit of Inmost Light + Spirit of the Star-Eater)",
+        )
+
+        # the two class items with the same stats are enumerated once
+        exotic_armor, non_exotic_armor = profile_outfits.group_class_armor(
+            "Warlock", True
+        )
+        exotic_class_item_matrix = profile_outfits.class_outfit_slot_matrices(
+            exotic_armor, non_exotic_armor
+        )[-1][-1]
+        self.assertEqual(len(exotic_class_item_matrix), 2)
+
+        outfits = profile_outfits.generate_class_outfits("Warlock", True)
+        outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+        self.assertEqual(sorted(outfits_df.rows()), sorted(outfits))
+        self.assertEqual(
+            sorted(
+                profile_outfits.generate_class_outfits_df_parallel(
+                    "Warlock", True, max_workers=2, chunk_size=7
+                ).rows()
+            ),
+            sorted(outfits),
+        )
+
+        per_perk_pair = [
+            len(outfits_df.filter(pl.col("exotic_hash") == exotic_hash))
+            for exotic_hash in exotic_hashes
+        ]
+        self.assertGreater(per_perk_pair[0], 0)
+        self.assertEqual(per_perk_pair[0], per_perk_pair[1])
+
+        estimate = profile_outfits.estimate_class_outfits("Warlock", True)
+        self.assertEqual(estimate["estimated_outfits"], len(outfits_df))
+
+        # every perk pair is its own exotic in the pinnacle outfits and the report
+        armor_pinnacle_stats_list = create_armor_pinnacle_stats_list(
+            "Warlock", armor_dict, PinnacleOutfits(outfits_df).pinnacle_outfits_df
+        )
+        self.assertEqual(
+            {
+                exotic
+                for armor_pinnacle_stats in armor_pinnacle_stats_list
+                if armor_pinnacle_stats.armor in exotic_class_items
+                for exotic in armor_pinnacle_stats.exotic_to_pinnacle_stats
+            },
+            {armor.exotic_name for armor in exotic_class_items},
+        )
+
+    def test_update_class_pinnacle_outfits(self):
+        armor_list = self.random_armor_list(pieces_per_slot=4)
+        dropped_armor = [
+            self.random_armor("Gauntlets", is_artifice=True),
+            self.random_armor("Leg Armor", "Exotic"),
+        ]
+        dismantled_armor = [armor_list[1], armor_list[5]]
+
+        with tempfile.TemporaryDirectory() as state_directory:
+            ProfileOutfits(
+                self.armor_list_to_dict(armor_list)
+            ).update_class_pinnacle_outfits("Warlock", True, state_directory)
+
+            new_armor_list = [
+                armor for armor in armor_list if armor not in dismantled_armor
+            ] + dropped_armor
+            profile_outfits = ProfileOutfits(self.armor_list_to_dict(new_armor_list))
+            previous_armor_df = pl.read_parquet(
+                os.path.join(state_directory, "armor.parquet")
+            )
+            added_outfits_df, removed_instance_ids, _ = (
+                profile_outfits.generate_class_outfits_update(
+                    "Warlock", True, previous_armor_df
+                )
+            )
+            self.assertEqual(
+                sorted(removed_instance_ids),
+                sorted(armor.instance_id for armor in dismantled_armor),
+            )
+
+            outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+            new_outfits_df = outfits_df.filter(
+                pl.any_horizontal(
+                    pl.col(slot_column).is_in(
+                        [armor.instance_id for armor in dropped_armor]
+                    )
+                    for slot_column in SLOT_COLUMNS
+                )
+            )
+            self.assertEqual(
+                sorted(added_outfits_df.rows()), sorted(new_outfits_df.rows())
+            )
+
+            updated_pinnacle_outfits = profile_outfits.update_class_pinnacle_outfits(
+                "Warlock", True, state_directory
+            )
+            self.assertSameOutfits(
+                updated_pinnacle_outfits.pinnacle_outfits_df,
+                PinnacleOutfits(outfits_df).pinnacle_outfits_df,
+            )
+
+            # nothing changed, nothing to generate
+            added_outfits_df, removed_instance_ids, _ = (
+                profile_outfits.generate_class_outfits_update(
+                    "Warlock",
+                    True,
+                    pl.read_parquet(os.path.join(state_directory, "armor.parquet")),
+                )
+            )
+            self.assertEqual((len(added_outfits_df), removed_instance_ids), (0, []))
+
+    def test_cached_class_pinnacle_outfits(self):
+        armor_list = self.random_armor_list()
+        armor_dict = self.armor_list_to_dict(armor_list)
+        pinnacle_outfits = self.eager_pinnacle_outfits(armor_dict)
+
+        with tempfile.TemporaryDirectory() as cache_directory:
+            outfit_cache = OutfitCache(cache_directory, max_entries=2)
+            generated_pinnacle_outfits = ProfileOutfits(
+                armor_dict
+            ).cached_class_pinnacle_outfits("Warlock", True, outfit_cache)
+            cached_pinnacle_outfits = ProfileOutfits(
+                armor_dict
+            ).cached_class_pinnacle_outfits("Warlock", True, outfit_cache)
+
+            for pinnacle in [generated_pinnacle_outfits, cached_pinnacle_outfits]:
+                self.assertTrue(
+                    pinnacle.pinnacle_outfits_df.equals(
+                        pinnacle_outfits.pinnacle_outfits_df
+                    )
+                )
+                self.assertTrue(pinnacle.outfits.equals(pinnacle_outfits.outfits))
+            warlock_directory = os.path.join(cache_directory, "warlock")
+            self.assertEqual(len(os.listdir(warlock_directory)), 1)
+
+            # changing the armor or the tier size replaces the warlock entry
+            for profile_outfits in [
+                ProfileOutfits(self.armor_list_to_dict(armor_list[1:])),
+                ProfileOutfits(armor_dict, tier_size=ProfileOutfits.HALF_TIER_SIZE),
+            ]:
+                entries = set(os.listdir(warlock_directory))
+                profile_outfits.cached_class_pinnacle_outfits(
+                    "Warlock", True, outfit_cache
+                )
+                self.assertEqual(len(os.listdir(warlock_directory)), 1)
+                self.assertNotEqual(set(os.listdir(warlock_directory)), entries)
+
+            # past `max_entries` the least recently used entry is evicted
+            hunter_armor_dict = self.armor_list_to_dict(
+                [replace(armor, d2_class="Hunter") for armor in armor_list]
+            )
+            for d2_class, class_armor_dict in [
+                ("Hunter", hunter_armor_dict),
+                ("Warlock", armor_dict),
+                ("Titan", armor_dict),
+            ]:
+                ProfileOutfits(class_armor_dict).cached_class_pinnacle_outfits(
+                    d2_class, True, outfit_cache
+                )
+            self.assertEqual(
+                sorted(
+                    name
+                    for name in os.listdir(cache_directory)
+                    if os.listdir(os.path.join(cache_directory, name))
+                ),
+                ["titan", "warlock"],
+            )
+
+    def test_pinnacle_stats_uniqueness(self):
+        helmet, other_helmet, exotic_helmet = [
+            Armor(slot="Helmet"),
+            Armor(slot="Helmet"),
+            Armor(slot="Helmet", rarity="Exotic"),
+        ]
+        gauntlets, chest_armor, leg_armor, class_item = [
+            Armor(slot=slot)
+            for slot in ["Gauntlets", "Chest Armor", "Leg Armor", "Class Item"]
+        ]
+        armor_dict = self.armor_list_to_dict(
+            [
+                helmet,
+                other_helmet,
+                exotic_helmet,
+                gauntlets,
+                chest_armor,
+                leg_armor,
+                class_item,
+            ]
+        )
+        no_exotic = ProfileOutfits.NO_EXOTIC_HASH
+        # helmet and other_helmet are both pinnacle for mob with no exotic, only helmet is pinnacle for res
+        pinnacle_outfits_df = pl.DataFrame(
+            [
+                (helmet.instance_id, no_exotic, 1, 1, 1, 1),
+                (other_helmet.instance_id, no_exotic, 1, 1, 0, 1),
+                (exotic_helmet.instance_id, exotic_helmet.item_hash, 1, 1, 1, 1),
+            ],
+            schema=[
+                "helmet",
+                "exotic_hash",
+                "weighted_mobility",
+                "weighted_mobility_max",
+                "weighted_resilience",
+                "weighted_resilience_max",
+            ],
+            orient="row",
+        ).with_columns(
+            gauntlets=pl.lit(gauntlets.instance_id),
+            chest_armor=pl.lit(chest_armor.instance_id),
+            leg_armor=pl.lit(leg_armor.instance_id),
+            class_item=pl.lit(class_item.instance_id),
+        )
+
+        pinnacle_stats = {
+            armor_pinnacle_stats.armor.instance_id: {
+                exotic: sorted(
+                    (stat.stat_combination, stat.is_unique)
+                    for stat in stat_combinations
+                )
+                for exotic, stat_combinations in armor_pinnacle_stats.exotic_to_pinnacle_stats.items()
+            }
+            for armor_pinnacle_stats in create_armor_pinnacle_stats_list(
+                "Warlock", armor_dict, pinnacle_outfits_df
+            )
+        }
+        self.assertEqual(
+            pinnacle_stats[helmet.instance_id],
+            {"No Exotic": [("mob", False), ("res", True)]},
+        )
+        self.assertEqual(
+            pinnacle_stats[other_helmet.instance_id], {"No Exotic": [("mob", False)]}
+        )
+        self.assertEqual(
+            pinnacle_stats[exotic_helmet.instance_id],
+            {"Generic Armor": [("mob", True), ("res", True)]},
+        )
+        # the gauntlets are in every pinnacle outfit, with no other gauntlets to share them
+        self.assertEqual(
+            pinnacle_stats[gauntlets.instance_id],
+            {
+                "No Exotic": [("mob", True), ("res", True)],
+                "Generic Armor": [("mob", True), ("res", True)],
+            },
+        )
+
+        # the renderers use the report model they are passed instead of building their own
+        report = pinnacle_report("Warlock", armor_dict, pinnacle_outfits_df)
+        for armor in armor_dict.values():
+            armor.ignored = False
+
+        def render(renderer, **kwargs):
+            with redirect_stdout(io.StringIO()) as output:
+                renderer("Warlock", armor_dict, pinnacle_outfits_df, **kwargs)
+            return output.getvalue()
+
+        for renderer in [
+            legendary_armor_to_pinnacle_outfits_report,
+            exotic_armor_to_pinnacle_outfits_report,
+        ]:
+            self.assertEqual(render(renderer, model=report), render(renderer))
+            self.assertEqual(
+                render(renderer, model=PinnacleReport("Warlock", [])),
+                "Total pieces: 0\n",
+            )
+        self.assertEqual(
+            [
+                armor_pinnacle_stats.unique_pinnacle_outfits
+                for armor_pinnacle_stats in report.by_pinnacle_outfits
+            ],
+            [4, 4, 4, 4, 2, 1, 0],
+        )
+
+    def test_batch_run_classes(self):
+        armor_list = self.random_armor_list()
+        armor_dict = self.armor_list_to_dict(
+            armor_list
+            + [
+                replace(armor, d2_class=d2_class, instance_id=random_64_int())
+                for d2_class in ["Hunter", "Titan"]
+                for armor in armor_list
+            ]
+        )
+        for armor in armor_dict.values():
+            armor.ignored = False
+
+        with tempfile.TemporaryDirectory() as report_directory:
+            ignored_armor_path = os.path.join(report_directory, "ignored-armor.json")
+            with open(ignored_armor_path, "w") as file:
+                json.dump([{"instance_id": armor_list[0].instance_id}], file)
+            self.assertEqual(flag_ignored_armor(armor_dict, ignored_armor_path), 1)
+
+            polars_max_threads = os.environ.get("POLARS_MAX_THREADS")
+            stage_times = run_classes(
+                armor_dict,
+                ["Titan", "Warlock"],
+                report_directory=report_directory,
+            )
+            # the workers' thread pools are sized in the workers
+            self.assertEqual(os.environ.get("POLARS_MAX_THREADS"), polars_max_threads)
+            self.assertEqual(list(stage_times), ["Titan", "Warlock"])
+            self.assertEqual(
+                list(stage_times["Titan"]),
+                ["generate outfits", "pinnacle outfits", "write report"],
+            )
+
+            for d2_class in ["Titan", "Warlock"]:
+                with open(
+                    os.path.join(
+                        report_directory, f"armor-report-{d2_class.lower()}.json"
+                    )
+                ) as file:
+                    batch_report = json.load(file)
+                with tempfile.TemporaryDirectory() as expected_directory:
+                    report.armor_to_pinnacle_outfits_json(
+                        d2_class,
+                        armor_dict,
+                        PinnacleOutfits(
+                            ProfileOutfits(armor_dict).generate_class_outfits_df(
+                                d2_class, True
+                            )
+                        ).pinnacle_outfits_df,
+                        expected_directory,
+                    )
+                    with open(
+                        os.path.join(
+                            expected_directory, f"armor-report-{d2_class.lower()}.json"
+                        )
+                    ) as file:
+                        self.assertEqual(batch_report, json.load(file))
+            self.assertFalse(
+                os.path.exists(
+                    os.path.join(report_directory, "armor-report-hunter.json")
+                )
+            )
+
+    def test_synthetic_vault(self):
+        vault = SyntheticVault(pieces_per_slot=10, seed=7)
+        armor_dict = vault.armor_dict()
+        self.assertEqual(
+            armor_dict, SyntheticVault(pieces_per_slot=10, seed=7).armor_dict()
+        )
+        self.assertNotEqual(
+            armor_dict, SyntheticVault(pieces_per_slot=10, seed=8).armor_dict()
+        )
+
+        # the profile reads back as the same armor, in the same order
+        profile_armor_dict = ProfileArmor(*vault.profile()).get_armor_dict()
+        self.assertEqual(list(profile_armor_dict.items()), list(armor_dict.items()))
+
+        warlock_armor = [
+            armor for armor in armor_dict.values() if armor.d2_class == "Warlock"
+        ]
+        self.assertEqual(
+            sum(armor.rarity == "Legendary" for armor in warlock_armor), 5 * 10
+        )
+        self.assertEqual(sum(armor.is_exotic for armor in warlock_armor), 4 * 2 + 1)
+        for armor in warlock_armor:
+            if armor.slot == "Class Item" and not armor.is_exotic:
+                self.assertEqual(armor.total_stats, 0)
+            else:
+                self.assertTrue(48 <= armor.total_stats <= 68)
+        exotic_class_item = next(
+            armor
+            for armor in warlock_armor
+            if armor.slot == "Class Item" and armor.is_exotic
+        )
+        self.assertEqual(len(exotic_class_item.random_exotic_perks), 2)
+
+    def test_benchmark_regressions(self):
+        baseline_results = [
+            BenchmarkResult(10, "PinnacleOutfits", seconds=1.0),
+            BenchmarkResult(10, "pinnacle_report", seconds=0.001),
+            BenchmarkResult(10, "generate_class_outfits", seconds=1.0),
+            BenchmarkResult(50, "PinnacleOutfits", skipped="too many outfits"),
+        ]
+        results = [
+            BenchmarkResult(10, "PinnacleOutfits", seconds=1.5),
+            # twice as slow, but within the timer noise
+            BenchmarkResult(10, "pinnacle_report", seconds=0.002),
+            BenchmarkResult(10, "generate_class_outfits", seconds=1.1),
+            BenchmarkResult(50, "PinnacleOutfits", seconds=10.0),
+        ]
+        regressions = find_regressions(results, baseline_results)
+        self.assertEqual([regression.result for regression in regressions], results[:1])
+        self.assertAlmostEqual(regressions[0].ratio, 1.5)
+
+        with tempfile.TemporaryDirectory() as results_directory:
+            path = os.path.join(results_directory, "results.json")
+            write_results(path, results, commit="abc1234")
+            run, read_back = read_results(path)
+            self.assertEqual(run["commit"], "abc1234")
+            self.assertEqual(read_back, results)
+
+    def test_benchmark_memory(self):
+        vault = SyntheticVault(pieces_per_slot=4, seed=3)
+        [result] = measure_memory(vault, strategies=[ProfileOutfits.TWO_PASSES])
+        self.assertEqual(result.stage, "memory two_passes")
+        self.assertGreater(result.max_rss_bytes, 0)
+        # the estimate leaves room for polars' working memory, a vault this small needs far less
+        self.assertGreater(result.estimated_bytes, result.max_rss_bytes)
+
+        [skipped] = measure_memory(vault, strategies=["list"], max_list_outfits=0)
+        self.assertIsNotNone(skipped.skipped)
+
+    def test_instrumentation(self):
+        armor_dict = SyntheticVault(pieces_per_slot=4, seed=3).armor_dict()
+        for armor in armor_dict.values():
+            armor.ignored = False
+
+        with tempfile.TemporaryDirectory() as metrics_directory:
+            jsonl_path = os.path.join(metrics_directory, "metrics.jsonl")
+            instrumentation = Instrumentation(jsonl_path)
+            profile_outfits = ProfileOutfits(
+                armor_dict, instrumentation=instrumentation
+            )
+            outfits = profile_outfits.generate_class_outfits("Warlock", True)
+            outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+            pinnacle_outfits = PinnacleOutfits(
+                outfits_df, instrumentation=instrumentation
+            )
+            with redirect_stdout(io.StringIO()):
+                report.legendary_armor_to_pinnacle_outfits_report(
+                    "Warlock",
+                    armor_dict,
+                    pinnacle_outfits.pinnacle_outfits_df,
+                    instrumentation,
+                )
+
+            self.assertEqual(
+                [(stage.name, stage.parent) for stage in instrumentation.stages],
+                [
+                    ("group_class_armor", "generate_class_outfits"),
+                    ("generate_class_outfits", None),
+                    ("group_class_armor", "generate_class_outfits_df"),
+                    ("generate_class_outfits_df", None),
+                    ("PinnacleOutfits", None),
+                    ("pinnacle_report", "legendary_armor_to_pinnacle_outfits_report"),
+                    ("legendary_armor_to_pinnacle_outfits_report", None),
+                ],
+            )
+            with open(jsonl_path) as file:
+                self.assertEqual(
+                    [json.loads(line) for line in file],
+                    json.loads(json.dumps(instrumentation.to_dicts())),
+                )
+
+        for stage in instrumentation.stages:
+            self.assertGreaterEqual(stage.seconds, 0)
+            self.assertGreaterEqual(stage.peak_traced_bytes, 0)
+        (group_stage, *_) = instrumentation.stages_named("group_class_armor")
+        self.assertEqual(
+            group_stage.counters["pieces_per_slot"]["Helmet"],
+            {"legendary": 4, "exotic": 1},
+        )
+        self.assertEqual(group_stage.labels, {"d2_class": "Warlock"})
+
+        # every armor combination has an artifice mod permutation for each way to put its artifice mods on the stats
+        exotic_armor, non_exotic_armor = ProfileOutfits(armor_dict).group_class_armor(
+            "Warlock", True
+        )
+        armor_combinations = [
+            armor_combination
+            for slot_lists in profile_outfits.class_outfit_slot_lists(
+                exotic_armor, non_exotic_armor
+            )
+            for armor_combination in product(*slot_lists)
+        ]
+        artifice_permutations = sum(
+            len(
+                profile_outfits.generate_artifice_permutations(
+                    sum(armor.is_artifice for armor in armor_combination)
+                )
+            )
+            for armor_combination in armor_combinations
+        )
+        (list_stage,) = instrumentation.stages_named("generate_class_outfits")
+        (df_stage,) = instrumentation.stages_named("generate_class_outfits_df")
+        for stage, outfit_count in [
+            (list_stage, len(outfits)),
+            (df_stage, len(outfits_df)),
+        ]:
+            self.assertEqual(
+                stage.counters["armor_combinations"], len(armor_combinations)
+            )
+            self.assertEqual(
+                stage.counters["artifice_permutations"], artifice_permutations
+            )
+            self.assertEqual(stage.counters["outfits"], outfit_count)
+            self.assertEqual(
+                stage.counters["artifice_dedup_ratio"],
+                outfit_count / artifice_permutations,
+            )
+        self.assertEqual(
+            df_stage.counters["outfits_per_exotic"],
+            {
+                exotic_hash: count
+                for exotic_hash, count in outfits_df["exotic_hash"]
+                .value_counts()
+                .iter_rows()
+            },
+        )
+
+        (pinnacle_stage,) = instrumentation.stages_named("PinnacleOutfits")
+        self.assertEqual(pinnacle_stage.counters["outfits"], len(outfits_df))
+        self.assertEqual(
+            pinnacle_stage.counters["pinnacle_outfits"],
+            len(pinnacle_outfits.pinnacle_outfits_df),
+        )
+        self.assertEqual(
+            sum(pinnacle_stage.counters["pinnacle_outfits_per_exotic"].values()),
+            len(pinnacle_outfits.pinnacle_outfits_df),
+        )
+
+    def test_generate_class_outfit_batches(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+        batches = list(
+            profile_outfits.generate_class_outfit_batches(
+                "Warlock", True, batch_size=100
+            )
+        )
+
+        self.assertEqual(len(batches), (len(outfits_df) + 99) // 100)
+        for batch in batches[:-1]:
+            self.assertEqual(len(batch), 100)
+            self.assertEqual(batch.schema, outfits_df.schema)
+
+    def test_pinnacle_outfits_from_batches(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        pinnacle_outfits = PinnacleOutfits(
+            profile_outfits.generate_class_outfits_df("Warlock", True)
+        )
+        streamed_pinnacle_outfits = PinnacleOutfits.from_batches(
+            profile_outfits.generate_class_outfit_batches(
+                "Warlock", True, batch_size=50
+            )
+        )
+
+        self.assertEqual(
+            streamed_pinnacle_outfits.weighted_outfits_max_df.sort(
+                "exotic_hash"
+            ).rows(),
+            pinnacle_outfits.weighted_outfits_max_df.sort("exotic_hash").rows(),
+        )
+        self.assertLess(
+            len(streamed_pinnacle_outfits.weighted_outfits_df),
+            len(pinnacle_outfits.weighted_outfits_df),
+        )
+
+        empty_pinnacle_outfits = PinnacleOutfits.from_batches(iter([]))
+        self.assertEqual(len(empty_pinnacle_outfits.pinnacle_outfits_df), 0)
+
+    def test_pinnacle_outfits_from_two_passes(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+
+        pinnacle_outfits = PinnacleOutfits(
+            profile_outfits.generate_class_outfits_df("Warlock", True)
+        )
+        two_pass_pinnacle_outfits = PinnacleOutfits.from_two_passes(
+            lambda: profile_outfits.generate_class_outfit_batches(
+                "Warlock", True, batch_size=50
+            )
+        )
+
+        # only the candidates for the pinnacle outfits are weighed again
+        self.assertEqual(
+            len(two_pass_pinnacle_outfits.weighted_outfits_df),
+            len(pinnacle_outfits.pinnacle_outfits_df),
+        )
+
+        empty_pinnacle_outfits = PinnacleOutfits.from_two_passes(lambda: iter([]))
+        self.assertEqual(len(empty_pinnacle_outfits.pinnacle_outfits_df), 0)
+
+    def test_class_pinnacle_outfits(self):
+        armor_dict = self.armor_list_to_dict(self.random_armor_list())
+        profile_outfits = ProfileOutfits(armor_dict)
+        outfits_df = profile_outfits.generate_class_outfits_df("Warlock", True)
+        pinnacle_outfits = PinnacleOutfits(outfits_df)
+
+        # the slot counts and artifice combinations are exact and bound the outfits
+        estimate = profile_outfits.estimate_class_outfits("Warlock", True)
+        self.assertEqual(
+            estimate["pieces_per_slot"]["Helmet"],
+            {
+                "legendary": len(
+                    [
+                        armor
+                        for armor in armor_dict.values()
+                        if armor.d2_class == "Warlock"
+                        and armor.slot == "Helmet"
+                        and not armor.is_exotic
+                    ]
+                ),
+                "exotic": len(
+                    [
+                        armor
+                        for armor in armor_dict.values()
+                        if armor.d2_class == "Warlock"
+                        and armor.slot == "Helmet"
+                        and armor.is_exotic
+                    ]
+                ),
+            },
+        )
+        self.assertEqual(
+            sum(estimate["armor_combinations_per_artifice"]),
+            estimate["armor_combinations"],
+        )
+        self.assertGreaterEqual(estimate["max_outfits"], len(outfits_df))
+        # the sample is every armor combination of this small vault, so its pinnacle outfits are all of them
+        self.assertTrue(estimate["pinnacle_outfits_exact"])
+        self.assertEqual(
+            estimate["pinnacle_outfits"], len(pinnacle_outfits.pinnacle_outfits_df)
+        )
+
+        # no budget holds every outfit, tighter budgets stream them and all of them find the same pinnacle outfits
+        plan = profile_outfits.plan_class_outfits("Warlock", True, batch_size=50)
+        self.assertEqual(plan.strategy, ProfileOutfits.IN_MEMORY)
+        self.assertFalse(plan.is_lower_bound)
+        self.assertEqual(plan.estimate["estimated_outfits"], len(outfits_df))
+        self.assertGreater(
+            plan.estimated_bytes[ProfileOutfits.IN_MEMORY],
+            plan.estimated_bytes[ProfileOutfits.BATCHES],
+        )
+        self.assertGreater(
+            plan.estimated_bytes[ProfileOutfits.BATCHES],
+            plan.estimated_bytes[ProfileOutfits.TWO_PASSES],
+        )
+        for strategy in ProfileOutfits.STRATEGIES:
+            with redirect_stdout(io.StringIO()):
+                strategy_pinnacle_outfits = profile_outfits.class_pinnacle_outfits(
+                    "Warlock", True, plan.estimated_bytes[strategy], batch_size=50
+                )
+            self.assertEqual(profile_outfits.outfit_plans["Warlock"].strategy, strategy)
+            self.assertSameOutfits(
+                strategy_pinnacle_outfits.pinnacle_outfits_df,
+                pinnacle_outfits.pinnacle_outfits_df,
+            )
+
+        # a budget nothing fits in fails before enumerating anything
+        too_small = plan.estimated_bytes[ProfileOutfits.TWO_PASSES] - 1
+        with self.assertRaisesRegex(ValueError, "over the memory budget"):
+            profile_outfits.class_pinnacle_outfits(
+                "Warlock", True, too_small, batch_size=50
+            )
+
+        budget_profile_outfits = ProfileOutfits(
+            armor_dict, memory_budget=plan.estimated_bytes[ProfileOutfits.BATCHES]
+        )
+        with self.assertRaisesRegex(ValueError, "class_pinnacle_outfits streams"):
+            budget_profile_outfits.generate_class_outfits_df("Warlock", True)
+        with self.assertRaisesRegex(ValueError, "class_pinnacle_outfits streams"):
+            budget_profile_outfits.generate_class_outfits("Warlock", True)
+        self.assertEqual(
+            budget_profile_outfits.plan_class_outfits(
+                "Warlock", True, batch_size=50
+            ).strategy,
+            ProfileOutfits.BATCHES,
+        )
+
+        # a cache miss is planned for the budget too rather than held in memory, and the streamed tables are cached
+        with tempfile.TemporaryDirectory() as cache_directory:
+            for _ in range(2):
+                with redirect_stdout(io.StringIO()):
+                    cached_pinnacle_outfits = (
+                        budget_profile_outfits.cached_class_pinnacle_outfits(
+                            "Warlock", True, OutfitCache(cache_directory), batch_size=50
+                        )
+                    )
+                self.assertSameOutfits(
+                    cached_pinnacle_outfits.pinnacle_outfits_df,
+                    pinnacle_outfits.pinnacle_outfits_df,
+                )
+        self.assertEqual(
+            budget_profile_outfits.outfit_plans["Warlock"].strategy,
+            ProfileOutfits.BATCHES,
+        )
+
+    def test_top_outfits(self):
+        armor_list = self.random_armor_list(pieces_per_slot=5, exotics_per_slot=2)
+        exotic = next(armor for armor in armor_list if armor.is_exotic)
+        exotic.item_name = "Starfire Protocol"
+        profile_outfits = ProfileOutfits(self.armor_list_to_dict(armor_list))
+
+        weighted_outfits_df = PinnacleOutfits(
+            profile_outfits.generate_class_outfits_df("Warlock", True)
+        ).weighted_outfits_df
+
+        column = "weighted_resilience_discipline_strength"
+        for exotic_name, exotic_hash in [
+            ("Starfire Protocol", exotic.item_hash),
+            (None, ProfileOutfits.NO_EXOTIC_HASH),
+        ]:
+            # the best score for each outfit across its artifice tiers, from the full enumeration
+            expected_scores = (
+                weighted_outfits_df.filter(pl.col("exotic_hash") == exotic_hash)
+                .group_by(["helmet", "gauntlets", "chest_armor", "leg_armor"])
+                .agg(pl.col(column).max())
+                .sort(column, descending=True)[column]
+                .to_list()
+            )
+
+            top_outfits_df = profile_outfits.top_outfits(
+                "Warlock", exotic_name, ["resilience", "discipline", "strength"], k=5
+            )
+            self.assertEqual(top_outfits_df[column].to_list(), expected_scores[:5])
+            self.assertTrue((top_outfits_df["exotic_hash"] == exotic_hash).all())
+
+        with self.assertRaises(ValueError):
+            profile_outfits.top_outfits("Warlock", "Not An Exotic", ["mobility"])
+        # the other exotics all share a name, so it can't pick one of them
+        with self.assertRaisesRegex(ValueError, "more than one"):
+            profile_outfits.top_outfits("Warlock", "Generic Armor", ["mobility"])
+
+        # an exotic class item's bare name only picks it when it has a single perk pair
+        solipsism = self.random_armor("Class Item", "Exotic")
+        solipsism.item_name = "Solipsism"
+        exotic_class_items = [
+            replace(solipsism, instance_id=random_64_int(), random_exotic_perks=perks)
+            for perks in [
+                ("Spirit of Inmost Light", "Spirit of the Star-Eater"),
+                ("Spirit of the Assassin", "Spirit of the Star-Eater"),
+            ]
+        ]
+        for class_items, exotic_name in [
+            (exotic_class_items[:1], "Solipsism"),
+            (exotic_class_items, exotic_class_items[1].exotic_name),
+        ]:
+            profile_outfits = ProfileOutfits(
+                self.armor_list_to_dict(armor_list + class_items)
+            )
+            top_outfits_df = profile_outfits.top_outfits(
+                "Warlock", exotic_name, ["mobility"], k=5
+            )
+            self.assertEqual(len(top_outfits_df), 5)
+            self.assertTrue(
+                (top_outfits_df["exotic_hash"] == class_items[-1].exotic_hash).all()
+            )
+        with self.assertRaisesRegex(ValueError, "Solipsism \\(Spirit of Inmost Light"):
+            profile_outfits.top_outfits("Warlock", "Solipsism", ["mobility"])
 
 
 if __name__ == "__main__":